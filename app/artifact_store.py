@@ -0,0 +1,117 @@
+# app/artifact_store.py
+"""
+Хранилище файлов пациентов в storage/.
+
+- Оригиналы сохраняются как есть (байты загрузки, без перекодирования
+  JPEG в PNG) под именем из хэша содержимого: повторная загрузка того же
+  файла не создаёт копию.
+- Тепловые карты пишет artifacts.writer — тоже по хэшу, в HEATMAP_FORMAT
+  (сырая CAM .cam по умолчанию, см. app/artifacts.py).
+- sweep() удаляет файлы, на которые не ссылается ни patients, ни history.
+  Пути в базе сравниваются по имени файла; записи, сделанные панелью под
+  Windows (storage\\1a88a16b_orig.png), тоже учитываются.
+
+    python -m app.artifact_store stats
+    python -m app.artifact_store sweep [--dry-run] [--grace 3600]
+"""
+import argparse
+import ntpath
+import os
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from .artifacts import content_name, image_suffix, write_atomic
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+STORAGE_DIR = os.path.join(BASE_DIR, "storage")
+# свежие файлы не трогаем: их путь мог ещё не попасть в базу
+SWEEP_GRACE_S = 3600
+
+
+def save_upload(data: bytes, filename: Optional[str] = None, directory: str = STORAGE_DIR) -> str:
+    """Сохраняет исходные байты загрузки; тот же файл — тот же путь."""
+    suffix = image_suffix(data, default="")
+    if not suffix and filename:
+        suffix = os.path.splitext(filename)[1].lower()
+    path = os.path.join(directory, content_name(data, suffix or ".bin"))
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        write_atomic(path, data)
+    return path
+
+
+def stored_name(path: str) -> str:
+    """Имя файла из пути в базе — с любым разделителем, «/» или «\\»."""
+    # ntpath понимает оба разделителя; os.path на Linux — только «/»
+    return ntpath.basename(path)
+
+
+def referenced_names() -> Set[str]:
+    """Имена файлов, на которые ссылаются patients и history."""
+    from .db import connection
+
+    names = set()
+    with connection() as conn:
+        for table in ("patients", "history"):
+            for image_path, heatmap_path in conn.execute(
+                    f"SELECT image_path, heatmap_path FROM {table}"):
+                names.update(stored_name(p) for p in (image_path, heatmap_path) if p)
+    return names
+
+
+def stats(directory: str = STORAGE_DIR) -> Dict[str, int]:
+    files = [e for e in os.scandir(directory) if e.is_file()] if os.path.isdir(directory) else []
+    referenced = referenced_names()
+    orphans = [e for e in files if e.name not in referenced]
+    return {
+        "files": len(files),
+        "bytes": sum(e.stat().st_size for e in files),
+        "orphans": len(orphans),
+        "orphan_bytes": sum(e.stat().st_size for e in orphans),
+    }
+
+
+def sweep(directory: str = STORAGE_DIR, dry_run: bool = False,
+          grace: float = SWEEP_GRACE_S) -> Tuple[int, int]:
+    """
+    Удаляет файлы storage/ без ссылок из базы (подкаталоги, например cache/,
+    не трогает). Возвращает (число файлов, освобождено байт).
+    """
+    if not os.path.isdir(directory):
+        return 0, 0
+    referenced = referenced_names()
+    cutoff = time.time() - grace
+    removed = freed = 0
+    for entry in os.scandir(directory):
+        if not entry.is_file() or entry.name in referenced:
+            continue
+        st = entry.stat()
+        if st.st_mtime > cutoff:
+            continue
+        if not dry_run:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+        removed += 1
+        freed += st.st_size
+    return removed, freed
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Хранилище файлов пациентов")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("stats")
+    sp = sub.add_parser("sweep")
+    sp.add_argument("--dry-run", action="store_true")
+    sp.add_argument("--grace", type=float, default=SWEEP_GRACE_S, help="не трогать файлы моложе, с")
+    a = ap.parse_args()
+
+    if a.cmd == "stats":
+        s = stats()
+        print(f"файлов: {s['files']} ({s['bytes'] / 1e6:.1f} МБ), "
+              f"без ссылок: {s['orphans']} ({s['orphan_bytes'] / 1e6:.1f} МБ)")
+    else:
+        n, freed = sweep(dry_run=a.dry_run, grace=a.grace)
+        verb = "будет удалено" if a.dry_run else "удалено"
+        print(f"{verb}: {n} файлов, {freed / 1e6:.1f} МБ")
@@ -0,0 +1,149 @@
+# app/artifacts.py
+"""
+Запись артефактов анализа (тепловые карты) на диск — один раз и под
+уникальным именем.
+
+Раньше карта писалась в общий файл storage/{modality}_gradcam.png, а панель
+копировала её в {uid}_heatmap.png: две записи на снимок, и две сессии с
+одной модальностью перетирали карты друг друга. Теперь predictor отдаёт
+закодированные байты, а ArtifactWriter пишет их в фоне под именем из хэша
+содержимого (одинаковые карты дедуплицируются). Путь известен сразу, файл
+появляется атомарно (tmp + os.replace) через несколько миллисекунд.
+
+Формат карт — HEATMAP_FORMAT:
+    cam  — (по умолчанию) сама карта CAM низкого разрешения (7×7 … 10×10)
+           в float16, ~100–200 байт; наложение рисуется при открытии карточки
+           (app/heatmap_render.py) с любой прозрачностью, палитрой и размером
+    webp — готовое наложение, в разы меньше PNG
+    png  — готовое наложение, как раньше
+
+Модуль без torch — им пользуется и тонкий клиент.
+"""
+import hashlib
+import os
+import struct
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+WORKERS = int(os.environ.get("ARTIFACT_WRITERS", "1"))
+HEATMAP_FORMAT = os.environ.get("HEATMAP_FORMAT", "cam")
+HEATMAP_QUALITY = int(os.environ.get("HEATMAP_QUALITY", "85"))
+HEATMAP_SUFFIX = "." + HEATMAP_FORMAT
+
+# упакованная карта: сигнатура, h, w (uint16 LE), затем h*w float16
+CAM_MAGIC = b"CAM1"
+
+
+def pack_cam(cam) -> bytes:
+    """CAM (h, w) 0..1 -> компактные байты (float16)."""
+    import numpy as np
+
+    cam = np.asarray(cam, dtype=np.float16)
+    h, w = cam.shape
+    return CAM_MAGIC + struct.pack("<HH", h, w) + cam.astype("<f2").tobytes()
+
+
+def unpack_cam(data: bytes):
+    """Байты pack_cam -> np.ndarray float32 (h, w)."""
+    import numpy as np
+
+    if data[:4] != CAM_MAGIC:
+        raise ValueError("не упакованная карта CAM")
+    h, w = struct.unpack("<HH", data[4:8])
+    return np.frombuffer(data, dtype="<f2", count=h * w, offset=8).reshape(h, w).astype(np.float32)
+
+
+def is_cam_file(path: str) -> bool:
+    return path.endswith(".cam")
+
+
+def encode_heatmap(bgr, fmt: str = HEATMAP_FORMAT) -> bytes:
+    """BGR-массив (как из overlay_heatmap_on_array) -> байты в формате fmt."""
+    import cv2
+
+    params = [cv2.IMWRITE_WEBP_QUALITY, HEATMAP_QUALITY] if fmt == "webp" else []
+    ok, buf = cv2.imencode("." + fmt, bgr, params)
+    if not ok:
+        raise RuntimeError(f"не удалось закодировать {fmt}")
+    return buf.tobytes()
+
+
+def image_suffix(data: bytes, default: str = ".bin") -> str:
+    """Расширение по сигнатуре файла."""
+    if data[:4] == CAM_MAGIC:
+        return ".cam"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return ".png"
+    if data[:3] == b"\xff\xd8\xff":
+        return ".jpg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    return default
+
+
+def content_name(data: bytes, suffix: Optional[str] = None, prefix: str = "") -> str:
+    suffix = suffix or image_suffix(data)
+    return f"{prefix}{hashlib.blake2b(data, digest_size=12).hexdigest()}{suffix}"
+
+
+def write_atomic(path: str, data: bytes) -> str:
+    root, ext = os.path.splitext(path)
+    tmp = f"{root}.{threading.get_ident()}.tmp{ext}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return path
+
+
+class ArtifactWriter:
+    def __init__(self, workers: int = WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="artifact")
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def write(self, data: bytes, directory: str = ".", path: Optional[str] = None,
+              prefix: str = "") -> str:
+        """
+        Ставит запись в очередь и сразу возвращает путь.
+        path=None -> {directory}/{prefix}{хэш}.{формат}; такой файл уже есть — не пишем.
+        """
+        if path is None:
+            path = os.path.join(directory, content_name(data, prefix=prefix))
+            if os.path.exists(path):
+                return path
+        with self._lock:
+            if path in self._pending:
+                return path
+            future = self._executor.submit(self._write, path, data)
+            self._pending[path] = future
+        return path
+
+    def _write(self, path: str, data: bytes):
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            write_atomic(path, data)
+        except Exception as e:
+            print(f"[ARTIFACT] не удалось записать {path}: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(path, None)
+
+    def is_pending(self, path: str) -> bool:
+        with self._lock:
+            return path in self._pending
+
+    def wait(self, path: str, timeout: Optional[float] = None) -> bool:
+        """Дождаться записи path (True — файл на диске)."""
+        with self._lock:
+            future = self._pending.get(path)
+        if future is not None:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                return False
+        return os.path.exists(path)
+
+
+writer = ArtifactWriter()
@@ -0,0 +1,138 @@
+# app/cam_engine.py
+"""
+Постоянный движок CAM для одной модели.
+
+torchcam-экстракторы при создании вешают новые хуки на модель и не снимают их,
+поэтому при создании экстрактора на каждый запрос хуки копятся и каждый
+следующий forward становится дороже. Здесь на целевой слой вешается ровно
+один forward-хук на всё время жизни модели:
+
+- активации пишутся в thread-local, поэтому параллельные запросы
+  из разных потоков не мешают друг другу;
+- градиенты берутся через torch.autograd.grad по сохранённой активации —
+  backward-хуки не нужны, а один forward обслуживает любой целевой класс
+  (для каждого класса досчитывается только «голова» сети);
+- close() снимает хук.
+
+Методы: "gradcam" — один проход, "smooth" — Smooth Grad-CAM++ (как в torchcam:
+num_samples зашумлённых проходов, std шума по нормированному входу).
+"""
+import threading
+from typing import Optional, Sequence, Union
+
+import torch
+import torch.nn as nn
+
+ClassIdx = Union[int, Sequence[int]]
+
+
+class CamPass:
+    """Результат forward с захваченной активацией целевого слоя."""
+
+    __slots__ = ("x", "out", "activation")
+
+    def __init__(self, x: torch.Tensor, out: torch.Tensor, activation: torch.Tensor):
+        self.x = x
+        self.out = out
+        self.activation = activation
+
+
+class CamEngine:
+    def __init__(self, model: nn.Module, target_layer: str, method: str = "smooth",
+                 num_samples: int = 4, std: float = 0.3):
+        if method not in ("gradcam", "smooth"):
+            raise ValueError(f"Неизвестный метод CAM: {method}")
+        self.model = model
+        self.target_layer = target_layer
+        self.method = method
+        self.num_samples = num_samples
+        self.std = std
+
+        self._local = threading.local()
+        layer = dict(model.named_modules())[target_layer]
+        self._handle = layer.register_forward_hook(self._hook)
+
+    # ---------- хук ----------
+    def _hook(self, module, inputs, output):
+        if getattr(self._local, "capture", False):
+            self._local.activation = output
+
+    def _forward(self, x: torch.Tensor):
+        self._local.capture = True
+        try:
+            with torch.enable_grad():
+                out = self.model(x)
+            act = self._local.activation
+        finally:
+            self._local.capture = False
+            self._local.activation = None
+        return out, act
+
+    # ---------- API ----------
+    def forward(self, x: torch.Tensor) -> CamPass:
+        """Forward с графом; логиты из CamPass.out годятся для классификации."""
+        out, act = self._forward(x)
+        return CamPass(x, out, act)
+
+    def cam(self, p: CamPass, class_idx: ClassIdx, method: Optional[str] = None) -> torch.Tensor:
+        """
+        CAM (N, h, w) для класса class_idx (int или по одному на снимок батча).
+        Граф прохода сохраняется — можно вызывать повторно для других классов.
+        """
+        method = method or self.method
+        idx = self._class_index(p.out, class_idx)
+        if method == "gradcam":
+            grad = self._grad(p.out, p.activation, idx, retain_graph=True)
+            weights = grad.mean(dim=(2, 3))
+        else:
+            weights = self._smooth_weights(p, idx)
+        cam = (weights[:, :, None, None] * p.activation.detach()).sum(dim=1)
+        return torch.relu(cam)
+
+    def close(self):
+        """Снимает хук с модели."""
+        if self._handle is not None:
+            self._handle.remove()
+            self._handle = None
+
+    # ---------- внутреннее ----------
+    @staticmethod
+    def _class_index(out: torch.Tensor, class_idx: ClassIdx) -> torch.Tensor:
+        n = out.shape[0]
+        if isinstance(class_idx, int):
+            class_idx = [class_idx] * n
+        return torch.as_tensor(list(class_idx), device=out.device).view(-1, 1)
+
+    @staticmethod
+    def _grad(out: torch.Tensor, act: torch.Tensor, idx: torch.Tensor,
+              retain_graph: bool) -> torch.Tensor:
+        score = out.gather(1, idx).sum()
+        (grad,) = torch.autograd.grad(score, act, retain_graph=retain_graph)
+        return grad
+
+    def _smooth_weights(self, p: CamPass, idx: torch.Tensor) -> torch.Tensor:
+        act = p.activation.detach()
+        grad_2 = torch.zeros_like(act)
+        grad_3 = torch.zeros_like(act)
+        last: Optional[torch.Tensor] = None
+        for _ in range(self.num_samples):
+            noisy = p.x + torch.randn_like(p.x) * self.std
+            out, noisy_act = self._forward(noisy)
+            last = self._grad(out, noisy_act, idx, retain_graph=False)
+            grad_2.add_(last.pow(2))
+            grad_3.add_(last.pow(3))
+        grad_2.div_(self.num_samples)
+        grad_3.div_(self.num_samples)
+
+        # коэффициенты Grad-CAM++ для каждого пикселя
+        denom = 2 * grad_2 + (grad_3 * act).flatten(2).sum(-1)[..., None, None]
+        alpha = torch.where(grad_2 > 0, grad_2 / (denom + 1e-8), torch.zeros_like(grad_2))
+        return alpha.mul(torch.relu(last)).flatten(2).sum(-1)
+
+
+def count_hooks(model: nn.Module) -> int:
+    """Сколько forward/backward-хуков висит на модулях модели (для бенчмарка)."""
+    total = 0
+    for m in model.modules():
+        total += len(m._forward_hooks) + len(m._forward_pre_hooks) + len(m._backward_hooks)
+    return total
@@ -0,0 +1,130 @@
+# app/chat_context.py
+"""
+Контекст пациентов для промпта ассистента — в пределах бюджета токенов.
+
+Раньше в промпт шла строка на каждого пациента базы: prefill LLM рос
+линейно с базой и в итоге не влезал в окно контекста. Теперь:
+
+- сводка — числа по риску, типу исследования и за 7 дней вместо списка;
+- затем пациенты по убыванию важности, пока не кончится бюджет:
+  открытая карточка (с последними исследованиями), упомянутые в вопросе
+  по ФИО (поиск по индексу), высокий риск, последние записи.
+
+Сводка и кандидаты зависят от данных и даты («за 7 дней») и кэшируются по
+db.data_revision() и сегодняшнему дню; на сообщение — только поиск
+упомянутых фамилий.
+
+    CHAT_CONTEXT_TOKENS=1500   — бюджет контекста (токены оцениваются по символам)
+"""
+import datetime
+import functools
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import db
+
+CONTEXT_TOKENS = int(os.environ.get("CHAT_CONTEXT_TOKENS", "1500"))
+CHARS_PER_TOKEN = 3        # грубо для кириллицы у llama3/phi3; токенизатора в панели нет
+TOP_HIGH_RISK = 20
+TOP_RECENT = 10
+MENTION_MATCHES = 3        # совпадений на одно упомянутое слово
+HISTORY_ROWS = 3           # исследований открытой карточки
+
+RISK_RU = {2: "высокий", 1: "средний", 0: "низкий"}
+# слова, с которых начинаются вопросы, — не фамилии
+STOPWORDS = {"какие", "какой", "какая", "кто", "что", "сколько", "как", "где", "когда", "почему",
+             "покажи", "расскажи", "есть", "пациент", "пациенты", "пациента", "пациентов", "риск",
+             "всего", "список", "дай", "найди", "нужно", "можно"}
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def patient_line(p: Dict[str, Any]) -> str:
+    return (f"- #{p['id']} {p['name']}: {p['modality']} → {p['label']} "
+            f"(риск {p['risk']}, {p['probability']}%, {str(p.get('created_at') or '')[:10]})")
+
+
+def mentioned_names(question: str) -> List[str]:
+    """Слова вопроса с заглавной буквы — кандидаты в ФИО; окончания срезаются («Анной» -> «анн»)."""
+    out = []
+    for word in re.findall(r"[А-ЯЁA-Z][а-яёa-z-]{2,}", question or ""):
+        w = db.normalize_name(word)
+        if w in STOPWORDS:
+            continue
+        out.append(w[:max(3, len(w) - 2)])
+    return list(dict.fromkeys(out))
+
+
+@functools.lru_cache(maxsize=4)
+def _general(rev: int, today: str) -> Tuple[int, str, Tuple[Dict[str, Any], ...], Tuple[Dict[str, Any], ...]]:
+    """
+    Сводка и кандидаты без привязки к вопросу. Ключ — версия данных и дата:
+    «за 7 дней» сдвигается в полночь и без новых записей.
+    """
+    stats = db.dashboard_stats(days=7)
+    with db.connection() as conn:
+        by_risk = dict(conn.execute("SELECT risk_rank, COUNT(*) FROM patients GROUP BY risk_rank").fetchall())
+        by_mod = conn.execute(
+            "SELECT COALESCE(modality, '—'), COUNT(*) FROM patients GROUP BY modality ORDER BY 2 DESC").fetchall()
+    summary = (
+        f"Всего пациентов: {stats['patients']}; исследований за 7 дней: {stats['recent']}.\n"
+        "По риску: " + ", ".join(f"{RISK_RU[r]} — {by_risk.get(r, 0)}" for r in (2, 1, 0)) + ".\n"
+        "По типу исследования: " + (", ".join(f"{m} — {n}" for m, n in by_mod) or "—") + "."
+    )
+    high = db.query_patients(risk=["high"], limit=TOP_HIGH_RISK)
+    recent = db.query_patients(sort="recent", limit=TOP_RECENT)
+    return stats["patients"], summary, tuple(high), tuple(recent)
+
+
+@functools.lru_cache(maxsize=64)
+def _compile(rev: int, today: str, open_pid: Optional[int], names: Tuple[str, ...], budget: int) -> str:
+    total, summary, high, recent = _general(rev, today)
+    if not total:
+        return "Пациентов в базе нет."
+    parts = ["Сводка по базе:\n" + summary]
+    used = estimate_tokens(parts[0])
+    seen = set()
+
+    def add(title: str, rows, details=None):
+        # строки по порядку важности, пока помещаются в бюджет
+        nonlocal used
+        lines = []
+        for p in rows:
+            if p["id"] in seen:
+                continue
+            line = patient_line(p) + (details(p) if details else "")
+            cost = estimate_tokens(line) + 1
+            if used + cost > budget:
+                break
+            seen.add(p["id"])
+            lines.append(line)
+            used += cost
+        if lines:
+            parts.append(f"{title}:\n" + "\n".join(lines))
+
+    if open_pid is not None:
+        p = db.get_patient(open_pid)
+        if p:
+            earlier = db.get_history(open_pid)[1:HISTORY_ROWS + 1]
+            add("Открытая карточка", [p], lambda p: "".join(
+                f"\n    ранее {str(h.get('timestamp') or '')[:10]}: {h.get('label')} (риск {h.get('risk')})"
+                for h in earlier))
+    # сначала все слова вместе («Ёлкиной Анной» -> одна пациентка), затем по одному
+    mentioned = []
+    for name in ([" ".join(names)] if len(names) > 1 else []) + list(names):
+        mentioned += db.query_patients(name=name, limit=MENTION_MATCHES)
+    add("Упомянутые в вопросе", mentioned)
+    add("Высокий риск (по вероятности)", high)
+    add("Последние записи", recent)
+    if total > len(seen):
+        parts.append(f"Остальные {total - len(seen)} пациентов не перечислены — только в сводке.")
+    return "\n\n".join(parts)
+
+
+def build_context(question: str, open_pid: Optional[int] = None, budget: int = CONTEXT_TOKENS) -> str:
+    """Контекст для промпта: сводка + самые важные для вопроса пациенты, не больше budget токенов."""
+    return _compile(db.data_revision(), datetime.date.today().isoformat(), open_pid,
+                    tuple(mentioned_names(question)), budget)
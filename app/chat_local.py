@@ -1,25 +1,169 @@
+"""
+Локальный чат через Ollama (ollama serve).
+
+ChatClient держит одну keep-alive сессию requests на процесс (пул соединений
+к Ollama вместо нового TCP на каждое сообщение) и фоновую проверку
+доступности: панель читает закэшированный статус и не ждёт сеть на каждой
+перерисовке. Пока Ollama недоступна, проверки идут всё реже (1, 2, 4 … 30 с).
+
+    OLLAMA_URL=http://localhost:11434
+    OLLAMA_PROBE_INTERVAL=15     — проверка, пока Ollama отвечает (с)
+
+Поток NDJSON разбирается orjson, если он установлен. Проверить клиент без
+Ollama: python bench/fake_ollama.py (подставной /api/generate) и
+python bench/bench_chat.py.
+"""
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # необязательная зависимость
+    _loads = json.loads
+
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
+TIMEOUT = 120
+PROBE_INTERVAL = float(os.environ.get("OLLAMA_PROBE_INTERVAL", "15"))
+PROBE_TIMEOUT = 1.0
+BACKOFF_MIN, BACKOFF_MAX = 1.0, 30.0
+
+
+class ChatClient:
+    def __init__(self, base_url: str = OLLAMA_URL, pool_size: int = 8):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._online: Optional[bool] = None   # None — ещё не проверяли
+        self._error: Optional[str] = None
+        self._checked_at = 0.0
+        self._failures = 0
+        self._wake = threading.Event()
+        self._probe: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    # ---------- доступность ----------
+    def _check(self):
+        try:
+            self.session.get(self.base_url, timeout=PROBE_TIMEOUT).raise_for_status()
+            self._set_status(True)
+        except requests.RequestException as e:
+            self._set_status(False, str(e))
+
+    def _set_status(self, online: bool, error: Optional[str] = None):
+        with self._lock:
+            self._online, self._error, self._checked_at = online, error, time.time()
+            self._failures = 0 if online else self._failures + 1
+
+    def _delay(self) -> float:
+        if self._online:
+            return PROBE_INTERVAL
+        return min(BACKOFF_MAX, BACKOFF_MIN * 2 ** max(0, self._failures - 1))
+
+    def _probe_loop(self):
+        while True:
+            self._check()
+            self._wake.wait(self._delay())
+            self._wake.clear()
+
+    def start_probe(self):
+        with self._lock:
+            if self._probe is None:
+                self._probe = threading.Thread(target=self._probe_loop, name="ollama-probe", daemon=True)
+                self._probe.start()
+
+    def recheck(self):
+        """Проверить сейчас, не дожидаясь интервала (после ошибки чата, по кнопке)."""
+        self.start_probe()
+        self._wake.set()
+
+    def health(self) -> Dict[str, Any]:
+        """Последний известный статус; сеть не трогает. online=None — первая проверка ещё идёт."""
+        self.start_probe()
+        with self._lock:
+            return {"online": self._online, "error": self._error, "checked_at": self._checked_at}
+
+    # ---------- генерация ----------
+    def stream(self, prompt: str, model: str = "llama3", cancel: Optional[threading.Event] = None,
+               stats: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """
+        Ответ Ollama по мере генерации: отдаёт куски текста, как только они приходят.
+
+        cancel — threading.Event: установлен -> соединение закрывается, Ollama
+        прекращает генерацию. Закрытие генератора (например, Streamlit прервал
+        перерисовку) делает то же самое.
+        stats (если передан) заполняется: ttft_ms — до первого куска текста,
+        total_ms — до конца ответа, chunks, eval_count (токенов по данным Ollama),
+        cancelled.
+        """
+        stats = {} if stats is None else stats
+        stats.update(ttft_ms=None, total_ms=None, chunks=0, eval_count=None, cancelled=False)
+        t0 = time.perf_counter()
+        try:
+            r = self.session.post(f"{self.base_url}/api/generate", json={"model": model, "prompt": prompt},
+                                  stream=True, timeout=TIMEOUT)
+        except requests.RequestException as e:
+            self._set_status(False, str(e))
+            self.recheck()
+            yield f"⚠️ Не удалось подключиться к Ollama: {e}\nУбедись, что запущено:  ollama serve"
+            return
+        self._set_status(True)
+        finished = False
+        try:
+            r.raise_for_status()
+            for line in r.iter_lines(chunk_size=4096):
+                if cancel is not None and cancel.is_set():
+                    stats["cancelled"] = True
+                    return
+                if not line:
+                    continue
+                try:
+                    data = _loads(line)
+                except ValueError:
+                    continue
+                text = data.get("response")
+                if text:
+                    if stats["ttft_ms"] is None:
+                        stats["ttft_ms"] = (time.perf_counter() - t0) * 1000
+                    stats["chunks"] += 1
+                    yield text
+                if data.get("done"):
+                    stats["eval_count"] = data.get("eval_count")
+            finished = True
+        except requests.RequestException as e:
+            yield f"\n⚠️ Ответ Ollama прерван: {e}"
+        except GeneratorExit:
+            stats["cancelled"] = True
+            raise
+        finally:
+            if finished:
+                r.close()   # поток дочитан до конца — соединение возвращается в пул
+            else:
+                # недочитанный ответ: рвём соединение, иначе Ollama продолжит генерацию
+                r.raw.close()
+                r.close()
+            stats["total_ms"] = (time.perf_counter() - t0) * 1000
+
+
+client = ChatClient()
+
+
+def stream_chat(prompt: str, model: str = "llama3", cancel: Optional[threading.Event] = None,
+                stats: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+    return client.stream(prompt, model, cancel=cancel, stats=stats)
+
 
 def local_ai_chat(prompt: str, model: str = "llama3") -> str:
     """
     Offline/local chat via Ollama.
     Requires: ollama serve  (and model pulled: ollama pull llama3 or phi3)
     """
-    url = "http://localhost:11434/api/generate"
-    try:
-        with requests.post(url, json={"model": model, "prompt": prompt}, stream=True, timeout=120) as r:
-            r.raise_for_status()
-            chunks = []
-            for line in r.iter_lines():
-                if not line:
-                    continue
-                try:
-                    import json as _json
-                    data = _json.loads(line.decode("utf-8"))
-                    if "response" in data:
-                        chunks.append(data["response"])
-                except Exception:
-                    pass
-        return "".join(chunks).strip() or "Я не получил ответа от локальной модели."
-    except Exception as e:
-        return f"⚠️ Не удалось подключиться к Ollama: {e}\nУбедись, что запущено:  ollama serve"
+    return "".join(stream_chat(prompt, model)).strip() or "Я не получил ответа от локальной модели."
@@ -1,85 +1,189 @@
-import os, sqlite3, datetime
-from typing import Optional, List, Dict, Any
+import os, sqlite3, datetime, threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional, List, Dict, Any, Iterator, Deque
 
-DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "patients.db")
+DB_PATH = os.environ.get("PATIENTS_DB", os.path.join(os.path.dirname(os.path.dirname(__file__)), "patients.db"))
 
-def get_conn():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+# ---------- соединения ----------
+# Раньше каждая функция открывала свой sqlite3.connect и закрывала его, а запись
+# шла через rollback-журнал и блокировала читателей. Теперь соединения живут в
+# пуле (кэш подготовленных выражений sqlite3 переживает вызовы), база — в WAL:
+# читатели не ждут писателя.
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "16"))
+PRAGMAS = {
+    "synchronous": "NORMAL",      # в WAL безопасно: теряется максимум последняя транзакция при сбое ОС
+    "cache_size": "-20000",       # ~20 МБ страничного кэша на соединение
+    "mmap_size": str(256 * 1024 * 1024),
+    "temp_store": "MEMORY",
+    "busy_timeout": "5000",
+}
+
+def _connect(path: str, wal: bool = True) -> sqlite3.Connection:
+    # isolation_level=None — транзакции открываем явно (BEGIN IMMEDIATE в transaction())
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None,
+                           cached_statements=256)
     conn.row_factory = sqlite3.Row
+    if wal:
+        conn.execute("PRAGMA journal_mode=WAL")
+        for key, value in PRAGMAS.items():
+            conn.execute(f"PRAGMA {key}={value}")
     return conn
 
-def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS patients (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        modality TEXT,
-        label TEXT,
-        diagnosis TEXT,
-        probability REAL,
-        risk TEXT,
-        created_at TEXT,
-        image_path TEXT,
-        heatmap_path TEXT
-    )""")
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS history (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        patient_id INTEGER,
-        timestamp TEXT,
-        modality TEXT,               -- ← ЭТОГО НЕ ХВАТАЕТ!
-        label TEXT,
-        diagnosis TEXT,
-        probability REAL,
-        risk TEXT,
-        image_path TEXT,
-        heatmap_path TEXT,
-        FOREIGN KEY(patient_id) REFERENCES patients(id)
-    )""")
+class ConnectionPool:
+    """
+    Пул соединений, безопасный для потоков (сессии Streamlit, сервис, фоновые задачи).
+    Соединение берётся на время одного вызова и возвращается. size=0 — без пула:
+    новое соединение на каждый вызов (как раньше; для сравнения в bench/bench_db.py).
+    """
+
+    def __init__(self, path: str = DB_PATH, size: int = POOL_SIZE, wal: bool = True):
+        self.path = path
+        self.size = size
+        self.wal = wal
+        self._idle: List[sqlite3.Connection] = []
+        # очередь ожидающих: освободившееся соединение отдаётся самому старому,
+        # иначе частые читатели перехватывают его и писатель голодает
+        self._waiters: Deque[List[Any]] = deque()
+        self._created = 0
+        self._lock = threading.Lock()
 
-    conn.commit()
-    conn.close()
+    def _acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._idle and not self._waiters:
+                return self._idle.pop()
+            if self._created < self.size:
+                self._created += 1
+                waiter = None
+            else:
+                waiter = [threading.Event(), None]
+                self._waiters.append(waiter)
+        if waiter is None:
+            try:
+                return _connect(self.path, self.wal)
+            except BaseException:
+                with self._lock:
+                    self._created -= 1
+                raise
+        waiter[0].wait()
+        return waiter[1]
+
+    def _release(self, conn: sqlite3.Connection):
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter[1] = conn
+                waiter[0].set()
+            else:
+                self._idle.append(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        if self.size <= 0:
+            conn = _connect(self.path, self.wal)
+            try:
+                yield conn
+            finally:
+                conn.close()
+            return
+
+        conn = self._acquire()
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+
+    def close(self):
+        """Закрывает свободные соединения (занятые вернутся в пул как обычно)."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for conn in idle:
+            conn.close()
+
+pool = ConnectionPool()
+
+@contextmanager
+def connection() -> Iterator[sqlite3.Connection]:
+    """Соединение из пула на время блока with."""
+    with pool.connection() as conn:
+        yield conn
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """
+    Пишущая транзакция: BEGIN IMMEDIATE сразу берёт блокировку записи,
+    поэтому «прочитал — потом пишу» не упирается в SQLITE_BUSY посреди транзакции.
+    """
+    with pool.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+def get_conn():
+    """Отдельное соединение (для скриптов); закрывает вызывающий."""
+    return _connect(pool.path, pool.wal)
 
 def risk_score(risk: str) -> int:
     return {"high":2,"medium":1,"low":0}.get(risk, 0)
 
+def normalize_name(name: str) -> str:
+    """«  Ёлкин  Иван » -> «елкин иван»: нижний регистр, ё -> е, одиночные пробелы."""
+    return " ".join((name or "").lower().replace("ё", "е").split())
+
 def insert_or_update_patient(name: str, payload: Dict[str, Any], image_path: str, heatmap_path: Optional[str]) -> int:
     """
     If patient exists -> update main record and append to history.
     If new -> create and also create first history row.
     Returns patient_id.
     """
-    conn = get_conn()
-    cur = conn.cursor()
     now = datetime.datetime.now().isoformat(timespec="seconds")
 
     # compute risk tag
     risk = infer_risk(payload)
 
+    with transaction() as conn:
+        return _upsert_patient(conn, name, payload, image_path, heatmap_path, risk, now)
+
+def _upsert_patient(conn: sqlite3.Connection, name: str, payload: Dict[str, Any], image_path: str,
+                    heatmap_path: Optional[str], risk: str, now: str) -> int:
+    cur = conn.cursor()
+
+    rank = risk_score(risk)
+
     # find patient
-    cur.execute("SELECT id FROM patients WHERE name=?", (name,))
+    cur.execute("SELECT id, risk_rank FROM patients WHERE name=?", (name,))
     row = cur.fetchone()
     if row:
         pid = row["id"]
+        _bump(cur, "high_risk", (rank == 2) - (row["risk_rank"] == 2))
         # update current snapshot
-        cur.execute("""UPDATE patients SET modality=?, label=?, diagnosis=?, probability=?, risk=?, created_at=?, image_path=?, heatmap_path=?
+        cur.execute("""UPDATE patients SET modality=?, label=?, diagnosis=?, probability=?, risk=?, risk_rank=?, created_at=?, image_path=?, heatmap_path=?
                        WHERE id=?""",
                     (payload.get("modality"), payload.get("label"), payload.get("diagnosis"),
-                     float(payload.get("probability",0.0)), risk, now, image_path, heatmap_path, pid))
+                     float(payload.get("probability",0.0)), risk, rank, now, image_path, heatmap_path, pid))
     else:
-        cur.execute("""INSERT INTO patients (name, modality, label, diagnosis, probability, risk, created_at, image_path, heatmap_path)
-                       VALUES (?,?,?,?,?,?,?,?,?)""",
-                    (name, payload.get("modality"), payload.get("label"), payload.get("diagnosis"),
-                     float(payload.get("probability",0.0)), risk, now, image_path, heatmap_path))
+        cur.execute("""INSERT INTO patients (name, name_norm, modality, label, diagnosis, probability, risk, risk_rank, created_at, image_path, heatmap_path)
+                       VALUES (?,?,?,?,?,?,?,?,?,?,?)""",
+                    (name, normalize_name(name), payload.get("modality"), payload.get("label"), payload.get("diagnosis"),
+                     float(payload.get("probability",0.0)), risk, rank, now, image_path, heatmap_path))
         pid = cur.lastrowid
+        _bump(cur, "patients", 1)
+        _bump(cur, "high_risk", int(rank == 2))
 
     # append to history
     cur.execute("""
     INSERT INTO history 
-    (patient_id, timestamp, modality, label, diagnosis, probability, risk, image_path, heatmap_path)
-    VALUES (?,?,?,?,?,?,?,?,?)""",
+    (patient_id, timestamp, modality, label, diagnosis, probability, risk, image_path, heatmap_path, model_version)
+    VALUES (?,?,?,?,?,?,?,?,?,?)""",
     (
         pid,
         now,
@@ -89,13 +193,68 @@ def insert_or_update_patient(name: str, payload: Dict[str, Any], image_path: str
         float(payload.get("probability", 0.0)),
         risk,
         image_path,
-        heatmap_path
+        heatmap_path,
+        payload.get("model_version")  # версия модели из реестра
     ))
-
-    conn.commit()
-    conn.close()
+    cur.execute("""INSERT INTO daily_studies (day, studies) VALUES (?, 1)
+                   ON CONFLICT(day) DO UPDATE SET studies = studies + 1""", (now[:10],))
+    _bump(cur, "revision", 1)
     return pid
 
+def _bump(cur: sqlite3.Cursor, counter: str, delta: int):
+    if delta:
+        cur.execute("""INSERT INTO counters (name, value) VALUES (?, ?)
+                       ON CONFLICT(name) DO UPDATE SET value = value + excluded.value""", (counter, delta))
+
+def _recount_stats(cur: sqlite3.Cursor):
+    """Пересчитывает счётчики с нуля (первое заполнение при миграции)."""
+    patients, high = cur.execute(
+        "SELECT COUNT(*), COALESCE(SUM(risk_rank = 2), 0) FROM patients").fetchone()
+    cur.execute("DELETE FROM counters")
+    cur.executemany("INSERT INTO counters (name, value) VALUES (?, ?)",
+                    [("patients", patients), ("high_risk", high)])
+    cur.execute("DELETE FROM daily_studies")
+    cur.execute("""INSERT INTO daily_studies (day, studies)
+                   SELECT substr(timestamp, 1, 10), COUNT(*) FROM history
+                   WHERE timestamp IS NOT NULL GROUP BY 1""")
+
+def clear_patients() -> int:
+    """
+    Удаляет всех пациентов и историю одной транзакцией и обнуляет счётчики
+    карточек; revision растёт дальше, поэтому кэши по data_revision()
+    устаревают. Возвращает число удалённых пациентов.
+    """
+    init_db()
+    with transaction() as conn:
+        cur = conn.cursor()
+        row = cur.execute("SELECT value FROM counters WHERE name='revision'").fetchone()
+        revision = row[0] if row else 0
+        cur.execute("DELETE FROM history")
+        removed = cur.execute("DELETE FROM patients").rowcount
+        _recount_stats(cur)   # counters и daily_studies — с нуля (revision тоже стирается)
+        _bump(cur, "revision", revision + 1)
+    return removed
+
+def data_revision() -> int:
+    """Растёт с каждой записью пациента — ключ для кэшей поверх запросов."""
+    with connection() as conn:
+        row = conn.execute("SELECT value FROM counters WHERE name='revision'").fetchone()
+    return row[0] if row else 0
+
+def dashboard_stats(days: int = 7) -> Dict[str, int]:
+    """
+    Карточки панели: всего пациентов, высокий риск, исследований за days дней
+    (сегодня и days-1 предыдущих). Читает две строки counters и days строк
+    daily_studies — стоимость не зависит от размера базы.
+    """
+    since = (datetime.date.today() - datetime.timedelta(days=days - 1)).isoformat()
+    with connection() as conn:
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        recent = conn.execute("SELECT COALESCE(SUM(studies), 0) FROM daily_studies WHERE day >= ?",
+                              (since,)).fetchone()[0]
+    return {"patients": counters.get("patients", 0), "high_risk": counters.get("high_risk", 0),
+            "recent": recent}
+
 def infer_risk(payload: Dict[str, Any]) -> str:
     # Normalize across modalities
     mod = (payload.get("modality") or "").lower()
@@ -120,31 +279,99 @@ def infer_risk(payload: Dict[str, Any]) -> str:
             return "low"
     return "low"
 
+# ---------- очередь пациентов ----------
+# Сортировка и фильтры выполняются в SQL по индексам (см. _m2_queue),
+# в Python приходит только запрошенная страница.
+def _fts5_available() -> bool:
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE t USING fts5(x)")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+FTS5 = _fts5_available()
+
+# порядок: (колонки ключа, направление). Ключ заканчивается id — он уникален,
+# поэтому по последней строке страницы однозначно строится следующая (keyset).
+QUEUE_ORDER = {
+    "risk": (("risk_rank", "probability", "id"), "DESC"),   # риск, затем вероятность
+    "recent": (("created_at", "id"), "DESC"),
+    "name": (("name_norm", "id"), "ASC"),
+}
+
+def queue_cursor(row: Dict[str,Any], sort: str = "risk") -> tuple:
+    """Курсор после строки row для query_patients(after=...)."""
+    return tuple(row[c] for c in QUEUE_ORDER[sort][0])
+
+def _fts_query(text: str) -> str:
+    """«Иван пет» -> '"иван"* "пет"*': каждое слово — префикс любого слова ФИО."""
+    return " ".join('"{}"*'.format(t.replace('"', '""')) for t in normalize_name(text).split())
+
+def _queue_where(risk: Optional[List[str]] = None, modality: Optional[List[str]] = None,
+                 name: Optional[str] = None):
+    clauses, params = [], []
+    if risk:
+        ranks = sorted({risk_score(r) for r in risk}, reverse=True)
+        clauses.append(f"risk_rank IN ({','.join('?' * len(ranks))})")
+        params += ranks
+    if modality:
+        clauses.append(f"modality IN ({','.join('?' * len(modality))})")
+        params += list(modality)
+    if name and normalize_name(name):
+        if FTS5:
+            clauses.append("id IN (SELECT rowid FROM patients_fts WHERE patients_fts MATCH ?)")
+            params.append(_fts_query(name))
+        else:
+            # без FTS5 — префикс нормализованного ФИО (по индексу name_norm)
+            prefix = normalize_name(name)
+            clauses.append("name_norm >= ? AND name_norm < ?")
+            params += [prefix, prefix + "\uffff"]
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+def query_patients(risk: Optional[List[str]] = None, modality: Optional[List[str]] = None,
+                   name: Optional[str] = None, sort: str = "risk",
+                   limit: Optional[int] = 50, offset: int = 0,
+                   after: Optional[tuple] = None) -> List[Dict[str,Any]]:
+    """
+    Страница очереди: фильтры по риску / типу исследования / ФИО,
+    сортировка из QUEUE_ORDER, limit/offset. limit=None — все строки.
+    after=queue_cursor(последняя строка) — следующая страница по ключу
+    (keyset): стоимость не растёт с номером страницы, в отличие от offset.
+    """
+    where, params = _queue_where(risk, modality, name)
+    cols, direction = QUEUE_ORDER[sort]
+    if after is not None:
+        # (a, b, id) < (?, ?, ?) — диапазон по тому же индексу, что и ORDER BY
+        op = "<" if direction == "DESC" else ">"
+        where += (" AND " if where else " WHERE ") + \
+            f"({', '.join(cols)}) {op} ({', '.join('?' * len(cols))})"
+        params += list(after)
+    sql = f"SELECT * FROM patients{where} ORDER BY {', '.join(f'{c} {direction}' for c in cols)}"
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params += [int(limit), int(offset)]
+    with connection() as conn:
+        return [dict(r) for r in conn.execute(sql, params)]
+
+def count_patients(risk: Optional[List[str]] = None, modality: Optional[List[str]] = None,
+                   name: Optional[str] = None) -> int:
+    where, params = _queue_where(risk, modality, name)
+    with connection() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM patients{where}", params).fetchone()[0]
+
 def list_patients() -> List[Dict[str,Any]]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM patients")
-    rows = [dict(r) for r in cur.fetchall()]
-    conn.close()
     # sort by risk score desc then probability desc
-    rows.sort(key=lambda r: (risk_score(r.get("risk","low")), float(r.get("probability",0.0))), reverse=True)
-    return rows
+    return query_patients(limit=None)
 
 def get_patient(pid: int) -> Optional[Dict[str,Any]]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM patients WHERE id=?", (pid,))
-    row = cur.fetchone()
-    conn.close()
+    with connection() as conn:
+        row = conn.execute("SELECT * FROM patients WHERE id=?", (pid,)).fetchone()
     return dict(row) if row else None
 
 def get_history(pid: int) -> list:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM history WHERE patient_id=? ORDER BY id DESC", (pid,))
-    rows = [dict(r) for r in cur.fetchall()]
-    conn.close()
-    return rows
+    with connection() as conn:
+        return [dict(r) for r in conn.execute(
+            "SELECT * FROM history WHERE patient_id=? ORDER BY id DESC", (pid,))]
 
 # --------------------------------------------
 # Health Index (0–100) — общая шкала состояния пациента
@@ -187,30 +414,54 @@ def health_index(label: str, risk: str) -> int:
     return int(base)
 
 # ------------------------------------------------------
-# 🔧 Автоматическая миграция структуры базы данных
+# 🔧 Версионные миграции схемы
 # ------------------------------------------------------
+# Номер последней применённой миграции хранится в schema_version. Каждая
+# миграция выполняется один раз в своей транзакции; изменения схемы — только
+# новой функцией в конце MIGRATIONS. Шаги идемпотентны: база, созданная до
+# появления schema_version, проходит их с первого.
 
-def column_exists(cursor, table: str, column: str) -> bool:
-    cursor.execute(f"PRAGMA table_info({table})")
-    cols = [row[1] for row in cursor.fetchall()]
-    return column in cols
-
-
-def migrate_db():
-    """
-    Автоматически обновляет структуру БД:
-    - добавляет недостающие колонки
-    - обеспечивает совместимость старых таблиц
-    """
-    conn = get_conn()
-    cur = conn.cursor()
+def _columns(cur: sqlite3.Cursor, table: str) -> List[str]:
+    return [row[1] for row in cur.execute(f"PRAGMA table_info({table})")]
 
-    # ---------- Проверяем таблицу history ----------
-    cur.execute("CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY AUTOINCREMENT)")
-    cur.execute("PRAGMA table_info(history)")
-    existing_cols = [row[1] for row in cur.fetchall()]
+def _add_columns(cur: sqlite3.Cursor, table: str, required: List[tuple]):
+    existing = _columns(cur, table)
+    for col, col_type in required:
+        if col not in existing:
+            print(f"[MIGRATION] Добавляю колонку {table}.{col}")
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {col} {col_type}")
 
-    required = [
+def _m1_base(cur: sqlite3.Cursor):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS patients (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        modality TEXT,
+        label TEXT,
+        diagnosis TEXT,
+        probability REAL,
+        risk TEXT,
+        created_at TEXT,
+        image_path TEXT,
+        heatmap_path TEXT
+    )""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        timestamp TEXT,
+        modality TEXT,
+        label TEXT,
+        diagnosis TEXT,
+        probability REAL,
+        risk TEXT,
+        image_path TEXT,
+        heatmap_path TEXT,
+        model_version TEXT,
+        FOREIGN KEY(patient_id) REFERENCES patients(id)
+    )""")
+    # старые базы: history без части колонок
+    _add_columns(cur, "history", [
         ("patient_id", "INTEGER"),
         ("timestamp", "TEXT"),
         ("modality", "TEXT"),
@@ -220,16 +471,120 @@ def migrate_db():
         ("risk", "TEXT"),
         ("image_path", "TEXT"),
         ("heatmap_path", "TEXT"),
-    ]
-
-    for col, col_type in required:
-        if col not in existing_cols:
-            print(f"[MIGRATION] Добавляю колонку history.{col}")
-            cur.execute(f"ALTER TABLE history ADD COLUMN {col} {col_type}")
-
+        ("model_version", "TEXT"),
+    ])
     # Заполняем modality, если пусто
     cur.execute("UPDATE history SET modality='Unknown' WHERE modality IS NULL OR modality=''")
 
-    conn.commit()
-    conn.close()
-    print("✅ Миграция выполнена")
+def _m2_queue(cur: sqlite3.Cursor):
+    """Очередь в SQL: ранг риска, нормализованное ФИО, индексы, FTS5."""
+    _add_columns(cur, "patients", [
+        ("risk_rank", "INTEGER"),    # risk_score(risk): сортировка очереди
+        ("name_norm", "TEXT"),       # normalize_name(name): поиск по ФИО
+    ])
+    cur.execute("""UPDATE patients SET risk_rank = CASE risk WHEN 'high' THEN 2 WHEN 'medium' THEN 1 ELSE 0 END
+                   WHERE risk_rank IS NULL""")
+    rows = cur.execute("SELECT id, name FROM patients WHERE name_norm IS NULL").fetchall()
+    if rows:
+        cur.executemany("UPDATE patients SET name_norm=? WHERE id=?",
+                        [(normalize_name(r[1]), r[0]) for r in rows])
+
+    # порядок очереди по умолчанию и он же с фильтром по типу исследования
+    # (DROP — на случай индексов с тем же именем, но другим порядком колонок)
+    cur.execute("DROP INDEX IF EXISTS idx_patients_queue")
+    cur.execute("DROP INDEX IF EXISTS idx_patients_modality_queue")
+    cur.execute("DROP INDEX IF EXISTS idx_patients_name_norm")
+    cur.execute("CREATE INDEX idx_patients_queue ON patients(risk_rank DESC, probability DESC, id DESC)")
+    cur.execute("CREATE INDEX idx_patients_modality_queue ON patients(modality, risk_rank DESC, probability DESC, id DESC)")
+    cur.execute("CREATE INDEX idx_patients_name_norm ON patients(name_norm, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_patients_recent ON patients(created_at DESC, id DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_patients_name ON patients(name)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_history_patient ON history(patient_id, id)")
+
+    if not FTS5:
+        return
+    # полнотекстовый индекс по name_norm (external content — данные не дублируются);
+    # в синхроне его держат триггеры
+    cur.execute("DROP TABLE IF EXISTS patients_fts")
+    cur.execute("""CREATE VIRTUAL TABLE patients_fts USING fts5(
+                       name_norm, content='patients', content_rowid='id', prefix='2 3')""")
+    cur.execute("INSERT INTO patients_fts(patients_fts) VALUES ('rebuild')")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS patients_fts_ai AFTER INSERT ON patients BEGIN
+                       INSERT INTO patients_fts(rowid, name_norm) VALUES (new.id, new.name_norm);
+                   END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS patients_fts_ad AFTER DELETE ON patients BEGIN
+                       INSERT INTO patients_fts(patients_fts, rowid, name_norm) VALUES ('delete', old.id, old.name_norm);
+                   END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS patients_fts_au AFTER UPDATE OF name_norm ON patients BEGIN
+                       INSERT INTO patients_fts(patients_fts, rowid, name_norm) VALUES ('delete', old.id, old.name_norm);
+                       INSERT INTO patients_fts(rowid, name_norm) VALUES (new.id, new.name_norm);
+                   END""")
+
+def _m3_stats(cur: sqlite3.Cursor):
+    """Счётчики карточек панели; дальше их ведёт _upsert_patient в той же транзакции."""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS counters (
+        name TEXT PRIMARY KEY,       -- patients | high_risk
+        value INTEGER NOT NULL DEFAULT 0
+    )""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS daily_studies (
+        day TEXT PRIMARY KEY,        -- YYYY-MM-DD (history.timestamp[:10])
+        studies INTEGER NOT NULL DEFAULT 0
+    )""")
+    _recount_stats(cur)
+
+def _m4_revision(cur: sqlite3.Cursor):
+    """
+    Счётчик revision в counters — версия данных, ключ кэшей поверх запросов
+    (панель, chat_context). Растёт с каждой записью (_upsert_patient) и очисткой
+    (clear_patients); старт с 1, чтобы кэш, взятый до миграции с версией 0,
+    устарел.
+    """
+    _bump(cur, "revision", 1)
+
+MIGRATIONS = [
+    (1, "таблицы patients и history", _m1_base),
+    (2, "очередь: risk_rank, name_norm, индексы, FTS5", _m2_queue),
+    (3, "счётчики панели", _m3_stats),
+    (4, "версия данных для кэшей", _m4_revision),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+_schema_lock = threading.Lock()
+_schema_ready: set = set()   # пути баз, уже приведённых к SCHEMA_VERSION в этом процессе
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+def init_db():
+    """
+    Приводит схему к SCHEMA_VERSION. Выполняется один раз на процесс и базу:
+    повторный вызов (каждая перерисовка Streamlit) — проверка множества.
+    Параллельные процессы сериализуются BEGIN IMMEDIATE и перепроверяют версию.
+    """
+    if pool.path in _schema_ready:
+        return
+    with _schema_lock:
+        if pool.path in _schema_ready:
+            return
+        with connection() as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT,
+                applied_at TEXT
+            )""")
+            current = schema_version(conn)
+        for version, name, step in MIGRATIONS:
+            if version <= current:
+                continue
+            with transaction() as conn:
+                if schema_version(conn) >= version:   # успел другой процесс
+                    continue
+                print(f"[MIGRATION] {version}: {name}")
+                step(conn.cursor())
+                conn.execute("INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                             (version, name, datetime.datetime.now().isoformat(timespec="seconds")))
+        _schema_ready.add(pool.path)
@@ -0,0 +1,67 @@
+# app/heatmap_render.py
+"""
+Отрисовка тепловой карты при открытии карточки пациента.
+
+В storage/ лежит карта CAM низкого разрешения (.cam, см. artifacts.pack_cam),
+а не готовое наложение: здесь она растягивается до размера исходного снимка
+(не больше max_side), раскрашивается палитрой и смешивается с alpha.
+Готовые картинки запоминаются (LRU на RENDER_CACHE_SIZE штук) — файлы
+именованы по содержимому и не меняются, поэтому ключ — пути + параметры.
+Старые карты (.png / .webp) отдаются как есть.
+"""
+import functools
+import io
+import os
+from typing import Optional, Union
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from .artifacts import CAM_MAGIC, is_cam_file, unpack_cam
+from .utils_gradcam import overlay_heatmap_on_array
+
+RENDER_CACHE_SIZE = int(os.environ.get("HEATMAP_RENDER_CACHE", "32"))
+MAX_SIDE = 768
+
+COLORMAPS = {
+    "jet": cv2.COLORMAP_JET,
+    "turbo": cv2.COLORMAP_TURBO,
+    "inferno": cv2.COLORMAP_INFERNO,
+    "viridis": cv2.COLORMAP_VIRIDIS,
+    "hot": cv2.COLORMAP_HOT,
+}
+
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _render(image_path: str, cam_path: str, alpha: float, colormap: str, max_side: int) -> np.ndarray:
+    with open(cam_path, "rb") as f:
+        data = f.read()
+    if data[:4] != CAM_MAGIC:
+        # сервис с другим HEATMAP_FORMAT прислал готовое наложение
+        return np.asarray(Image.open(io.BytesIO(data)).convert("RGB"))
+    cam = unpack_cam(data)
+    img = Image.open(image_path).convert("RGB")
+    img.thumbnail((max_side, max_side))
+    overlay = overlay_heatmap_on_array(np.asarray(img), cam, alpha=alpha,
+                                       colormap=COLORMAPS[colormap], interpolation=cv2.INTER_CUBIC)
+    rgb = np.ascontiguousarray(overlay[:, :, ::-1])  # BGR->RGB
+    rgb.setflags(write=False)  # из кэша — только читать
+    return rgb
+
+
+def render(image_path: Optional[str], heatmap_path: str, alpha: float = 0.5,
+           colormap: str = "jet", max_side: int = MAX_SIDE) -> Union[np.ndarray, str, None]:
+    """
+    Картинка для st.image: RGB-массив (для .cam), путь к готовому наложению
+    (старые карты) или None, если исходника для наложения нет.
+    """
+    if not is_cam_file(heatmap_path):
+        return heatmap_path
+    if not image_path or not os.path.exists(image_path):
+        return None
+    return _render(image_path, heatmap_path, round(float(alpha), 2), colormap, int(max_side))
+
+
+def cache_info():
+    return _render.cache_info()
@@ -0,0 +1,46 @@
+# app/heatmap_worker.py
+"""
+Фоновое построение тепловых карт (отложенный режим).
+
+Диагноз сохраняется сразу, а карта считается здесь и появляется в
+heatmap_path, когда готова. Пока файла нет — карточка пациента
+показывает заглушку.
+"""
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Set
+
+WORKERS = int(os.environ.get("HEATMAP_WORKERS", "1"))
+
+_executor = ThreadPoolExecutor(max_workers=max(1, WORKERS), thread_name_prefix="heatmap")
+_pending: Set[str] = set()
+_lock = threading.Lock()
+
+
+def submit(path: str, fn: Callable[..., object], *args, **kwargs) -> Future:
+    """Ставит в очередь fn(*args, **kwargs), которая пишет карту в path."""
+    with _lock:
+        _pending.add(path)
+
+    def job():
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            print(f"[HEATMAP] не удалось построить {path}: {e}")
+            raise
+        finally:
+            with _lock:
+                _pending.discard(path)
+
+    return _executor.submit(job)
+
+
+def is_pending(path: str) -> bool:
+    with _lock:
+        return path in _pending
+
+
+def pending_count() -> int:
+    with _lock:
+        return len(_pending)
@@ -0,0 +1,89 @@
+# app/inference_client.py
+"""
+Тонкий клиент к app.inference_server — без torch.
+
+predict_image() повторяет контракт predictor.predict_image:
+возвращает (summary, heatmap_path, payload), тепловая карта пишется в workdir
+один раз под именем из хэша содержимого (artifacts.writer).
+Если сервис не запущен и INFERENCE_FALLBACK_LOCAL=1 (по умолчанию),
+анализ выполняется в текущем процессе.
+"""
+import base64
+import io
+import os
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+from PIL import Image
+
+from . import artifacts
+
+SERVER_URL = os.environ.get("INFERENCE_URL", "http://127.0.0.1:8765")
+FALLBACK_LOCAL = os.environ.get("INFERENCE_FALLBACK_LOCAL", "1") == "1"
+TIMEOUT = 300
+
+
+def is_available(timeout: float = 1.0) -> bool:
+    try:
+        return requests.get(f"{SERVER_URL}/health", timeout=timeout).ok
+    except requests.RequestException:
+        return False
+
+
+def _encode(pil_img: Image.Image) -> str:
+    buf = io.BytesIO()
+    pil_img.save(buf, format="PNG")
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+def predict_image(
+    pil_img: Image.Image,
+    workdir: str = ".",
+    forced_modality: Optional[str] = None,
+    heatmap: Optional[str] = None,
+    deferred: bool = False,
+    heatmap_path: Optional[str] = None,
+    use_cache: bool = True,
+) -> Tuple[str, Optional[str], Dict[str, Any]]:
+    """
+    heatmap / deferred / heatmap_path / use_cache — как в predictor.predict_image.
+    В отложенном режиме карту пишет сервис в файл, имя которого выбирает сам
+    (в storage/); возвращается его путь. heatmap_path сервису не передаётся —
+    он нужен только для готовой карты и для анализа в текущем процессе.
+    """
+    try:
+        r = requests.post(
+            f"{SERVER_URL}/predict",
+            json={
+                "image": _encode(pil_img),
+                "forced_modality": forced_modality,
+                "heatmap": heatmap,
+                "deferred": deferred,
+                "use_cache": use_cache,
+            },
+            timeout=TIMEOUT,
+        )
+    except requests.ConnectionError:
+        if not FALLBACK_LOCAL:
+            raise
+        from app import predictor
+        return predictor.predict_image(
+            pil_img, workdir, forced_modality=forced_modality,
+            heatmap=heatmap, deferred=deferred, heatmap_path=heatmap_path, use_cache=use_cache,
+        )
+
+    if not r.ok:
+        raise RuntimeError(f"Сервис инференса вернул {r.status_code}: {r.text[:200]}")
+    data = r.json()
+    payload = data["payload"]
+
+    if payload.get("heatmap_pending"):
+        return data["summary"], payload["heatmap_path"], payload
+
+    out_path = None
+    if data.get("heatmap_image"):
+        out_path = artifacts.writer.write(base64.b64decode(data["heatmap_image"]), workdir,
+                                          path=heatmap_path)
+    payload["heatmap_path"] = heatmap_path = out_path
+
+    return data["summary"], heatmap_path, payload
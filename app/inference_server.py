@@ -0,0 +1,270 @@
+# app/inference_server.py
+"""
+Локальный сервис инференса: владеет моделями ЭКГ/МРТ/ФЛГ и обслуживает
+запросы от всех сессий панели.
+
+Запросы складываются в очередь, батчер собирает их в динамические батчи
+(до MAX_BATCH снимков или до истечения окна MAX_WAIT_MS) и отдаёт батч
+в пул рабочих потоков, где он уходит в predictor.predict_batch.
+Рабочие потоки могут одновременно гонять одну и ту же модель: блокировок
+на модель нет, активации CAM-хука у каждого потока свои (CamEngine хранит
+их в thread-local, см. app/cam_engine.py).
+
+Запуск:
+    python -m app.inference_server --port 8765
+
+Протокол (JSON):
+    GET  /health  -> {"status": "ok", "queue": n, "models": {modality: version},
+                      "resources": {"cpus", "threads", "interop_threads", "max_concurrent"},
+                      "cache": {"hits", "misses", "hit_rate", "entries", "bytes"}}
+    POST /predict <- {"image": base64, "forced_modality": "ecg" | "mri" | "xray" | null,
+                      "heatmap": "none" | "fast" | "smooth" | null,
+                      "deferred": bool, "use_cache": bool (true)}
+                  -> {"summary": str, "payload": {...}, "heatmap_image": base64 (HEATMAP_FORMAT) | null}
+
+В отложенном режиме ответ приходит без карты, а файл пишет фоновый поток
+сервиса. Имя файла выбирает сервис — уникальное, в STORAGE_DIR, — и
+возвращает в payload["heatmap_path"]. Путь от клиента не принимается
+(400): иначе любой, кто достучался до сервиса, перезаписал бы произвольный
+файл от имени его пользователя.
+
+Повторный снимок отдаётся из result_cache, минуя очередь; "use_cache": false —
+мимо кэша (нагрузочный тест меряет инференс, а не попадания).
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from PIL import Image
+
+from . import artifacts, heatmap_worker, resources, result_cache
+from . import predictor as P
+from .artifact_store import STORAGE_DIR
+
+HOST = os.environ.get("INFERENCE_HOST", "127.0.0.1")
+PORT = int(os.environ.get("INFERENCE_PORT", "8765"))
+MAX_BATCH = int(os.environ.get("INFERENCE_MAX_BATCH", "8"))
+MAX_WAIT_MS = float(os.environ.get("INFERENCE_MAX_WAIT_MS", "15"))
+WORKERS = int(os.environ.get("INFERENCE_WORKERS", "3"))
+REQUEST_TIMEOUT = 300
+
+
+def _deferred_path() -> str:
+    """Куда фоновый поток запишет отложенную карту: имя по содержимому ещё неизвестно."""
+    os.makedirs(STORAGE_DIR, exist_ok=True)
+    return os.path.join(STORAGE_DIR, f"{uuid.uuid4().hex}_heatmap{artifacts.HEATMAP_SUFFIX}")
+
+
+class _Request:
+    __slots__ = ("image", "forced_modality", "heatmap", "deferred", "heatmap_path",
+                 "cache_key", "future", "enqueued")
+
+    def __init__(self, image: Image.Image, forced_modality: Optional[str],
+                 heatmap: Optional[str] = None, deferred: bool = False, use_cache: bool = True):
+        self.image = image
+        self.forced_modality = forced_modality
+        self.heatmap = heatmap or P.HEATMAP_MODE
+        self.deferred = bool(deferred) and self.heatmap != "none"
+        self.heatmap_path = _deferred_path() if self.deferred else None
+        self.cache_key: Optional[str] = None
+        if use_cache and result_cache.ENABLED:
+            self.cache_key = result_cache.image_key(image, forced_modality, self.heatmap)
+        self.future: Future = Future()
+        self.enqueued = time.perf_counter()
+
+    def key(self):
+        return self.forced_modality, self.heatmap, self.deferred
+
+
+class DynamicBatcher:
+    """
+    Очередь запросов + динамический батчинг + пул рабочих потоков.
+    """
+
+    def __init__(self, max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS,
+                 workers: int = WORKERS):
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="infer")
+        self._thread = threading.Thread(target=self._loop, name="batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, image: Image.Image, forced_modality: Optional[str] = None,
+               heatmap: Optional[str] = None, deferred: bool = False,
+               use_cache: bool = True) -> Future:
+        req = _Request(image, forced_modality, heatmap, deferred, use_cache)
+        hit = None
+        if req.cache_key:
+            try:
+                hit = result_cache.cache.get(req.cache_key, P.model_version)
+            except Exception as e:
+                print(f"[INFERENCE] кэш недоступен: {e}")
+        if hit is None:
+            self._queue.put(req)
+            return req.future
+
+        summary, payload, cached_heatmap = hit
+        heatmap_image = None
+        if cached_heatmap:
+            with open(cached_heatmap, "rb") as f:
+                heatmap_image = f.read()
+        payload.update({"heatmap_path": None, "cached": True, "queue_ms": 0.0})
+        req.future.set_result({"summary": summary, "payload": payload, "heatmap_image": heatmap_image})
+        return req.future
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._pool.shutdown(wait=True)
+
+    # ---------- сборка батчей ----------
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.perf_counter() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    req = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if req is None:
+                    stop = True
+                    break
+                batch.append(req)
+
+            # predict_batch принимает один набор параметров — делим по ним
+            groups: Dict[tuple, List[_Request]] = {}
+            for req in batch:
+                groups.setdefault(req.key(), []).append(req)
+            for reqs in groups.values():
+                self._pool.submit(self._run, reqs)
+            if stop:
+                return
+
+    def _run(self, reqs: List[_Request]):
+        forced, mode, deferred = reqs[0].key()
+        try:
+            # карты — байтами в ответ, без временных файлов
+            results = P.predict_batch(
+                [r.image for r in reqs], forced_modality=forced,
+                max_batch_size=self.max_batch, heatmap="none" if deferred else mode,
+                heatmap_output="bytes",
+            )
+        except Exception as e:
+            for r in reqs:
+                r.future.set_exception(e)
+            return
+
+        for r, (summary, heatmap_image, payload) in zip(reqs, results):
+            key = {"ECG": "ecg", "MRI": "mri"}.get(payload["modality"], "xray")
+            payload["heatmap_path"] = None
+            if deferred and mode != "none":
+                heatmap_worker.submit(r.heatmap_path, P.render_and_cache, r.cache_key, summary,
+                                      dict(payload), r.image, key, payload["class_idx"],
+                                      r.heatmap_path, mode)
+                payload["heatmap_path"] = r.heatmap_path
+                payload["heatmap_pending"] = True
+            elif r.cache_key:
+                result_cache.cache.put(r.cache_key, key, summary, payload, heatmap_image)
+            payload["queue_ms"] = round((time.perf_counter() - r.enqueued) * 1000, 1)
+            r.future.set_result({"summary": summary, "payload": payload, "heatmap_image": heatmap_image})
+
+
+# ---------- HTTP ----------
+class _Handler(BaseHTTPRequestHandler):
+    batcher: DynamicBatcher = None  # type: ignore[assignment]
+
+    def log_message(self, fmt, *args):  # тихий режим
+        pass
+
+    def _send_json(self, code: int, data: Dict[str, Any]):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._send_json(404, {"error": "not found"})
+        self._send_json(200, {"status": "ok", "queue": self.batcher.qsize(),
+                              "models": P.registry.loaded(), "resources": resources.budget(),
+                              "cache": result_cache.cache.stats() if result_cache.ENABLED else None})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            return self._send_json(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+            req = json.loads(self.rfile.read(length))
+            img = Image.open(io.BytesIO(base64.b64decode(req["image"]))).convert("RGB")
+        except Exception as e:
+            return self._send_json(400, {"error": f"bad request: {e}"})
+        if req.get("heatmap_path"):
+            return self._send_json(400, {"error": "heatmap_path задаёт сервис (см. payload.heatmap_path)"})
+
+        try:
+            future = self.batcher.submit(
+                img, req.get("forced_modality"), req.get("heatmap"), bool(req.get("deferred")),
+                use_cache=bool(req.get("use_cache", True)),
+            )
+            res = future.result(timeout=REQUEST_TIMEOUT)
+        except Exception as e:
+            return self._send_json(500, {"error": str(e)})
+
+        hm = res["heatmap_image"]
+        self._send_json(200, {
+            "summary": res["summary"],
+            "payload": res["payload"],
+            "heatmap_image": base64.b64encode(hm).decode("ascii") if hm else None,
+        })
+
+
+def serve(host: str = HOST, port: int = PORT, max_batch: int = MAX_BATCH,
+          max_wait_ms: float = MAX_WAIT_MS, workers: int = WORKERS):
+    print(f"[INFERENCE] бюджет CPU: {resources.budget()}")
+    print(f"[INFERENCE] прогрев моделей, мс: {P.warm_up()}")
+    P.registry.start_watcher()
+    batcher = DynamicBatcher(max_batch=max_batch, max_wait_ms=max_wait_ms, workers=workers)
+    handler = type("Handler", (_Handler,), {"batcher": batcher})
+    httpd = ThreadingHTTPServer((host, port), handler)
+    print(f"[INFERENCE] http://{host}:{port}  batch≤{max_batch}, окно {max_wait_ms} мс, потоков {workers}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        batcher.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Локальный сервис инференса")
+    ap.add_argument("--host", default=HOST)
+    ap.add_argument("--port", type=int, default=PORT)
+    ap.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    ap.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    ap.add_argument("--workers", type=int, default=WORKERS)
+    a = ap.parse_args()
+    serve(a.host, a.port, a.max_batch, a.max_wait_ms, a.workers)
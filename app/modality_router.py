@@ -0,0 +1,98 @@
+# app/modality_router.py
+"""
+Лёгкий маршрутизатор модальности (ЭКГ / МРТ / ФЛГ) по статистикам изображения.
+
+Вместо трёх полных прогонов сетей считаем несколько признаков на миниатюре
+64×64 и относим снимок к ближайшему «прототипу» модальности:
+- ЭКГ — почти белый лист с тонкими линиями и цветной сеткой;
+- МРТ — тёмный фон, много почти чёрных пикселей;
+- ФЛГ — серый снимок со средними тонами и светлыми краями (плечи, диафрагма);
+  по яркости рамки (border) ФЛГ отличается от МРТ, у которой поле вокруг
+  головы тёмное даже на крупном плане.
+
+Если уверенность ниже порога или снимок далеко от всех прототипов (вне
+распределения: softmax по расстояниям уверен и тогда, когда ближайший
+прототип сам далеко) — predictor возвращается к голосованию моделей.
+"""
+from typing import Dict, Tuple
+
+import numpy as np
+from PIL import Image
+
+THUMB_SIZE = 64
+
+# порядок признаков: mean, white_frac, dark_frac, saturation, border
+FEATURES = ("mean", "white_frac", "dark_frac", "saturation", "border")
+
+# ширина рамки миниатюры для признака border, пикселей
+BORDER = 4
+
+# прототипы — средние признаки по images/ (bench/bench_detect.py --stats):
+# ecg — 24 снимка, mri — 38, xray — 2. Отложенный снимок ФЛГ
+# (tests/data/flg_holdout.png) в калибровку не входит — на нём
+# tests/test_modality_router.py проверяет, что прототип не подогнан под images/
+PROTOTYPES: Dict[str, Tuple[float, ...]] = {
+    "ecg":  (0.945, 0.907, 0.000, 0.011, 0.964),
+    "mri":  (0.192, 0.004, 0.406, 0.000, 0.057),
+    "xray": (0.645, 0.210, 0.049, 0.000, 0.546),
+}
+
+# «температура» softmax по расстояниям и порог уверенности
+TEMPERATURE = 0.05
+MIN_CONFIDENCE = 0.80
+# квадрат расстояния до ближайшего прототипа, дальше которого снимок считается
+# незнакомым. На images/ самые далёкие из верно распознанных — МРТ ~0.073,
+# отложенная ФЛГ — 0.056; МРТ с серым фоном (Te-no_0236, 0.17) и крупным
+# планом (Te-me_0012, 0.11 до ФЛГ) за порогом и определяются голосованием
+MAX_DISTANCE = 0.10
+
+
+def image_stats(pil_img: Image.Image) -> Dict[str, float]:
+    """
+    Признаки снимка на миниатюре THUMB_SIZE×THUMB_SIZE (значения 0..1).
+    """
+    img = pil_img
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    # draft() позволяет JPEG-декодеру сразу отдать уменьшенную копию
+    thumb = img.copy()
+    thumb.draft("RGB", (THUMB_SIZE * 2, THUMB_SIZE * 2))
+    thumb = thumb.convert("RGB").resize((THUMB_SIZE, THUMB_SIZE), Image.BILINEAR)
+
+    rgb = np.asarray(thumb, dtype=np.float32) / 255.0
+    gray = rgb.mean(axis=2)
+    sat = rgb.max(axis=2) - rgb.min(axis=2)
+    frame = np.ones_like(gray, dtype=bool)
+    frame[BORDER:-BORDER, BORDER:-BORDER] = False
+
+    return {
+        "mean": float(gray.mean()),
+        "white_frac": float((gray > 0.85).mean()),
+        "dark_frac": float((gray < 0.08).mean()),
+        "saturation": float(sat.mean()),
+        "border": float(gray[frame].mean()),
+    }
+
+
+def route_modality(pil_img: Image.Image) -> Tuple[str, float, Dict[str, float]]:
+    """
+    Возвращает (модальность, уверенность 0..1, вероятности по модальностям).
+    Снимок дальше MAX_DISTANCE от всех прототипов — уверенность 0.0.
+    """
+    stats = image_stats(pil_img)
+    f = np.array([stats[k] for k in FEATURES], dtype=np.float32)
+
+    names = list(PROTOTYPES)
+    protos = np.array([PROTOTYPES[n] for n in names], dtype=np.float32)
+    dist = ((protos - f) ** 2).sum(axis=1)
+
+    logits = -dist / TEMPERATURE
+    logits -= logits.max()
+    probs = np.exp(logits)
+    probs /= probs.sum()
+
+    scores = {n: float(p) for n, p in zip(names, probs)}
+    best = max(scores, key=scores.get)
+    if float(dist.min()) > MAX_DISTANCE:
+        return best, 0.0, scores
+    return best, scores[best], scores
@@ -0,0 +1,154 @@
+# app/model_loader.py
+"""
+Загрузка наших чекпойнтов без ImageNet-весов.
+
+Раньше архитектура строилась с weights=IMAGENET1K_V1: torchvision скачивал
+(или читал из кэша torch hub) ImageNet-чекпойнт, инициализировал им сеть,
+и тут же load_state_dict всё перезаписывал. Здесь:
+
+- архитектура строится без весов на meta-устройстве (без аллокации и
+  случайной инициализации), тензоры чекпойнта присваиваются напрямую
+  (load_state_dict(assign=True));
+- .pt читается через torch.load(mmap=True) — без копии в память;
+- если рядом лежит .safetensors и установлен пакет safetensors —
+  читаем его (zero-copy). Сконвертировать:
+      python -m app.model_loader convert models/model_ecg.pt
+"""
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import torch
+import torch.nn as nn
+from torchvision import models
+
+
+# ---------- архитектуры ----------
+def build_resnet18(num_classes: int) -> nn.Module:
+    m = models.resnet18(weights=None)
+    m.fc = nn.Linear(m.fc.in_features, num_classes)
+    return m
+
+
+def build_densenet121(num_classes: int) -> nn.Module:
+    m = models.densenet121(weights=None)
+    m.classifier = nn.Linear(m.classifier.in_features, num_classes)
+    return m
+
+
+ARCHITECTURES: Dict[str, Callable[[int], nn.Module]] = {
+    "resnet18": build_resnet18,
+    "densenet121": build_densenet121,
+}
+
+
+# ---------- чтение чекпойнта ----------
+def _safetensors_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".safetensors"
+
+
+def load_checkpoint(path: str, map_location="cpu") -> Any:
+    """
+    Читает чекпойнт: .safetensors (если есть рядом), иначе torch.load с mmap.
+    Старые чекпойнты (не zip-формат) читаются обычным torch.load.
+    """
+    st_path = path if path.endswith(".safetensors") else _safetensors_path(path)
+    if os.path.exists(st_path):
+        try:
+            from safetensors import safe_open
+            from safetensors.torch import load_file
+        except ImportError:
+            pass
+        else:
+            state = load_file(st_path, device=str(map_location))
+            with safe_open(st_path, framework="pt") as f:
+                metadata = f.metadata() or {}
+            if not metadata:
+                return state
+            return {"model_state": state, **{k: json.loads(v) for k, v in metadata.items()}}
+
+    last_error: Optional[Exception] = None
+    for kwargs in ({"mmap": True, "weights_only": True},
+                   {"weights_only": True},
+                   {}):
+        try:
+            return torch.load(path, map_location=map_location, **kwargs)
+        except Exception as e:
+            last_error = e
+    raise last_error
+
+
+def split_checkpoint(ckpt: Any) -> Tuple[Dict[str, torch.Tensor], Dict[str, Any]]:
+    """(state_dict, метаданные) — поддерживает {"model_state": ..., "classes": ...}."""
+    if isinstance(ckpt, dict) and "model_state" in ckpt:
+        extras = {k: v for k, v in ckpt.items() if k != "model_state"}
+        return ckpt["model_state"], extras
+    return ckpt, {}
+
+
+# ---------- сборка модели ----------
+def load_model(arch: str, num_classes: int, path: str,
+               device: Optional[torch.device] = None) -> Tuple[nn.Module, Dict[str, Any]]:
+    """
+    Строит архитектуру без весов и загружает в неё чекпойнт.
+    Возвращает (модель в eval-режиме на device, метаданные чекпойнта).
+    """
+    device = device or torch.device("cpu")
+    build = ARCHITECTURES[arch]
+    state, extras = split_checkpoint(load_checkpoint(path, map_location=device))
+
+    try:
+        with torch.device("meta"):
+            m = build(num_classes)
+        m.load_state_dict(state, assign=True)
+    except (TypeError, AttributeError):
+        # старый torch без meta-контекста / assign
+        m = build(num_classes)
+        m.load_state_dict(state)
+
+    # CAM берёт градиенты по активациям — параметры должны быть в графе
+    for p in m.parameters():
+        p.requires_grad_(True)
+    return m.to(device).eval(), extras
+
+
+def warm_up(loaders, input_sizes: Dict[str, Tuple[int, int]], device=None) -> Dict[str, float]:
+    """
+    Загружает модели и делает по одному пустому forward (инициализация
+    ядер/аллокатора). loaders — {modality: get_model}. Возвращает время, мс.
+    """
+    device = device or torch.device("cpu")
+    timings = {}
+    for modality, get_model in loaders.items():
+        t0 = time.perf_counter()
+        try:
+            model = get_model()
+            h, w = input_sizes[modality]
+            with torch.no_grad():
+                model(torch.zeros(1, 3, h, w, device=device))
+        except Exception as e:
+            print(f"[MODELS] прогрев {modality} не удался: {e}")
+            continue
+        timings[modality] = round((time.perf_counter() - t0) * 1000, 1)
+    return timings
+
+
+# ---------- конвертация в safetensors ----------
+def convert_to_safetensors(path: str) -> str:
+    from safetensors.torch import save_file
+
+    state, extras = split_checkpoint(torch.load(path, map_location="cpu"))
+    out = _safetensors_path(path)
+    metadata = {k: json.dumps(v) for k, v in extras.items()}
+    save_file({k: v.contiguous() for k, v in state.items()}, out, metadata=metadata or None)
+    return out
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "convert":
+        for p in sys.argv[2:]:
+            print(p, "->", convert_to_safetensors(p))
+    else:
+        print("usage: python -m app.model_loader convert models/*.pt")
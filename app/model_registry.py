@@ -0,0 +1,349 @@
+# app/model_registry.py
+"""
+Реестр моделей с версиями и горячей заменой без перезапуска.
+
+Структура models/:
+
+    models/
+      mri/
+        CURRENT                 <- имя активной версии (одна строка)
+        2025-11-01/
+          manifest.json
+          model.pt              <- или model.safetensors
+      model_ecg.pt              <- старые «плоские» файлы — версия "legacy"
+
+manifest.json:
+    {
+      "version": "2025-11-01",
+      "architecture": "resnet18",          # см. model_loader.ARCHITECTURES
+      "classes": ["glioma", "meningioma", "pituitary", "notumor"],
+      "num_classes": 4,                    # по умолчанию len(classes)
+      "input_size": [224, 224],
+      "normalization": {"mean": [...], "std": [...]},
+      "checkpoint": "model.pt",
+      "cam_layer": "layer4",
+      "cam_method": "smooth"
+    }
+
+Новая версия грузится в фоне и подменяет текущую атомарно: запросы, уже
+получившие ModelHandle, дорабатывают на старой модели. Каждый процесс
+(сервис инференса, панель) раз в WATCH_INTERVAL секунд перечитывает CURRENT.
+
+    python -m app.model_registry list
+    python -m app.model_registry activate mri 2025-11-01
+"""
+import json
+import os
+import sys
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+import torch
+from torchvision import transforms
+
+from . import optimize
+from .cam_engine import CamEngine
+from .model_loader import load_model
+from .preprocess import ImageLike, prepare
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+MODELS_DIR = os.path.join(BASE_DIR, "models")
+WATCH_INTERVAL = float(os.environ.get("MODEL_WATCH_INTERVAL", "10"))
+
+MODALITIES = ("ecg", "mri", "xray")
+DEFAULT_NORMALIZATION = {"mean": [0.485, 0.456, 0.406], "std": [0.229, 0.224, 0.225]}
+
+# модели, лежащие плоскими файлами в models/, как до появления реестра
+LEGACY_MANIFESTS: Dict[str, Dict[str, Any]] = {
+    "ecg": {
+        "version": "legacy",
+        "architecture": "resnet18",
+        "classes": ["Arrhythmia", "Critical", "Normal"],
+        "input_size": [256, 256],
+        "checkpoint": "model_ecg.pt",
+        "cam_layer": "layer4",
+        "cam_method": "smooth",
+    },
+    "mri": {
+        "version": "legacy",
+        "architecture": "resnet18",
+        "classes": ["glioma", "meningioma", "pituitary", "notumor"],
+        "input_size": [224, 224],
+        "checkpoint": "model_mri_diagnosis.pt",
+        "cam_layer": "layer4",
+        "cam_method": "smooth",
+    },
+    "xray": {
+        # обучалка — как у тебя: один логит «патология»
+        "version": "legacy",
+        "architecture": "densenet121",
+        "classes": ["pathology"],
+        "num_classes": 1,
+        "input_size": [320, 320],
+        "checkpoint": "model_tuberculosis.pt",
+        # для DenseNet121 берём поздний conv:
+        # подойдут: "features.denseblock4.denselayer16.conv2" или "features.norm5" (но conv даёт картинку детальнее)
+        "cam_layer": "features.denseblock4.denselayer16.conv2",
+        "cam_method": "gradcam",
+    },
+}
+
+
+def build_transform(manifest: Dict[str, Any]):
+    """
+    torchvision-цепочка, с которой обучались чекпойнты. В инференсе не
+    используется (там preprocess.Prepared) — это эталон для сравнения
+    в bench/bench_preprocess.py.
+    """
+    h, w = manifest["input_size"]
+    norm = manifest.get("normalization") or DEFAULT_NORMALIZATION
+    return transforms.Compose([
+        transforms.Resize((h, w)),
+        transforms.ToTensor(),
+        transforms.Normalize(norm["mean"], norm["std"]),
+    ])
+
+
+def build_preprocess(manifest: Dict[str, Any]) -> Callable[[ImageLike], torch.Tensor]:
+    """Снимок -> (3, h, w) для модели из общего буфера снимка (см. preprocess.Prepared)."""
+    size = tuple(manifest["input_size"])
+    norm = manifest.get("normalization") or DEFAULT_NORMALIZATION
+
+    def preprocess(img: ImageLike) -> torch.Tensor:
+        return prepare(img).tensor(size, norm["mean"], norm["std"])
+    return preprocess
+
+
+class ModelHandle:
+    """
+    Загруженная версия модели: сеть, препроцессинг, классы, движок CAM.
+    model — float-модель (на ней считается CAM); fast_model — необязательная
+    оптимизированная копия для проходов без графа (см. app/optimize.py).
+    """
+
+    def __init__(self, modality: str, manifest: Dict[str, Any], model: torch.nn.Module,
+                 fast_model: Optional[torch.nn.Module] = None, channels_last: bool = False):
+        self.modality = modality
+        self.manifest = manifest
+        self.version: str = manifest["version"]
+        self.model = model
+        self.fast_model = fast_model
+        self.channels_last = channels_last
+        self.classes: List[str] = list(manifest["classes"])
+        self.input_size = tuple(manifest["input_size"])
+        self._preprocess = build_preprocess(manifest)
+        self._cam_engine: Optional[CamEngine] = None
+        self._lock = threading.Lock()
+
+    def preprocess(self, img: ImageLike) -> torch.Tensor:
+        """(3, h, w) для модели — из общего буфера снимка (см. preprocess.Prepared)."""
+        return self._preprocess(img)
+
+    def infer(self, x: torch.Tensor) -> torch.Tensor:
+        """Классификационный проход без графа (оптимизированная копия, если есть)."""
+        with torch.inference_mode():
+            if self.fast_model is None:
+                return self.model(x)
+            if self.channels_last:
+                x = x.contiguous(memory_format=torch.channels_last)
+            return self.fast_model(x)
+
+    def cam_engine(self) -> CamEngine:
+        """Один CamEngine (один хук) на модель на всё время её жизни."""
+        if self._cam_engine is None:
+            with self._lock:
+                if self._cam_engine is None:
+                    self._cam_engine = CamEngine(self.model, self.manifest["cam_layer"],
+                                                 self.manifest.get("cam_method", "smooth"))
+        return self._cam_engine
+
+    def close(self):
+        with self._lock:
+            if self._cam_engine is not None:
+                self._cam_engine.close()
+                self._cam_engine = None
+
+
+class ModelRegistry:
+    def __init__(self, root: str = MODELS_DIR, device: Optional[torch.device] = None):
+        self.root = root
+        self.device = device or torch.device("cpu")
+        self._handles: Dict[str, ModelHandle] = {}
+        self._locks = {m: threading.Lock() for m in MODALITIES}
+        self._listeners: List[Callable[[str, str, str], None]] = []
+        self._loading: Dict[str, Future] = {}
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # ---------- манифесты ----------
+    def versions(self, modality: str) -> List[str]:
+        d = os.path.join(self.root, modality)
+        found = []
+        if os.path.isdir(d):
+            found = sorted(v for v in os.listdir(d)
+                           if os.path.exists(os.path.join(d, v, "manifest.json")))
+        legacy = os.path.join(self.root, LEGACY_MANIFESTS[modality]["checkpoint"])
+        return (["legacy"] if os.path.exists(legacy) else []) + found
+
+    def current_version(self, modality: str) -> str:
+        """Версия из models/<modality>/CURRENT, иначе самая новая, иначе legacy."""
+        current = os.path.join(self.root, modality, "CURRENT")
+        if os.path.exists(current):
+            with open(current, encoding="utf-8") as f:
+                version = f.read().strip()
+            if version:
+                return version
+        versions = self.versions(modality)
+        return versions[-1] if versions else "legacy"
+
+    def manifest(self, modality: str, version: str) -> Dict[str, Any]:
+        if version == "legacy":
+            m = dict(LEGACY_MANIFESTS[modality])
+            m["checkpoint"] = os.path.join(self.root, m["checkpoint"])
+        else:
+            vdir = os.path.join(self.root, modality, version)
+            with open(os.path.join(vdir, "manifest.json"), encoding="utf-8") as f:
+                m = json.load(f)
+            m.setdefault("version", version)
+            m["checkpoint"] = os.path.join(vdir, m.get("checkpoint", "model.pt"))
+            for key in ("architecture", "classes", "input_size", "cam_layer", "cam_method"):
+                m.setdefault(key, LEGACY_MANIFESTS[modality][key])
+        m.setdefault("num_classes", len(m["classes"]))
+        m.setdefault("normalization", DEFAULT_NORMALIZATION)
+        m["modality"] = modality
+        return m
+
+    def _load(self, modality: str, version: str) -> ModelHandle:
+        manifest = self.manifest(modality, version)
+        model, extras = load_model(manifest["architecture"], manifest["num_classes"],
+                                   manifest["checkpoint"], self.device)
+        # старые чекпойнты МРТ хранят порядок классов внутри
+        if version == "legacy" and "classes" in extras:
+            manifest["classes"] = list(extras["classes"])
+
+        fast_model = None
+        if optimize.ENABLED:
+            try:
+                fast_model = optimize.optimize_model(
+                    model, modality, manifest["input_size"], build_preprocess(manifest),
+                    optimize.ENABLED, self.device,
+                )
+            except Exception as e:
+                print(f"[OPTIMIZE] {modality}@{version}: оптимизация не удалась, работаем в fp32: {e}")
+        return ModelHandle(modality, manifest, model, fast_model,
+                           channels_last="channels_last" in optimize.ENABLED)
+
+    # ---------- доступ ----------
+    def get(self, modality: str) -> ModelHandle:
+        """
+        Текущая версия модели. Запрос должен взять handle один раз и работать
+        с ним до конца — тогда замена версии его не затронет.
+        """
+        handle = self._handles.get(modality)
+        if handle is None:
+            with self._locks[modality]:
+                handle = self._handles.get(modality)
+                if handle is None:
+                    handle = self._handles[modality] = self._load(modality, self.current_version(modality))
+        return handle
+
+    def loaded(self) -> Dict[str, str]:
+        return {m: h.version for m, h in self._handles.items()}
+
+    def subscribe(self, callback: Callable[[str, str, str], None]):
+        """callback(modality, old_version, new_version) — после каждой замены."""
+        self._listeners.append(callback)
+
+    # ---------- замена версий ----------
+    def activate(self, modality: str, version: Optional[str] = None) -> Future:
+        """
+        Загружает версию в фоновом потоке и атомарно подменяет текущую.
+        Старый handle не закрывается: запросы, взявшие его, доработают на нём.
+        """
+        version = version or self.current_version(modality)
+        key = f"{modality}@{version}"
+        with self._locks[modality]:
+            if key in self._loading:
+                return self._loading[key]
+            future: Future = Future()
+            self._loading[key] = future
+
+        def job():
+            try:
+                new = self._load(modality, version)
+                with self._locks[modality]:
+                    old = self._handles.get(modality)
+                    self._handles[modality] = new
+                old_version = old.version if old else ""
+                print(f"[MODELS] {modality}: {old_version or '—'} -> {new.version}")
+                for cb in list(self._listeners):
+                    try:
+                        cb(modality, old_version, new.version)
+                    except Exception as e:
+                        print(f"[MODELS] обработчик замены упал: {e}")
+                future.set_result(new)
+            except Exception as e:
+                print(f"[MODELS] не удалось загрузить {key}: {e}")
+                future.set_exception(e)
+            finally:
+                with self._locks[modality]:
+                    self._loading.pop(key, None)
+
+        threading.Thread(target=job, name=f"model-load-{modality}", daemon=True).start()
+        return future
+
+    def refresh(self) -> List[Future]:
+        """Перечитывает CURRENT и подгружает сменившиеся версии уже загруженных моделей."""
+        futures = []
+        for modality, handle in list(self._handles.items()):
+            version = self.current_version(modality)
+            if version != handle.version:
+                futures.append(self.activate(modality, version))
+        return futures
+
+    def start_watcher(self, interval: float = WATCH_INTERVAL):
+        if self._watcher is not None or interval <= 0:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"[MODELS] ошибка проверки версий: {e}")
+
+        self._watcher = threading.Thread(target=loop, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+
+    # ---------- публикация ----------
+    def set_current(self, modality: str, version: str):
+        """Делает версию активной для всех процессов (пишет CURRENT атомарно)."""
+        if version not in self.versions(modality):
+            raise ValueError(f"Нет версии {modality}@{version}")
+        d = os.path.join(self.root, modality)
+        os.makedirs(d, exist_ok=True)
+        tmp = os.path.join(d, "CURRENT.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(version + "\n")
+        os.replace(tmp, os.path.join(d, "CURRENT"))
+
+
+registry = ModelRegistry(device=torch.device("cuda" if torch.cuda.is_available() else "cpu"))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args[:1] == ["list"]:
+        for m in MODALITIES:
+            current = registry.current_version(m)
+            versions = [f"*{v}" if v == current else v for v in registry.versions(m)]
+            print(f"{m:<5} {' '.join(versions) or '—'}")
+    elif args[:1] == ["activate"] and len(args) == 3:
+        registry.set_current(args[1], args[2])
+        print(f"{args[1]} -> {args[2]} (процессы подхватят в течение {WATCH_INTERVAL:.0f} с)")
+    else:
+        print("usage: python -m app.model_registry list | activate <modality> <version>")
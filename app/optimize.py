@@ -0,0 +1,127 @@
+# app/optimize.py
+"""
+Оптимизированный CPU-инференс для классификационного прохода (opt-in).
+
+INFERENCE_OPTIMIZE — список через запятую:
+    channels_last  — формат памяти NHWC (быстрее свёртки oneDNN на CPU)
+    int8           — динамическая int8-квантизация Linear-слоёв
+    int8_static    — статическая int8-квантизация (FX), калибровка на images/
+    trace          — torch.jit.trace + freeze + optimize_for_inference
+    compile        — torch.compile
+
+Оптимизированная копия используется только там, где граф не нужен:
+голосование модальностей, диагноз без карты / с отложенной картой, батчи
+без карт. Тепловая карта считается на исходной float-модели («тень»),
+поэтому Grad-CAM работает как раньше.
+
+Расхождение с fp32 проверяется на images/: python bench/bench_optimized.py
+"""
+import copy
+import glob
+import os
+from typing import Callable, Dict, Iterable, List, Sequence, Set
+
+import torch
+import torch.nn as nn
+from PIL import Image
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+IMAGES_DIR = os.path.join(BASE_DIR, "images")
+
+OPTIONS = ("channels_last", "int8", "int8_static", "trace", "compile")
+# папки с примерами для калибровки по модальности
+CALIBRATION_FOLDERS = {"ecg": "ecg", "mri": "mri", "xray": "flg"}
+
+
+def parse_options(value: str) -> Set[str]:
+    opts = {o.strip() for o in (value or "").split(",") if o.strip()}
+    unknown = opts - set(OPTIONS)
+    if unknown:
+        raise ValueError(f"Неизвестные опции INFERENCE_OPTIMIZE: {', '.join(sorted(unknown))}")
+    return opts
+
+
+ENABLED = parse_options(os.environ.get("INFERENCE_OPTIMIZE", ""))
+
+
+def sample_paths(modality: str, limit: int = 16) -> List[str]:
+    folder = CALIBRATION_FOLDERS[modality]
+    return sorted(glob.glob(os.path.join(IMAGES_DIR, folder, "*", "*")))[:limit]
+
+
+def calibration_batches(modality: str, preprocess: Callable, batch_size: int = 8) -> Iterable[torch.Tensor]:
+    """
+    Батчи примеров из images/. preprocess — тот же, что в инференсе
+    (ModelHandle.preprocess / model_registry.build_preprocess), чтобы
+    калибровка видела те же входы, что и модель в работе.
+    """
+    paths = sample_paths(modality)
+    for i in range(0, len(paths), batch_size):
+        yield torch.stack([preprocess(Image.open(p)) for p in paths[i:i + batch_size]])
+
+
+def optimize_model(model: nn.Module, modality: str, input_size: Sequence[int],
+                   preprocess: Callable, options: Set[str],
+                   device: torch.device = torch.device("cpu")) -> nn.Module:
+    """
+    Возвращает оптимизированную копию модели; исходная (float) не меняется.
+    """
+    m = copy.deepcopy(model).eval()
+    for p in m.parameters():
+        p.requires_grad_(False)
+    h, w = input_size
+    example = torch.zeros(1, 3, h, w, device=device)
+
+    if options & {"int8", "int8_static"} and device.type != "cpu":
+        print("[OPTIMIZE] int8-квантизация доступна только на CPU — пропускаю")
+        options = options - {"int8", "int8_static"}
+
+    if "int8_static" in options:
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+        prepared = prepare_fx(m, get_default_qconfig_mapping("x86"), (example,))
+        with torch.inference_mode():
+            for x in calibration_batches(modality, preprocess):
+                prepared(x)
+        m = convert_fx(prepared)
+    elif "int8" in options:
+        m = torch.ao.quantization.quantize_dynamic(m, {nn.Linear}, dtype=torch.qint8)
+
+    if "channels_last" in options:
+        m = m.to(memory_format=torch.channels_last)
+        example = example.contiguous(memory_format=torch.channels_last)
+
+    if "trace" in options:
+        with torch.no_grad():
+            traced = torch.jit.trace(m, example)
+            m = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+    elif "compile" in options:
+        m = torch.compile(m)
+
+    # первый прогон: трассировка / компиляция не должна попасть в первый запрос
+    with torch.inference_mode():
+        m(example)
+    return m
+
+
+@torch.inference_mode()
+def compare(float_model: nn.Module, fast_infer: Callable[[torch.Tensor], torch.Tensor],
+            batches: Iterable[torch.Tensor], binary: bool = False) -> Dict[str, float]:
+    """
+    Сравнение с fp32: доля совпадений top-1 и максимальное отклонение вероятности.
+    """
+    total = agree = 0
+    max_diff = 0.0
+    for x in batches:
+        ref, fast = float_model(x), fast_infer(x)
+        if binary:
+            p_ref, p_fast = torch.sigmoid(ref).flatten(), torch.sigmoid(fast).flatten()
+            agree += int(((p_ref >= 0.5) == (p_fast >= 0.5)).sum())
+            max_diff = max(max_diff, float((p_ref - p_fast).abs().max()))
+        else:
+            p_ref, p_fast = torch.softmax(ref, 1), torch.softmax(fast, 1)
+            agree += int((p_ref.argmax(1) == p_fast.argmax(1)).sum())
+            max_diff = max(max_diff, float((p_ref - p_fast).abs().max()))
+        total += x.shape[0]
+    return {"n": total, "top1_agreement": agree / max(total, 1), "max_prob_diff": max_diff}
@@ -1,125 +1,167 @@
 # app/predictor.py
 import os
-from typing import Dict, Any, Optional
+import threading
+import uuid
+from typing import Dict, Any, List, Optional, Sequence, Tuple
 
 import torch
-import torch.nn as nn
 import numpy as np
 from PIL import Image
-from torchvision import models, transforms
-from torchcam.methods import SmoothGradCAMpp, GradCAM
 
-from .utils_gradcam import overlay_heatmap_on_image, cam_to_numpy
+from .utils_gradcam import overlay_heatmap_on_array, cam_to_numpy
+from .model_loader import warm_up as _warm_up
+from .model_registry import ModelHandle, registry
+from .modality_router import route_modality, MIN_CONFIDENCE as ROUTER_MIN_CONFIDENCE
+from . import artifacts, resources, result_cache
+from .artifacts import encode_heatmap, pack_cam, write_atomic
+from .preprocess import ImageLike, as_pil, prepare
 
 # === Пути к моделям ===
+# версии, манифесты и загрузка — в model_registry; плоские файлы ниже — версия "legacy"
 BASE_DIR   = os.path.dirname(os.path.dirname(__file__))
 MODELS_DIR = os.path.join(BASE_DIR, "models")
 PATH_ECG   = os.path.join(MODELS_DIR, "model_ecg.pt")
 PATH_MRI   = os.path.join(MODELS_DIR, "model_mri_diagnosis.pt")
 PATH_XRAY  = os.path.join(MODELS_DIR, "model_tuberculosis.pt")
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-
-# === Трансформации ===
-tf_ecg = transforms.Compose([
-    transforms.Resize((256, 256)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406],[0.229, 0.224, 0.225])
-])
-tf_mri = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406],[0.229, 0.224, 0.225])
-])
-tf_xray = transforms.Compose([
-    transforms.Resize((320, 320)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406],[0.229, 0.224, 0.225])
-])
-
-# === Глобальные модели ===
-_ecg_model:  Optional[nn.Module] = None
-_mri_model:  Optional[nn.Module] = None
-_xray_model: Optional[nn.Module] = None
-_mri_classes = ["glioma", "meningioma", "pituitary", "notumor"]
+device = registry.device
+
+# потоки torch, привязка к ядрам, лимит одновременных прогнозов — см. resources
+resources.configure()
+
+# максимальный размер микробатча в predict_batch
+MAX_BATCH_SIZE = int(os.environ.get("PREDICT_MAX_BATCH", "16"))
+
+# качество тепловой карты:
+#   "none"   — без карты
+#   "fast"   — Grad-CAM, один проход
+#   "smooth" — SmoothGrad-CAM++ для ЭКГ/МРТ (для ФЛГ — Grad-CAM), как раньше
+HEATMAP_MODES = ("none", "fast", "smooth")
+HEATMAP_MODE = os.environ.get("HEATMAP_MODE", "smooth")
+# отложенная карта: диагноз возвращается сразу, карту пишет фоновый поток
+HEATMAP_DEFERRED = os.environ.get("HEATMAP_DEFERRED", "0") == "1"
 
 # ---------- загрузчики моделей ----------
+# текущая версия берётся из реестра на каждый запрос — после горячей замены
+# новые запросы идут в новую модель, начатые дорабатывают на старой
+def get_handle(modality: str) -> ModelHandle:
+    handle = registry.get(modality)
+    registry.start_watcher()
+    return handle
+
 def get_ecg_model():
-    global _ecg_model
-    if _ecg_model is None:
-        m = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1)
-        m.fc = nn.Linear(m.fc.in_features, 3)
-        m.load_state_dict(torch.load(PATH_ECG, map_location=device))
-        _ecg_model = m.to(device).eval()
-    return _ecg_model
+    return get_handle("ecg").model
 
 def get_mri_model():
-    global _mri_model, _mri_classes
-    if _mri_model is None:
-        m = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1)
-        m.fc = nn.Linear(m.fc.in_features, 4)
-        ckpt = torch.load(PATH_MRI, map_location=device)
-        if isinstance(ckpt, dict) and "model_state" in ckpt:
-            m.load_state_dict(ckpt["model_state"])
-            if "classes" in ckpt:
-                _mri_classes = ckpt["classes"]
-        else:
-            m.load_state_dict(ckpt)
-        _mri_model = m.to(device).eval()
-    return _mri_model
+    return get_handle("mri").model
 
 def get_xray_model():
-    global _xray_model
-    if _xray_model is None:
-        m = models.densenet121(weights=None)  # обучалка — как у тебя
-        num_ftrs = m.classifier.in_features
-        m.classifier = nn.Linear(num_ftrs, 1)
-        m.load_state_dict(torch.load(PATH_XRAY, map_location=device))
-        _xray_model = m.to(device).eval()
-    return _xray_model
+    return get_handle("xray").model
+
+# ---------- прямой проход с сохранением промежуточных результатов ----------
+def run_stage(modality: str, pil_img: ImageLike, with_cam: bool = True,
+              x: Optional[torch.Tensor] = None,
+              handle: Optional[ModelHandle] = None) -> Dict[str, Any]:
+    """
+    Препроцессинг + forward одной модели.
+    Возвращает stage: {"modality", "handle", "x", "out", "cam"} — его можно передать
+    в predict_ecg / predict_mri / predict_xray, чтобы не считать заново.
+    with_cam=True — forward с графом и захватом активации (нужен для тепловой карты).
+    """
+    handle = handle or get_handle(modality)
+    if x is None:
+        x = handle.preprocess(pil_img).unsqueeze(0).to(device)
+
+    cam = None
+    if with_cam:
+        # ВАЖНО: для CAM — forward с графом
+        cam = handle.cam_engine().forward(x)
+        out = cam.out
+    else:
+        out = handle.infer(x)
+    return {"modality": modality, "handle": handle, "x": x, "out": out, "cam": cam}
+
+def release_stage(stage: Optional[Dict[str, Any]]) -> None:
+    """Отпускает граф прохода, если stage больше не нужен."""
+    if stage:
+        stage["cam"] = None
+
+def _stage_confidence(stage: Dict[str, Any]) -> float:
+    out = stage["out"].detach()
+    if stage["modality"] == "xray":
+        p = torch.sigmoid(out).item()
+        return float(max(p, 1 - p))
+    return float(torch.softmax(out, dim=1)[0].max().item())
+
+def _prepare(modality: str, pil_img: ImageLike, need_cam: bool,
+             stage: Optional[Dict[str, Any]]):
+    """
+    Возвращает (stage, reused): берёт готовый stage из детекции, если он есть,
+    и досчитывает только то, чего не хватает для тепловой карты.
+    """
+    if stage is None or stage.get("modality") != modality:
+        return run_stage(modality, pil_img, with_cam=need_cam), []
+    if need_cam and stage.get("cam") is None:
+        # логиты без графа — для CAM нужен новый forward, тензор берём готовый
+        return run_stage(modality, pil_img, with_cam=True, x=stage["x"],
+                         handle=stage["handle"]), ["preprocess"]
+    return stage, ["preprocess", "forward"]
 
 # ---------- автоопределение модальности ----------
-def detect_type(pil_img: Image.Image) -> str:
+def detect_by_vote(pil_img: ImageLike, keep: Optional[Dict[str, Dict[str, Any]]] = None,
+                   with_cam: bool = False) -> str:
+    """
+    Медленный путь: прогоняет все три модели и выбирает самую уверенную.
+    keep — если передан словарь, в него складываются stage каждой модели,
+    чтобы диагноз мог переиспользовать forward победителя.
+    """
+    pil_img = prepare(pil_img)
+    handles = {}
+    for modality in ("ecg", "mri", "xray"):
+        try:
+            handles[modality] = get_handle(modality)
+        except Exception:
+            pass
+    # все размеры сразу, от большего к меньшему (в режиме fast — каскадом)
+    pil_img.pyramid([h.input_size for h in handles.values()])
+
     conf = {}
-    try:
-        ecg = get_ecg_model()
-        x = tf_ecg(pil_img).unsqueeze(0).to(device)
-        with torch.no_grad(): conf["ecg"] = float(torch.softmax(ecg(x), dim=1)[0].max().item())
-    except: conf["ecg"] = 0.0
-    try:
-        mri = get_mri_model()
-        x = tf_mri(pil_img).unsqueeze(0).to(device)
-        with torch.no_grad(): conf["mri"] = float(torch.softmax(mri(x), dim=1)[0].max().item())
-    except: conf["mri"] = 0.0
-    try:
-        xray = get_xray_model()
-        x = tf_xray(pil_img).unsqueeze(0).to(device)
-        with torch.no_grad():
-            p = torch.sigmoid(xray(x)).item()
-            conf["xray"] = float(max(p, 1 - p))
-    except: conf["xray"] = 0.0
+    for modality in ("ecg", "mri", "xray"):
+        try:
+            stage = run_stage(modality, pil_img, with_cam=with_cam, handle=handles[modality])
+            conf[modality] = _stage_confidence(stage)
+            if keep is not None:
+                keep[modality] = stage
+            else:
+                release_stage(stage)
+        except Exception:
+            conf[modality] = 0.0
     return max(conf, key=conf.get)
 
+def _detect(pil_img: ImageLike, keep: Optional[Dict[str, Dict[str, Any]]] = None,
+            with_cam: bool = False):
+    """Возвращает (модальность, способ: "router" | "vote")."""
+    try:
+        modality, confidence, _ = route_modality(as_pil(pil_img))
+    except Exception:
+        modality, confidence = None, 0.0
+    if modality and confidence >= ROUTER_MIN_CONFIDENCE:
+        return modality, "router"
+    return detect_by_vote(pil_img, keep=keep, with_cam=with_cam), "vote"
+
+def detect_type(pil_img: ImageLike) -> str:
+    """
+    Быстрый маршрутизатор по статистикам снимка (один дешёвый проход);
+    при низкой уверенности — голосование трёх моделей.
+    """
+    return _detect(pil_img)[0]
+
 # ---------- ЭКГ ----------
-def predict_ecg(pil_img: Image.Image, save_heatmap_path: Optional[str]) -> Dict[str, Any]:
-    classes = ["Arrhythmia", "Critical", "Normal"]
-    model = get_ecg_model()
-    x = tf_ecg(pil_img).unsqueeze(0).to(device)
-
-    # 1) прямой проход ДЛЯ CAM (без no_grad!)
-    cam_extractor = SmoothGradCAMpp(model, target_layer="layer4")
-    out = model(x)
-    probs = torch.softmax(out, dim=1)[0]
+def _ecg_result(out_row: torch.Tensor, classes: Sequence[str]) -> Tuple[Dict[str, Any], int]:
+    """Логиты одного снимка -> (результат без тепловой карты, индекс класса)."""
+    probs = torch.softmax(out_row.detach(), dim=0)
     cls_idx = int(torch.argmax(probs).item())
-    prob = float(probs[cls_idx].detach().cpu().item() * 100)
-
-    heatmap_path = None
-    if save_heatmap_path:
-        cams = cam_extractor(cls_idx, out)
-        hm = cam_to_numpy(cams)
-        overlay = overlay_heatmap_on_image(pil_img, hm, (256, 256), alpha=0.5)
-        import cv2; cv2.imwrite(save_heatmap_path, overlay)
-        heatmap_path = save_heatmap_path
+    prob = float(probs[cls_idx].cpu().item() * 100)
 
     label = classes[cls_idx]
     diagnosis = {
@@ -128,20 +170,33 @@ def predict_ecg(pil_img: Image.Image, save_heatmap_path: Optional[str]) -> Dict[
         "Critical":   "Критические изменения миокарда. Требуется срочная помощь."
     }[label]
 
-    return {"modality":"ECG","label":label,"probability":round(prob,2),"diagnosis":diagnosis,"heatmap_path":heatmap_path}
+    return {"modality":"ECG","label":label,"probability":round(prob,2),"diagnosis":diagnosis}, cls_idx
 
-# ---------- МРТ ----------
-def predict_mri(pil_img: Image.Image, save_heatmap_path: Optional[str]) -> Dict[str, Any]:
-    model = get_mri_model()
-    x = tf_mri(pil_img).unsqueeze(0).to(device)
+# параметры после снимка — только по имени: раньше вторым позиционным был
+# save_heatmap_path, и старый вызов predict_ecg(img, path) должен падать, а не
+# молча считать карту, которую некуда сохранить
+def predict_ecg(pil_img: ImageLike, *, with_heatmap: bool = False,
+                stage: Optional[Dict[str, Any]] = None,
+                cam_method: Optional[str] = None) -> Dict[str, Any]:
+    stage, reused = _prepare("ecg", pil_img, with_heatmap, stage)
+    out = stage["out"]
+    result, cls_idx = _ecg_result(out[0], stage["handle"].classes)
+
+    heatmap_image = None
+    if with_heatmap:
+        cams = stage["handle"].cam_engine().cam(stage["cam"], cls_idx, cam_method)
+        heatmap_image = _heatmap_bytes(pil_img, cam_to_numpy(cams), stage["handle"].input_size)
+
+    result.update({"heatmap_image": heatmap_image, "reused": reused, "class_idx": cls_idx,
+                   "model_version": stage["handle"].version})
+    return result
 
-    cam_extractor = SmoothGradCAMpp(model, target_layer="layer4")
-    out = model(x)
-    probs = torch.softmax(out, dim=1)[0]
+# ---------- МРТ ----------
+def _mri_result(out_row: torch.Tensor, classes: Sequence[str]) -> Tuple[Dict[str, Any], int]:
+    probs = torch.softmax(out_row.detach(), dim=0)
     cls_idx = int(torch.argmax(probs).item())
     prob = float(probs[cls_idx].item() * 100)
 
-    classes = list(_mri_classes)
     label = classes[cls_idx]
 
     # === логика риска ===
@@ -152,14 +207,6 @@ def predict_mri(pil_img: Image.Image, save_heatmap_path: Optional[str]) -> Dict[
     else:
         risk_level = "low"
 
-    heatmap_path = None
-    if save_heatmap_path:
-        cams = cam_extractor(cls_idx, out)
-        hm = cam_to_numpy(cams)
-        overlay = overlay_heatmap_on_image(pil_img, hm, (224, 224), alpha=0.5)
-        import cv2; cv2.imwrite(save_heatmap_path, overlay)
-        heatmap_path = save_heatmap_path
-
     diagnosis_map = {
         "glioma":     "Глиома — вероятно злокачественное образование.",
         "meningioma": "Менингиома — чаще доброкачественная, требуется наблюдение.",
@@ -173,23 +220,28 @@ def predict_mri(pil_img: Image.Image, save_heatmap_path: Optional[str]) -> Dict[
         "probability": round(prob, 2),
         "diagnosis": diagnosis_map.get(label, "Описание недоступно"),
         "risk_level": risk_level,
-        "heatmap_path": heatmap_path
-    }
+    }, cls_idx
 
+def predict_mri(pil_img: ImageLike, *, with_heatmap: bool = False,
+                stage: Optional[Dict[str, Any]] = None,
+                cam_method: Optional[str] = None) -> Dict[str, Any]:
+    stage, reused = _prepare("mri", pil_img, with_heatmap, stage)
+    out = stage["out"]
+    result, cls_idx = _mri_result(out[0], stage["handle"].classes)
 
-# ---------- ФЛГ (X-ray) с Grad-CAM ----------
-def predict_xray(pil_img: Image.Image, save_heatmap_path: Optional[str]) -> Dict[str, Any]:
-    model = get_xray_model()
-    x = tf_xray(pil_img).unsqueeze(0).to(device)
+    heatmap_image = None
+    if with_heatmap:
+        cams = stage["handle"].cam_engine().cam(stage["cam"], cls_idx, cam_method)
+        heatmap_image = _heatmap_bytes(pil_img, cam_to_numpy(cams), stage["handle"].input_size)
 
-    # ВАЖНО: для CAM — делаем forward без no_grad
-    # Таргет-слой для DenseNet121 — берём поздний conv:
-    # подойдут: "features.denseblock4.denselayer16.conv2" или "features.norm5" (но conv даёт картинку детальнее)
-    target_layer = "features.denseblock4.denselayer16.conv2"
-    cam_extractor = GradCAM(model, target_layer=target_layer)
+    result.update({"heatmap_image": heatmap_image, "reused": reused, "class_idx": cls_idx,
+                   "model_version": stage["handle"].version})
+    return result
 
-    out = model(x)                                # forward для CAM
-    p = torch.sigmoid(out).detach().cpu().item()  # вероятность патологии
+
+# ---------- ФЛГ (X-ray) с Grad-CAM ----------
+def _xray_result(out_row: torch.Tensor, classes: Sequence[str]) -> Tuple[Dict[str, Any], int]:
+    p = torch.sigmoid(out_row.detach()).cpu().item()  # вероятность патологии
 
     # Уровень риска
     if p >= 0.85:
@@ -205,29 +257,130 @@ def predict_xray(pil_img: Image.Image, save_heatmap_path: Optional[str]) -> Dict
         diagnosis = "Признаков патологии не выявлено."
         risk_level = "low"
 
-    heatmap_path = None
-    if save_heatmap_path:
-        cams = cam_extractor(class_idx=0, scores=out)  # бинарная задача — class_idx=0
-        hm = cam_to_numpy(cams)
-        overlay = overlay_heatmap_on_image(pil_img, hm, (320, 320), alpha=0.5)
-        import cv2; cv2.imwrite(save_heatmap_path, overlay)
-        heatmap_path = save_heatmap_path
-
     return {
         "modality":"X-ray",
         "label":label,
         "probability":round(p*100, 2),
         "diagnosis":diagnosis,
         "risk_level":risk_level,
-        "heatmap_path":heatmap_path
-    }
+    }, 0  # бинарная задача — class_idx=0
+
+def predict_xray(pil_img: ImageLike, *, with_heatmap: bool = False,
+                 stage: Optional[Dict[str, Any]] = None,
+                 cam_method: Optional[str] = None) -> Dict[str, Any]:
+    stage, reused = _prepare("xray", pil_img, with_heatmap, stage)
+    out = stage["out"]
+    result, cls_idx = _xray_result(out[0], stage["handle"].classes)
+
+    heatmap_image = None
+    if with_heatmap:
+        cams = stage["handle"].cam_engine().cam(stage["cam"], cls_idx, cam_method)
+        heatmap_image = _heatmap_bytes(pil_img, cam_to_numpy(cams), stage["handle"].input_size)
+
+    result.update({"heatmap_image": heatmap_image, "reused": reused, "class_idx": cls_idx,
+                   "model_version": stage["handle"].version})
+    return result
+
+# ---------- общие помощники ----------
+_RESULT_BUILDERS = {"ecg": _ecg_result, "mri": _mri_result, "xray": _xray_result}
+
+def _heatmap_bytes(pil_img: ImageLike, hm: np.ndarray, size: Tuple[int, int]) -> bytes:
+    """
+    Карта в памяти в формате artifacts.HEATMAP_FORMAT; на диск её пишет artifacts.writer.
+    "cam" — сама карта низкого разрешения, наложение рисует панель при просмотре.
+    """
+    if artifacts.HEATMAP_FORMAT == "cam":
+        return pack_cam(hm)
+    # тот же ресайз, что ушёл в модель — без повторной конвертации PIL
+    overlay = overlay_heatmap_on_array(prepare(pil_img).resized(size), hm, alpha=0.5)
+    return encode_heatmap(overlay)
+
+def _cam_method(modality: str, mode: str) -> Optional[str]:
+    """Метод CamEngine для режима качества (None — метод модели по умолчанию)."""
+    if mode not in HEATMAP_MODES:
+        raise ValueError(f"Неизвестный режим тепловой карты: {mode}")
+    return "gradcam" if mode == "fast" else None
+
+@resources.limited
+def render_heatmap_image(pil_img: ImageLike, modality: str, class_idx: int,
+                       mode: str = "smooth") -> Optional[bytes]:
+    """Тепловая карта для уже поставленного диагноза (отдельный forward), PNG-байты."""
+    if mode == "none":
+        return None
+    handle = get_handle(modality)
+    engine = handle.cam_engine()
+    x = handle.preprocess(pil_img).unsqueeze(0).to(device)
+    cams = engine.cam(engine.forward(x), class_idx, _cam_method(modality, mode))
+    return _heatmap_bytes(pil_img, cam_to_numpy(cams), handle.input_size)
+
+def render_heatmap(pil_img: ImageLike, modality: str, class_idx: int, path: str,
+                   mode: str = "smooth") -> Optional[str]:
+    """
+    render_heatmap_image + запись в path.
+    Файл пишется атомарно: карточка видит либо готовую карту, либо ничего.
+    """
+    heatmap_bytes = render_heatmap_image(pil_img, modality, class_idx, mode)
+    return write_atomic(path, heatmap_bytes) if heatmap_bytes is not None else None
+
+def _summary(result: Dict[str, Any]) -> str:
+    modality = result["modality"]
+    if modality == "ECG":
+        return f"ЭКГ → {result['label']} ({result['probability']}%) — {result['diagnosis']}"
+    if modality == "MRI":
+        pretty = {
+            "glioma": "Глиома",
+            "meningioma": "Менингиома",
+            "pituitary": "Опухоль гипофиза",
+            "notumor": "Без признаков опухоли"
+        }.get(result["label"], result["label"])
+        return f"МРТ → {pretty} ({result['probability']}%) — {result['diagnosis']}"
+    return f"Флюорография → {result['label']} ({result['probability']}%) — {result['diagnosis']}"
+
+def _normalize_modality(modality: str) -> str:
+    modality = modality.lower()
+    return modality if modality in ("ecg", "mri") else "xray"
+
+# ---------- кэш результатов ----------
+def model_version(modality: str) -> str:
+    return get_handle(modality).version
+
+def render_and_cache(cache_key: Optional[str], summary: str, result: Dict[str, Any],
+                     pil_img: ImageLike, modality: str, class_idx: int, path: str,
+                     mode: str = "smooth") -> Optional[str]:
+    """render_heatmap + запись готового результата в кэш (для отложенного режима)."""
+    heatmap_bytes = render_heatmap_image(pil_img, modality, class_idx, mode)
+    if heatmap_bytes is None:
+        return None
+    write_atomic(path, heatmap_bytes)
+    if cache_key:
+        done = dict(result, heatmap_path=path)
+        done.pop("heatmap_pending", None)
+        result_cache.cache.put(cache_key, modality, summary, done, heatmap_bytes)
+    return path
+
+def _from_cache(hit, workdir: str, heatmap_path: Optional[str]):
+    summary, result, cached_heatmap = hit
+    target = None
+    if cached_heatmap:
+        # копия: запись кэша могут вытеснить, а путь уйдёт в историю пациента
+        with open(cached_heatmap, "rb") as f:
+            target = artifacts.writer.write(f.read(), workdir, path=heatmap_path)
+    result.update({"heatmap_path": target, "cached": True})
+    return summary, target, result
+
+if result_cache.ENABLED:
+    # горячая замена модели — результаты старой версии больше не отдаём
+    registry.subscribe(lambda modality, old, new: result_cache.cache.invalidate(modality, new))
 
-# ---------- универсальный маршрутизатор ----------
 # ---------- универсальный маршрутизатор ----------
 def predict_image(
-    pil_img: Image.Image,
+    pil_img: ImageLike,
     workdir: str = ".",
-    forced_modality: str | None = None
+    forced_modality: str | None = None,
+    heatmap: str | None = None,
+    deferred: bool | None = None,
+    heatmap_path: str | None = None,
+    use_cache: bool = True,
 ):
     """
     forced_modality:
@@ -235,34 +388,183 @@ def predict_image(
         "ecg"  -> принудительно ЭКГ
         "mri"  -> принудительно МРТ
         "xray" -> принудительно ФЛГ
+    heatmap:
+        "none" | "fast" | "smooth" (по умолчанию HEATMAP_MODE)
+    deferred:
+        True -> диагноз возвращается сразу, тепловая карта пишется
+                фоновым потоком в heatmap_path (payload["heatmap_pending"])
+    heatmap_path:
+        куда писать карту (по умолчанию {workdir}/{хэш содержимого}.{HEATMAP_FORMAT} —
+        уникальное имя, параллельные сессии не перетирают карты друг друга).
+        Карта пишется один раз в фоне (artifacts.writer): путь возвращается
+        сразу, файл появляется атомарно через несколько миллисекунд.
+
+    use_cache:
+        False -> не читать и не писать кэш результатов (result_cache)
+
+    В payload:
+        "detected_by" — "forced" | "router" | "vote"
+        "reused"      — стадии, взятые из детекции без пересчёта
+                        ("preprocess", "forward")
+        "cached"      — результат взят из кэша (тот же снимок, та же версия модели)
     """
+    mode = heatmap or HEATMAP_MODE
+    if mode not in HEATMAP_MODES:
+        raise ValueError(f"Неизвестный режим тепловой карты: {mode}")
+    deferred = HEATMAP_DEFERRED if deferred is None else deferred
+
+    # снимок декодируется один раз: все модели и наложение карты берут ресайзы отсюда
+    pil_img = prepare(pil_img)
+
+    cache_key = None
+    if use_cache and result_cache.ENABLED:
+        cache_key = result_cache.image_key(pil_img, forced_modality, mode)
+        hit = result_cache.cache.get(cache_key, model_version)
+        if hit is not None:
+            return _from_cache(hit, workdir, heatmap_path)
+
+    summary, result = _predict_image(pil_img, workdir, forced_modality, mode,
+                                     deferred, heatmap_path, cache_key)
+    heatmap_bytes = result.pop("heatmap_image", None)
+    if heatmap_bytes is not None:
+        result["heatmap_path"] = artifacts.writer.write(heatmap_bytes, workdir, path=heatmap_path)
+    if cache_key and not result.get("heatmap_pending"):
+        result_cache.cache.put(cache_key, _normalize_modality(result["modality"]), summary, result, heatmap_bytes)
+    return summary, result.get("heatmap_path"), result
+
+@resources.limited
+def _predict_image(pil_img: ImageLike, workdir: str, forced_modality: Optional[str], mode: str,
+                   deferred: bool, heatmap_path: Optional[str], cache_key: Optional[str]):
+    # граф для CAM нужен только при синхронной карте
+    cam_now = mode != "none" and not deferred
 
     # ===== 1. определяем модальность =====
+    stages: Dict[str, Dict[str, Any]] = {}
     if forced_modality:
-        modality = forced_modality.lower()
+        modality, detected_by = _normalize_modality(forced_modality), "forced"
     else:
-        modality = detect_type(pil_img)
-
-    # ===== 2. запускаем НУЖНУЮ модель =====
-    if modality == "ecg":
-        result = predict_ecg(pil_img, os.path.join(workdir, "ecg_gradcam.png"))
-        result["modality"] = "ECG"
-        summary = f"ЭКГ → {result['label']} ({result['probability']}%) — {result['diagnosis']}"
-
-    elif modality == "mri":
-        result = predict_mri(pil_img, os.path.join(workdir, "mri_gradcam.png"))
-        result["modality"] = "MRI"
-        pretty = {
-            "glioma": "Глиома",
-            "meningioma": "Менингиома",
-            "pituitary": "Опухоль гипофиза",
-            "notumor": "Без признаков опухоли"
-        }.get(result["label"], result["label"])
-        summary = f"МРТ → {pretty} ({result['probability']}%) — {result['diagnosis']}"
+        # forward голосования сразу делаем с захватом активаций — победитель пойдёт в диагноз
+        modality, detected_by = _detect(pil_img, keep=stages, with_cam=cam_now)
 
-    else:
-        result = predict_xray(pil_img, os.path.join(workdir, "xray_gradcam.png"))
-        result["modality"] = "X-ray"
-        summary = f"Флюорография → {result['label']} ({result['probability']}%) — {result['diagnosis']}"
+    stage = stages.pop(modality, None)
+    for other in stages.values():
+        release_stage(other)
 
-    return summary, result.get("heatmap_path"), result
+    # ===== 2. запускаем НУЖНУЮ модель =====
+    predict_fn = {"ecg": predict_ecg, "mri": predict_mri, "xray": predict_xray}[modality]
+    result = predict_fn(pil_img, with_heatmap=cam_now, stage=stage, cam_method=_cam_method(modality, mode))
+    result["detected_by"] = detected_by
+    result["heatmap_path"] = None
+
+    # ===== 3. отложенная тепловая карта =====
+    summary = _summary(result)
+    if mode != "none" and deferred:
+        from . import heatmap_worker
+        # имя по содержимому ещё неизвестно — берём уникальное
+        target = heatmap_path or os.path.join(workdir, f"{uuid.uuid4().hex}_heatmap{artifacts.HEATMAP_SUFFIX}")
+        heatmap_worker.submit(target, render_and_cache, cache_key, summary, dict(result),
+                              pil_img, modality, result["class_idx"], target, mode)
+        result["heatmap_path"] = target
+        result["heatmap_pending"] = True
+
+    return summary, result
+
+# ---------- пакетный инференс ----------
+@resources.limited
+def predict_batch(
+    images: Sequence[ImageLike],
+    forced_modality: str | None = None,
+    *,
+    workdir: str = ".",
+    max_batch_size: Optional[int] = None,
+    with_heatmap: bool = True,
+    heatmap_prefix: str = "",
+    heatmap: str | None = None,
+    heatmap_output: str = "file",
+) -> List[Tuple[str, Any, Dict[str, Any]]]:
+    """
+    Пакетный аналог predict_image: снимки группируются по модальности,
+    каждая группа режется на микробатчи до max_batch_size и идёт в модель
+    одним forward (256/224/320 — по модели).
+
+    forced_modality — как у predict_image; остальные параметры только по имени.
+    heatmap — режим качества карты ("none" | "fast" | "smooth", по умолчанию HEATMAP_MODE).
+    heatmap_output:
+        "file"  -> карта пишется в фоне как {workdir}/{heatmap_prefix}{хэш}.{HEATMAP_FORMAT},
+                   второй элемент тройки — путь
+        "bytes" -> второй элемент — байты карты в HEATMAP_FORMAT (по умолчанию
+                   "cam" — упакованная CAM1, не PNG; наложение строит
+                   heatmap_render), на диск ничего не пишется
+
+    Возвращает тройки (summary, heatmap, payload) в порядке входа.
+    """
+    if heatmap_output not in ("file", "bytes"):
+        raise ValueError(f"Неизвестный heatmap_output: {heatmap_output}")
+    max_batch_size = max(1, int(max_batch_size or MAX_BATCH_SIZE))
+    mode = heatmap or HEATMAP_MODE
+    with_heatmap = with_heatmap and mode != "none"
+
+    images = [prepare(img) for img in images]
+
+    # ===== 1. группировка по модальности =====
+    groups: Dict[str, List[int]] = {}
+    detected: List[str] = []
+    for i, img in enumerate(images):
+        if forced_modality:
+            modality, how = _normalize_modality(forced_modality), "forced"
+        else:
+            modality, how = _detect(img)
+        detected.append(how)
+        groups.setdefault(modality, []).append(i)
+
+    results: List[Optional[Tuple[str, Optional[str], Dict[str, Any]]]] = [None] * len(images)
+
+    # ===== 2. один forward на микробатч =====
+    for modality, idxs in groups.items():
+        # одна версия модели на всю группу, даже если её заменят посреди батча
+        handle = get_handle(modality)
+        engine = handle.cam_engine() if with_heatmap else None
+        build = _RESULT_BUILDERS[modality]
+
+        for start in range(0, len(idxs), max_batch_size):
+            chunk = idxs[start:start + max_batch_size]
+            x = torch.stack([handle.preprocess(images[i]) for i in chunk]).to(device)
+
+            cam_pass = None
+            if engine is not None:
+                cam_pass = engine.forward(x)
+                out = cam_pass.out
+            else:
+                out = handle.infer(x)
+
+            built = [build(out[j], handle.classes) for j in range(len(chunk))]
+            cams = None
+            if cam_pass is not None:
+                cams = engine.cam(cam_pass, [cls_idx for _, cls_idx in built],
+                                  _cam_method(modality, mode))
+
+            for j, i in enumerate(chunk):
+                result, cls_idx = built[j]
+                heatmap_bytes = heatmap_path = None
+                if cams is not None:
+                    heatmap_bytes = _heatmap_bytes(images[i], cam_to_numpy(cams, index=j), handle.input_size)
+                    if heatmap_output == "file":
+                        heatmap_path = artifacts.writer.write(heatmap_bytes, workdir, prefix=heatmap_prefix)
+                result.update({"heatmap_path": heatmap_path, "reused": [], "class_idx": cls_idx,
+                               "model_version": handle.version,
+                               "detected_by": detected[i], "batch_size": len(chunk)})
+                results[i] = (_summary(result), heatmap_bytes if heatmap_output == "bytes" else heatmap_path,
+                              result)
+
+    return results
+
+# ---------- прогрев ----------
+def warm_up() -> Dict[str, float]:
+    """Загружает все три модели и делает пустой forward; возвращает время, мс."""
+    loaders = {"ecg": get_ecg_model, "mri": get_mri_model, "xray": get_xray_model}
+    sizes = {m: tuple(registry.manifest(m, registry.current_version(m))["input_size"]) for m in loaders}
+    return _warm_up(loaders, sizes, device)
+
+# MODEL_WARMUP=1 — модели грузятся в фоне сразу при импорте, а не на первом запросе
+if os.environ.get("MODEL_WARMUP") == "1":
+    threading.Thread(target=warm_up, name="model-warmup", daemon=True).start()
@@ -0,0 +1,123 @@
+# app/preprocess.py
+"""
+Общий препроцессинг снимка для всех трёх моделей.
+
+Раньше каждый transforms.Compose (ЭКГ 256, МРТ 224, ФЛГ 320) заново
+конвертировал PIL, ресайзил и нормировал, а overlay_heatmap_on_image
+ресайзил исходник ещё раз. Prepared декодирует снимок один раз, держит
+ресайзы по размеру и отдаёт:
+
+- tensor(size, mean, std) — float-тензор (3, h, w), нормировка одной
+  операцией x * 1/(255·std) − mean/std;
+- resized(size) — тот же uint8-буфер, что ушёл в модель, для наложения карты.
+
+Ресайз — PREPROCESS_RESIZE:
+    exact — PIL bilinear из исходника, как transforms.Resize при обучении
+            чекпойнтов (по умолчанию; вход модели совпадает с Compose);
+    fast  — cv2 INTER_AREA каскадом 320 -> 256 -> 224: уровень берётся из
+            ближайшего большего, если тот сам уменьшен из исходника (у малых
+            снимков МРТ уровни строятся прямо из исходника, без двойного
+            размытия). В 3–4 раза быстрее на больших ЭКГ/ФЛГ, но вход модели
+            отличается от обучающего.
+
+Время, отклонение входа и совпадение предсказаний с Compose:
+python bench/bench_preprocess.py
+"""
+import os
+import threading
+from typing import Dict, Sequence, Set, Tuple, Union
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+
+RESIZE_MODES = ("exact", "fast")
+RESIZE = os.environ.get("PREPROCESS_RESIZE", "exact")
+if RESIZE not in RESIZE_MODES:
+    raise ValueError(f"Неизвестный PREPROCESS_RESIZE: {RESIZE}")
+
+
+class Prepared:
+    """Снимок, декодированный один раз, + кэш ресайзов по размеру (h, w)."""
+
+    def __init__(self, pil_img: Image.Image, resize: str = RESIZE):
+        if resize not in RESIZE_MODES:
+            raise ValueError(f"Неизвестный режим ресайза: {resize}")
+        self.image = pil_img
+        self.resize = resize
+        self._rgb_image = None
+        self._rgb = None
+        self._levels: Dict[Tuple[int, int], np.ndarray] = {}
+        self._downscaled: Set[Tuple[int, int]] = set()   # уровни, уменьшенные из исходника
+        self._lock = threading.Lock()
+
+    @property
+    def rgb_image(self) -> Image.Image:
+        if self._rgb_image is None:
+            self._rgb_image = self.image if self.image.mode == "RGB" else self.image.convert("RGB")
+        return self._rgb_image
+
+    @property
+    def rgb(self) -> np.ndarray:
+        if self._rgb is None:
+            self._rgb = np.asarray(self.rgb_image)
+        return self._rgb
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(h, w) исходника."""
+        w, h = self.image.size
+        return h, w
+
+    def resized(self, size: Sequence[int]) -> np.ndarray:
+        """uint8 (h, w, 3) нужного размера (способ — см. PREPROCESS_RESIZE)."""
+        h, w = int(size[0]), int(size[1])
+        level = self._levels.get((h, w))
+        if level is not None:
+            return level
+        with self._lock:
+            level = self._levels.get((h, w))
+            if level is None:
+                level = self._levels[(h, w)] = self._resize(h, w)
+        return level
+
+    def _resize(self, h: int, w: int) -> np.ndarray:
+        if self.resize == "exact":
+            # то же, что transforms.Resize((h, w)) над PIL-снимком
+            return np.asarray(self.rgb_image.resize((w, h), Image.BILINEAR))
+        src_h, src_w = self.size
+        if src_h < h or src_w < w:
+            # увеличение — только из исходника; такой уровень не источник для меньших
+            return cv2.resize(self.rgb, (w, h), interpolation=cv2.INTER_LINEAR)
+        src = self.rgb
+        bigger = [k for k in self._downscaled if k[0] >= h and k[1] >= w]
+        if bigger:
+            src = self._levels[min(bigger)]
+        self._downscaled.add((h, w))
+        return cv2.resize(src, (w, h), interpolation=cv2.INTER_AREA)
+
+    def pyramid(self, sizes: Sequence[Sequence[int]]) -> "Prepared":
+        """Строит уровни от большего к меньшему (в режиме fast так каждый берётся из соседнего)."""
+        for size in sorted(sizes, key=lambda s: (s[0] * s[1]), reverse=True):
+            self.resized(size)
+        return self
+
+    def tensor(self, size: Sequence[int], mean: Sequence[float], std: Sequence[float]) -> torch.Tensor:
+        buf = torch.from_numpy(self.resized(size)).permute(2, 0, 1)
+        std_t = torch.tensor(std, dtype=torch.float32).view(3, 1, 1)
+        scale = 1.0 / (255.0 * std_t)
+        shift = -torch.tensor(mean, dtype=torch.float32).view(3, 1, 1) / std_t
+        return torch.addcmul(shift, buf.float(), scale)
+
+
+ImageLike = Union[Image.Image, Prepared]
+
+
+def prepare(img: ImageLike) -> Prepared:
+    """PIL -> Prepared (уже подготовленный снимок возвращается как есть)."""
+    return img if isinstance(img, Prepared) else Prepared(img)
+
+
+def as_pil(img: ImageLike) -> Image.Image:
+    return img.image if isinstance(img, Prepared) else img
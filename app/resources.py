@@ -0,0 +1,129 @@
+# app/resources.py
+"""
+Бюджет CPU для инференса в процессе.
+
+Несколько сессий панели, сервис и пакетная обработка на одной машине
+по умолчанию берут по torch.get_num_threads() == числу ядер потоков
+каждый — ядра переподписываются, задержка разваливается. Здесь:
+
+    INFERENCE_CPUS            — ядра процесса, напр. "0-3" или "0,2,4,6"
+                                (привязка через sched_setaffinity / psutil)
+    INFERENCE_MAX_CONCURRENT  — сколько прогнозов одновременно в процессе
+                                (0 — без ограничения)
+    TORCH_NUM_THREADS         — intra-op потоки torch; по умолчанию
+                                ядра процесса / INFERENCE_MAX_CONCURRENT
+    TORCH_INTEROP_THREADS     — inter-op потоки torch
+
+Подобрать значения: python bench/bench_threads.py
+"""
+import contextlib
+import functools
+import os
+import threading
+from typing import Dict, List, Optional
+
+import torch
+
+CPUS = os.environ.get("INFERENCE_CPUS", "")
+MAX_CONCURRENT = int(os.environ.get("INFERENCE_MAX_CONCURRENT", "0"))
+NUM_THREADS = int(os.environ.get("TORCH_NUM_THREADS", "0"))
+INTEROP_THREADS = int(os.environ.get("TORCH_INTEROP_THREADS", "0"))
+
+_slots: Optional[threading.BoundedSemaphore] = None
+_configured = False
+_lock = threading.Lock()
+
+
+def parse_cpus(spec: str) -> List[int]:
+    """'0-3,8' -> [0, 1, 2, 3, 8]"""
+    cpus = set()
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        if "-" in part:
+            lo, hi = part.split("-", 1)
+            cpus.update(range(int(lo), int(hi) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+def available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def pin(cpus: List[int]) -> bool:
+    """Привязывает процесс к ядрам. False — если платформа не умеет."""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+        return True
+    try:
+        import psutil  # на Windows — через psutil, если установлен
+    except ImportError:
+        print("[RESOURCES] привязка к ядрам недоступна: нет sched_setaffinity и psutil")
+        return False
+    psutil.Process().cpu_affinity(cpus)
+    return True
+
+
+def set_threads(num_threads: int, interop_threads: int = 0):
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    if interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # можно только до первой параллельной работы torch
+            print("[RESOURCES] inter-op потоки уже запущены — TORCH_INTEROP_THREADS не применён")
+
+
+def set_max_concurrent(n: int):
+    global _slots
+    _slots = threading.BoundedSemaphore(n) if n > 0 else None
+
+
+def configure(cpus: str = CPUS, max_concurrent: int = MAX_CONCURRENT,
+              num_threads: int = NUM_THREADS, interop_threads: int = INTEROP_THREADS) -> Dict[str, int]:
+    """Применяет бюджет один раз на процесс (повторные вызовы ничего не делают)."""
+    global _configured
+    with _lock:
+        if not _configured:
+            if cpus:
+                pin(parse_cpus(cpus))
+            if num_threads <= 0 and max_concurrent > 0:
+                num_threads = max(1, available_cpus() // max_concurrent)
+            set_threads(num_threads, interop_threads)
+            set_max_concurrent(max_concurrent)
+            _configured = True
+    return budget()
+
+
+def budget() -> Dict[str, int]:
+    return {
+        "cpus": available_cpus(),
+        "threads": torch.get_num_threads(),
+        "interop_threads": torch.get_num_interop_threads(),
+        "max_concurrent": _slots._initial_value if _slots is not None else 0,  # type: ignore[attr-defined]
+    }
+
+
+@contextlib.contextmanager
+def inference_slot():
+    """Ждёт свободный слот INFERENCE_MAX_CONCURRENT (без лимита — сразу)."""
+    slots = _slots
+    if slots is None:
+        yield
+        return
+    with slots:
+        yield
+
+
+def limited(fn):
+    """Декоратор: вызов занимает один слот инференса."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with inference_slot():
+            return fn(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,195 @@
+# app/result_cache.py
+"""
+Постоянный кэш результатов анализа (повторная загрузка того же снимка,
+перезапуск Streamlit).
+
+Ключ — хэш пикселей снимка + принудительная модальность + режим карты.
+Запись хранит payload, summary и тепловую карту ({key}.webp) и действительна,
+пока версия модели её модальности совпадает с текущей: при горячей замене
+(registry.subscribe) записи модальности удаляются, другие процессы
+отсекают их по версии при чтении.
+
+Индекс — SQLite в RESULT_CACHE_DIR; вытеснение по LRU при превышении
+RESULT_CACHE_MAX_MB или RESULT_CACHE_MAX_ENTRIES.
+
+    RESULT_CACHE=0                — выключить
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from .artifacts import image_suffix, write_atomic
+from .preprocess import ImageLike, prepare
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+ENABLED = os.environ.get("RESULT_CACHE", "1") == "1"
+CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", os.path.join(BASE_DIR, "storage", "cache"))
+MAX_BYTES = int(float(os.environ.get("RESULT_CACHE_MAX_MB", "500")) * 1024 * 1024)
+MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "5000"))
+
+
+def image_key(img: ImageLike, forced_modality: Optional[str], mode: str) -> str:
+    """Хэш декодированных пикселей: тот же снимок в PNG и JPEG-перезаливке не совпадёт, и это правильно."""
+    prepared = prepare(img)
+    rgb = prepared.rgb
+    h = hashlib.blake2b(digest_size=16)
+    # режим ресайза меняет вход модели, а значит и результат
+    h.update(f"{rgb.shape}:{(forced_modality or 'auto').lower()}:{mode}:{prepared.resize}".encode())
+    h.update(np.ascontiguousarray(rgb).data)
+    return h.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, root: str = CACHE_DIR, max_bytes: int = MAX_BYTES,
+                 max_entries: int = MAX_ENTRIES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    # ---------- индекс ----------
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self.root, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.root, "index.db"),
+                                   check_same_thread=False, timeout=10)
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                modality TEXT,
+                model_version TEXT,
+                summary TEXT,
+                payload TEXT,
+                heatmap TEXT,
+                size INTEGER,
+                last_access REAL
+            )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries(last_access)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _remove_files(self, heatmaps):
+        for name in heatmaps:
+            if name:
+                try:
+                    os.remove(os.path.join(self.root, name))
+                except FileNotFoundError:
+                    pass
+
+    # ---------- чтение / запись ----------
+    def get(self, key: str, version_of: Callable[[str], str]
+            ) -> Optional[Tuple[str, Dict[str, Any], Optional[str]]]:
+        """
+        (summary, payload, путь к карте в кэше) или None.
+        version_of(modality) — текущая версия модели; устаревшая запись удаляется.
+        """
+        with self._lock:
+            row = self._db().execute(
+                "SELECT modality, model_version, summary, payload, heatmap FROM entries WHERE key=?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        modality, version, summary, payload, heatmap = row
+        heatmap_file = os.path.join(self.root, heatmap) if heatmap else None
+        if version != version_of(modality) or (heatmap_file and not os.path.exists(heatmap_file)):
+            self.delete(key)
+            self.misses += 1
+            return None
+        with self._lock:
+            conn = self._db()
+            conn.execute("UPDATE entries SET last_access=? WHERE key=?", (time.time(), key))
+            conn.commit()
+        self.hits += 1
+        return summary, json.loads(payload), heatmap_file
+
+    def put(self, key: str, modality: str, summary: str, payload: Dict[str, Any],
+            heatmap_image: Optional[bytes] = None):
+        heatmap = None
+        size = 0
+        if heatmap_image:
+            os.makedirs(self.root, exist_ok=True)
+            heatmap = key + image_suffix(heatmap_image)
+            write_atomic(os.path.join(self.root, heatmap), heatmap_image)
+            size = len(heatmap_image)
+        data = json.dumps(payload, ensure_ascii=False, default=str)
+        size += len(data)
+        with self._lock:
+            conn = self._db()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, modality, payload.get("model_version"), summary, data, heatmap, size, time.time()),
+            )
+            conn.commit()
+        self.evict()
+
+    def delete(self, key: str):
+        with self._lock:
+            conn = self._db()
+            rows = conn.execute("SELECT heatmap FROM entries WHERE key=?", (key,)).fetchall()
+            conn.execute("DELETE FROM entries WHERE key=?", (key,))
+            conn.commit()
+        self._remove_files(r[0] for r in rows)
+
+    def invalidate(self, modality: str, keep_version: Optional[str] = None):
+        """Удаляет записи модальности (кроме keep_version) — вызывается при замене модели."""
+        with self._lock:
+            conn = self._db()
+            rows = conn.execute(
+                "SELECT heatmap FROM entries WHERE modality=? AND model_version IS NOT ?",
+                (modality, keep_version),
+            ).fetchall()
+            conn.execute("DELETE FROM entries WHERE modality=? AND model_version IS NOT ?",
+                         (modality, keep_version))
+            conn.commit()
+        self._remove_files(r[0] for r in rows)
+
+    def evict(self):
+        """LRU: удаляет самые давно читанные записи, пока не уложимся в лимиты."""
+        with self._lock:
+            conn = self._db()
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            if count <= self.max_entries and total <= self.max_bytes:
+                return
+            victims = []
+            for key, heatmap, size in conn.execute(
+                    "SELECT key, heatmap, size FROM entries ORDER BY last_access"):
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                victims.append((key, heatmap))
+                count -= 1
+                total -= size
+            conn.executemany("DELETE FROM entries WHERE key=?", [(k,) for k, _ in victims])
+            conn.commit()
+        self._remove_files(h for _, h in victims)
+
+    def clear(self):
+        with self._lock:
+            conn = self._db()
+            rows = conn.execute("SELECT heatmap FROM entries").fetchall()
+            conn.execute("DELETE FROM entries")
+            conn.commit()
+        self._remove_files(r[0] for r in rows)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total = self._db().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": count, "bytes": total}
+
+
+cache = ResultCache()
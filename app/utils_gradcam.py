@@ -3,10 +3,11 @@ import numpy as np
 import cv2
 from PIL import Image
 
-def cam_to_numpy(cams):
+def cam_to_numpy(cams, index=None):
     """
     Универсально приводит вывод torchcam к np.ndarray (H, W),
     работает и для torchcam<=0.3.x, и для >=0.4.0.
+    index — номер снимка, если CAM посчитан для батча (N, H, W).
     """
     import torch
 
@@ -20,6 +21,9 @@ def cam_to_numpy(cams):
     if isinstance(x, torch.Tensor):
         x = x.detach().cpu().numpy()
 
+    if index is not None:
+        x = x[index]
+
     x = np.nan_to_num(x)
 
     # Сжать до 2D
@@ -42,12 +46,19 @@ def overlay_heatmap_on_image(pil_img: Image.Image, heatmap_01: np.ndarray, targe
     img = pil_img.convert("RGB")
     if target_size is not None:
         img = img.resize(target_size)
+    return overlay_heatmap_on_array(np.asarray(img), heatmap_01, alpha)
 
-    img_cv = np.array(img)[:, :, ::-1]  # RGB->BGR
+def overlay_heatmap_on_array(rgb_u8: np.ndarray, heatmap_01: np.ndarray, alpha=0.5,
+                             colormap=cv2.COLORMAP_JET, interpolation=cv2.INTER_LINEAR):
+    """
+    То же для готового uint8-буфера (H,W,3) RGB — например, Prepared.resized(),
+    который уже ушёл в модель: без повторной конвертации и ресайза.
+    """
+    img_cv = rgb_u8[:, :, ::-1]  # RGB->BGR
     h, w = img_cv.shape[:2]
-    hm = cv2.resize(heatmap_01, (w, h))
+    hm = np.clip(cv2.resize(heatmap_01, (w, h), interpolation=interpolation), 0, 1)
     hm_u8 = np.uint8(255 * hm)
-    hm_color = cv2.applyColorMap(hm_u8, cv2.COLORMAP_JET)
+    hm_color = cv2.applyColorMap(hm_u8, colormap)
 
-    overlay = cv2.addWeighted(img_cv, 1 - alpha, hm_color, alpha, 0)
+    overlay = cv2.addWeighted(np.ascontiguousarray(img_cv), 1 - alpha, hm_color, alpha, 0)
     return overlay  # BGR
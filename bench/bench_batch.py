@@ -0,0 +1,76 @@
+# bench/bench_batch.py
+"""
+Пропускная способность: цикл predict_image vs predict_batch на images/.
+
+    python bench/bench_batch.py --modality mri --batch 8 --repeat 3
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+
+# кэш результатов (app/result_cache.py) меряет bench_cache.py; здесь повторные
+# снимки должны проходить через модель, а в storage/cache ничего не пишется
+os.environ["RESULT_CACHE"] = "0"
+
+from app import predictor as P  # noqa: E402
+
+FOLDERS = {"ecg": "ecg", "mri": "mri", "xray": "flg"}
+
+
+def load_images(modality):
+    folders = [FOLDERS[modality]] if modality else list(FOLDERS.values())
+    paths = []
+    for folder in folders:
+        paths += sorted(glob.glob(os.path.join(ROOT, "images", folder, "*", "*")))
+    return [Image.open(p).convert("RGB") for p in paths]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--modality", choices=list(FOLDERS), default=None,
+                    help="принудительная модальность (по умолчанию — автоопределение)")
+    ap.add_argument("--batch", type=int, default=P.MAX_BATCH_SIZE)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--no-heatmap", action="store_true")
+    args = ap.parse_args()
+
+    images = load_images(args.modality)
+    workdir = tempfile.mkdtemp(prefix="bench_batch_")
+    with_heatmap = not args.no_heatmap
+
+    # прогрев
+    P.predict_batch(images[:2], args.modality, workdir=workdir, max_batch_size=args.batch,
+                    with_heatmap=with_heatmap)
+
+    loop_s = batch_s = 0.0
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        for img in images:
+            if with_heatmap:
+                P.predict_image(img, workdir, forced_modality=args.modality)
+            else:
+                modality = args.modality or P.detect_type(img)
+                {"ecg": P.predict_ecg, "mri": P.predict_mri, "xray": P.predict_xray}[modality](img)
+        loop_s += time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        P.predict_batch(images, args.modality, workdir=workdir, max_batch_size=args.batch,
+                        with_heatmap=with_heatmap)
+        batch_s += time.perf_counter() - t0
+
+    n = len(images) * args.repeat
+    print(f"images={len(images)} repeat={args.repeat} batch={args.batch} heatmap={with_heatmap}")
+    print(f"per-image loop: {n / loop_s:6.2f} img/s")
+    print(f"predict_batch : {n / batch_s:6.2f} img/s  (x{loop_s / batch_s:.2f})")
+
+
+if __name__ == "__main__":
+    main()
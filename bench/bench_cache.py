@@ -0,0 +1,48 @@
+# bench/bench_cache.py
+"""
+Кэш результатов: первый анализ снимка (промах) против повторного (попадание).
+
+    python bench/bench_cache.py
+"""
+import glob
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+
+os.environ.setdefault("RESULT_CACHE_DIR", tempfile.mkdtemp(prefix="bench_cache_"))
+from app import predictor as P  # noqa: E402
+from app.result_cache import cache  # noqa: E402
+
+
+def main():
+    paths = sorted(glob.glob(os.path.join(ROOT, "images", "*", "*", "*")))
+    images = [Image.open(p).convert("RGB") for p in paths]
+    workdir = tempfile.mkdtemp(prefix="bench_cache_work_")
+    P.warm_up()
+
+    miss, hit = [], []
+    for img in images:
+        t0 = time.perf_counter()
+        P.predict_image(img, workdir)
+        miss.append((time.perf_counter() - t0) * 1000)
+    for img in images:
+        t0 = time.perf_counter()
+        _, _, payload = P.predict_image(img, workdir)
+        hit.append((time.perf_counter() - t0) * 1000)
+        assert payload.get("cached"), "ожидалось попадание в кэш"
+
+    print(f"{'':<6} {'n':>4} {'median, ms':>11} {'p99, ms':>9}")
+    for name, lat in (("miss", miss), ("hit", hit)):
+        print(f"{name:<6} {len(lat):>4} {np.median(lat):11.1f} {np.percentile(lat, 99):9.1f}")
+    print(cache.stats())
+
+
+if __name__ == "__main__":
+    main()
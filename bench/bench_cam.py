@@ -0,0 +1,63 @@
+# bench/bench_cam.py
+"""
+Задержка predict_image на длинной серии: с постоянным CamEngine она должна
+оставаться ровной, а число хуков на модели — не расти.
+
+    python bench/bench_cam.py --modality mri -n 1000
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+
+# кэш результатов (app/result_cache.py) меряет bench_cache.py; здесь повторные
+# снимки должны проходить через модель, а в storage/cache ничего не пишется
+os.environ["RESULT_CACHE"] = "0"
+
+from app import predictor as P  # noqa: E402
+from app.cam_engine import count_hooks  # noqa: E402
+
+FOLDERS = {"ecg": "ecg", "mri": "mri", "xray": "flg"}
+GETTERS = {"ecg": P.get_ecg_model, "mri": P.get_mri_model, "xray": P.get_xray_model}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--modality", choices=list(FOLDERS), default="mri")
+    ap.add_argument("-n", type=int, default=1000)
+    ap.add_argument("--window", type=int, default=100)
+    args = ap.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(ROOT, "images", FOLDERS[args.modality], "*", "*")))
+    images = [Image.open(p).convert("RGB") for p in paths]
+    workdir = tempfile.mkdtemp(prefix="bench_cam_")
+    model = GETTERS[args.modality]()
+
+    P.predict_image(images[0], workdir, forced_modality=args.modality)  # прогрев
+    hooks_before = count_hooks(model)
+
+    lat = []
+    for i in range(args.n):
+        t0 = time.perf_counter()
+        P.predict_image(images[i % len(images)], workdir, forced_modality=args.modality)
+        lat.append((time.perf_counter() - t0) * 1000)
+
+    print(f"{'predictions':>12} {'median, ms':>11} {'p99, ms':>9}")
+    for start in range(0, args.n, args.window):
+        w = lat[start:start + args.window]
+        print(f"{start + 1:>5}-{start + len(w):<6} {np.median(w):11.1f} {np.percentile(w, 99):9.1f}")
+    first, last = lat[:args.window], lat[-args.window:]
+    print(f"drift (last/first median): x{np.median(last) / np.median(first):.3f}")
+    print(f"hooks on model: {hooks_before} -> {count_hooks(model)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# bench/bench_chat.py
+"""
+Клиент чата против подставного Ollama (bench/fake_ollama.py):
+
+- последовательные сообщения: TTFT и полное время, число TCP-соединений —
+  старый путь (requests.post на сообщение) против ChatClient с keep-alive;
+- отмена посреди ответа: сервер видит обрыв, генерация не продолжается;
+- статус при выключенном Ollama: health() из кэша против блокирующего GET.
+
+    python bench/bench_chat.py --messages 20 --tokens 50
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+
+from app.chat_local import ChatClient  # noqa: E402
+from fake_ollama import FakeOllama  # noqa: E402
+
+
+def legacy_chat(url: str, prompt: str, stats: dict):
+    """Как было: новое соединение на сообщение, json импортируется в цикле."""
+    t0 = time.perf_counter()
+    chunks = []
+    with requests.post(f"{url}/api/generate", json={"model": "llama3", "prompt": prompt},
+                       stream=True, timeout=120) as r:
+        for line in r.iter_lines():
+            if not line:
+                continue
+            import json as _json
+            data = _json.loads(line.decode("utf-8"))
+            if data.get("response"):
+                if not chunks:
+                    stats["ttft_ms"] = (time.perf_counter() - t0) * 1000
+                chunks.append(data["response"])
+    stats["total_ms"] = (time.perf_counter() - t0) * 1000
+    return "".join(chunks)
+
+
+def run_messages(mode: str, n: int, tokens: int, delay_ms: float):
+    srv = FakeOllama(tokens=tokens, delay_ms=delay_ms).start()
+    client = ChatClient(srv.url)
+    ttft, total = [], []
+    for i in range(n):
+        stats = {}
+        if mode == "legacy":
+            legacy_chat(srv.url, f"вопрос {i}", stats)
+        else:
+            "".join(client.stream(f"вопрос {i}", stats=stats))
+        ttft.append(stats["ttft_ms"])
+        total.append(stats["total_ms"])
+    srv.shutdown()
+    print(f"{mode:<8} {statistics.median(ttft):9.2f} {statistics.median(total):9.1f} "
+          f"{srv.connections:>6} {srv.requests:>6}")
+
+
+def run_cancel(tokens: int, delay_ms: float):
+    srv = FakeOllama(tokens=tokens, delay_ms=delay_ms).start()
+    client = ChatClient(srv.url)
+    cancel, stats = threading.Event(), {}
+    got = 0
+    for _ in client.stream("вопрос", cancel=cancel, stats=stats):
+        got += 1
+        if got == 5:
+            cancel.set()
+    time.sleep(0.2 + 2 * delay_ms / 1000)   # сервер замечает обрыв на следующей записи
+    print(f"отмена после 5 кусков: cancelled={stats['cancelled']} "
+          f"за {stats['total_ms']:.0f} мс, сервер оборвал ответов: {srv.aborted}")
+    srv.shutdown()
+
+
+def run_offline():
+    with socket.socket() as s:   # заведомо свободный порт — Ollama «выключен»
+        s.bind(("127.0.0.1", 0))
+        url = f"http://127.0.0.1:{s.getsockname()[1]}"
+    t0 = time.perf_counter()
+    try:
+        requests.get(url, timeout=2)
+    except requests.RequestException:
+        pass
+    blocking = (time.perf_counter() - t0) * 1000
+    client = ChatClient(url)
+    client.health()
+    time.sleep(0.3)
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        status = client.health()
+    cached = (time.perf_counter() - t0) * 1000 / 1000
+    print(f"Ollama выключен: GET на перерисовку {blocking:.2f} мс, health() {cached * 1000:.1f} мкс, "
+          f"статус {json.dumps(status['online'])}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=20)
+    ap.add_argument("--tokens", type=int, default=50)
+    ap.add_argument("--delay-ms", type=float, default=2)
+    args = ap.parse_args()
+
+    print(f"{'mode':<8} {'TTFT ms':>9} {'total ms':>9} {'TCP':>6} {'reqs':>6}")
+    for mode in ("legacy", "session"):
+        run_messages(mode, args.messages, args.tokens, args.delay_ms)
+    run_cancel(args.tokens, max(args.delay_ms, 20))
+    run_offline()
+
+
+if __name__ == "__main__":
+    main()
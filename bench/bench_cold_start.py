@@ -0,0 +1,93 @@
+# bench/bench_cold_start.py
+"""
+Холодный старт: время до первого прогноза в свежем процессе.
+
+Для каждой модальности запускается отдельный python-процесс, который меряет
+импорт predictor, загрузку модели и первый predict_image. С --legacy модель
+сначала строится по-старому (ImageNet-веса + load_state_dict) — для сравнения.
+
+    python bench/bench_cold_start.py
+    python bench/bench_cold_start.py --legacy
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# кэш результатов (app/result_cache.py) меряет bench_cache.py; здесь повторные
+# снимки должны проходить через модель, а в storage/cache ничего не пишется
+os.environ["RESULT_CACHE"] = "0"
+
+FOLDERS = {"ecg": "ecg", "mri": "mri", "xray": "flg"}
+
+
+def child(modality: str, legacy: bool):
+    t0 = time.perf_counter()
+    sys.path.append(ROOT)
+    from PIL import Image
+    from app import predictor as P
+    t_import = time.perf_counter()
+
+    if legacy:
+        import torch
+        import torch.nn as nn
+        from torchvision import models
+        path = {"ecg": P.PATH_ECG, "mri": P.PATH_MRI, "xray": P.PATH_XRAY}[modality]
+        if modality == "xray":
+            m = models.densenet121(weights=None)
+            m.classifier = nn.Linear(m.classifier.in_features, 1)
+        else:
+            m = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1)
+            m.fc = nn.Linear(m.fc.in_features, 3 if modality == "ecg" else 4)
+        ckpt = torch.load(path, map_location=P.device)
+        if isinstance(ckpt, dict) and "model_state" in ckpt:
+            ckpt = ckpt["model_state"]
+        m.load_state_dict(ckpt)
+        manifest = P.registry.manifest(modality, "legacy")
+        P.registry._handles[modality] = P.ModelHandle(modality, manifest, m.to(P.device).eval())
+    else:
+        {"ecg": P.get_ecg_model, "mri": P.get_mri_model, "xray": P.get_xray_model}[modality]()
+    t_load = time.perf_counter()
+
+    img_path = sorted(glob.glob(os.path.join(ROOT, "images", FOLDERS[modality], "*", "*")))[0]
+    P.predict_image(Image.open(img_path).convert("RGB"), tempfile.gettempdir(), forced_modality=modality)
+    t_pred = time.perf_counter()
+
+    print(json.dumps({
+        "import_ms": (t_import - t0) * 1000,
+        "load_ms": (t_load - t_import) * 1000,
+        "first_predict_ms": (t_pred - t_load) * 1000,
+        "total_ms": (t_pred - t0) * 1000,
+    }))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--legacy", action="store_true", help="старая загрузка с ImageNet-весами")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--child", choices=list(FOLDERS))
+    args = ap.parse_args()
+
+    if args.child:
+        return child(args.child, args.legacy)
+
+    print(f"{'modality':<8} {'import':>8} {'load':>8} {'1st pred':>9} {'total, ms':>10}")
+    for modality in FOLDERS:
+        runs = []
+        for _ in range(args.repeat):
+            cmd = [sys.executable, __file__, "--child", modality] + (["--legacy"] if args.legacy else [])
+            out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+            runs.append(json.loads(out.strip().splitlines()[-1]))
+        best = min(runs, key=lambda r: r["total_ms"])
+        print(f"{modality:<8} {best['import_ms']:8.0f} {best['load_ms']:8.0f} "
+              f"{best['first_predict_ms']:9.0f} {best['total_ms']:10.0f}")
+
+
+if __name__ == "__main__":
+    main()
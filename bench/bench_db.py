@@ -0,0 +1,96 @@
+# bench/bench_db.py
+"""
+SQLite под нагрузкой панели: N врачей читают очередь, M загрузок пишут.
+Сравнение пула с WAL и старого режима (новое соединение на вызов, rollback-журнал).
+
+    python bench/bench_db.py --readers 8 --writers 2 --seconds 5 --seed 5000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import statistics
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+
+from app import db  # noqa: E402
+
+PAYLOAD = {"modality": "MRI", "label": "glioma", "diagnosis": "—", "probability": 71.5,
+           "model_version": "bench"}
+
+
+def run(mode: str, readers: int, writers: int, seconds: float, seed: int):
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_db_"), "patients.db")
+    db.pool = db.ConnectionPool(path, size=0, wal=False) if mode == "legacy" else db.ConnectionPool(path)
+    db.init_db()
+    for i in range(seed):
+        db.insert_or_update_patient(f"seed {i}", PAYLOAD, "orig.png", None)
+
+    stop = time.perf_counter() + seconds
+    reads, writes, errors = [], [], []
+    lock = threading.Lock()
+
+    def reader():
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            try:
+                db.list_patients()
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                reads.append((time.perf_counter() - t0) * 1000)
+
+    def writer(w):
+        k = 0
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            try:
+                db.insert_or_update_patient(f"writer {w} #{k}", PAYLOAD, "orig.png", None)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            k += 1
+            with lock:
+                writes.append((time.perf_counter() - t0) * 1000)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer, args=(w,)) for w in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    db.pool.close()
+
+    def pct(xs, q):
+        if not xs:
+            return float("nan")
+        return statistics.quantiles(xs, n=100)[q - 1] if len(xs) > 1 else xs[0]
+
+    print(f"{mode:<7} {len(reads) / seconds:8.1f} {pct(reads, 50):8.2f} {pct(reads, 99):8.2f} "
+          f"{len(writes) / seconds:8.1f} {pct(writes, 50):8.2f} {pct(writes, 99):8.2f} {len(errors):>6}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--readers", type=int, default=8)
+    ap.add_argument("--writers", type=int, default=2)
+    ap.add_argument("--seconds", type=float, default=5)
+    ap.add_argument("--seed", type=int, default=2000, help="пациентов в базе до старта")
+    ap.add_argument("--mode", choices=["legacy", "pooled"], nargs="+", default=["legacy", "pooled"])
+    args = ap.parse_args()
+
+    print(f"readers={args.readers} writers={args.writers} seed={args.seed}")
+    print(f"{'mode':<7} {'reads/s':>8} {'r p50':>8} {'r p99':>8} {'writes/s':>8} {'w p50':>8} {'w p99':>8} {'errors':>6}")
+    for mode in args.mode:
+        run(mode, args.readers, args.writers, args.seconds, args.seed)
+
+
+if __name__ == "__main__":
+    main()
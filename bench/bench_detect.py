@@ -0,0 +1,118 @@
+# bench/bench_detect.py
+"""
+Сравнение автоопределения модальности: маршрутизатор vs голосование моделей.
+
+    python bench/bench_detect.py           # точность и задержки на images/
+    python bench/bench_detect.py --stats   # средние признаки по модальностям
+
+Код выхода 1, если роутер уверенно ошибся хотя бы на одном снимке (или
+detect_type вернул не ту модальность). Уход в голосование — не ошибка.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+
+# кэш результатов (app/result_cache.py) меряет bench_cache.py; здесь повторные
+# снимки должны проходить через модель, а в storage/cache ничего не пишется
+os.environ["RESULT_CACHE"] = "0"
+
+from app.modality_router import FEATURES, MIN_CONFIDENCE, image_stats, route_modality  # noqa: E402
+
+# папка в images/ -> модальность
+FOLDERS = {"ecg": "ecg", "mri": "mri", "flg": "xray"}
+
+
+def load_samples():
+    samples = []
+    for folder, modality in FOLDERS.items():
+        for path in sorted(glob.glob(os.path.join(ROOT, "images", folder, "*", "*"))):
+            samples.append((path, modality))
+    return samples
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    res = fn(*args, **kwargs)
+    return res, (time.perf_counter() - t0) * 1000
+
+
+def print_stats(samples):
+    by_mod = {}
+    for path, modality in samples:
+        st = image_stats(Image.open(path))
+        by_mod.setdefault(modality, []).append([st[k] for k in FEATURES])
+    print("modality  n   " + "  ".join(f"{k:>10}" for k in FEATURES))
+    for modality, rows in by_mod.items():
+        m = np.mean(rows, axis=0)
+        print(f"{modality:<8} {len(rows):>3}  " + "  ".join(f"{v:10.3f}" for v in m))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--stats", action="store_true", help="только средние признаки")
+    ap.add_argument("--no-models", action="store_true", help="не запускать сети (только роутер)")
+    args = ap.parse_args()
+
+    samples = load_samples()
+    if args.stats:
+        print_stats(samples)
+        return
+
+    router_ms, router_ok, fallback, misroutes = [], 0, 0, []
+    for path, modality in samples:
+        img = Image.open(path).convert("RGB")
+        (pred, conf, _), ms = timed(route_modality, img)
+        router_ms.append(ms)
+        if conf < MIN_CONFIDENCE:
+            fallback += 1            # predictor уйдёт в голосование моделей
+        elif pred == modality:
+            router_ok += 1
+        else:
+            misroutes.append(f"{os.path.relpath(path, ROOT)}: {modality} -> {pred} ({conf:.3f})")
+    print(f"router: верно {router_ok}/{len(samples)}, в голосование {fallback}, "
+          f"ошибок {len(misroutes)}, median {np.median(router_ms):.2f} ms")
+    for line in misroutes:
+        print(f"  ошибка роутера: {line}")
+
+    if args.no_models:
+        return 1 if misroutes else 0
+
+    from app import predictor as P
+
+    # прогрев: загрузка весов не должна попадать в замер
+    warm = Image.open(samples[0][0]).convert("RGB")
+    for m in ("ecg", "mri", "xray"):
+        P.predict_image(warm, "/tmp", forced_modality=m)
+
+    vote_ms, auto_ms, forced_ms, vote_ok, auto_ok = [], [], [], 0, 0
+    for path, modality in samples:
+        img = Image.open(path).convert("RGB")
+        pred, ms = timed(P.detect_by_vote, img)
+        vote_ms.append(ms)
+        vote_ok += int(pred == modality)
+        pred, ms = timed(P.detect_type, img)
+        auto_ok += int(pred == modality)
+        if pred != modality:
+            misroutes.append(f"{os.path.relpath(path, ROOT)}: detect_type {modality} -> {pred}")
+        _, ms = timed(P.predict_image, img, "/tmp")
+        auto_ms.append(ms)
+        _, ms = timed(P.predict_image, img, "/tmp", forced_modality=modality)
+        forced_ms.append(ms)
+
+    print(f"vote:   acc {vote_ok}/{len(samples)}, median {np.median(vote_ms):.1f} ms")
+    print(f"detect_type acc {auto_ok}/{len(samples)}")
+    print(f"predict_image auto   median {np.median(auto_ms):.1f} ms")
+    print(f"predict_image forced median {np.median(forced_ms):.1f} ms")
+    return 1 if misroutes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+# bench/bench_optimized.py
+"""
+Оптимизированный классификационный проход против fp32 на images/:
+совпадение top-1, максимальное отклонение вероятности и задержка.
+
+    python bench/bench_optimized.py --options channels_last,int8_static,trace
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+
+from app import optimize  # noqa: E402
+from app.model_registry import MODALITIES, registry  # noqa: E402
+
+
+def latency(fn, x, n: int):
+    lat = []
+    with torch.inference_mode():
+        fn(x)
+        for _ in range(n):
+            t0 = time.perf_counter()
+            fn(x)
+            lat.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(lat))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--options", default="channels_last,int8_static,trace")
+    ap.add_argument("--modality", choices=MODALITIES, nargs="*", default=list(MODALITIES))
+    ap.add_argument("--batch", type=int, default=8)
+    ap.add_argument("-n", type=int, default=20)
+    args = ap.parse_args()
+    options = optimize.parse_options(args.options)
+
+    print(f"options: {', '.join(sorted(options))}")
+    print(f"{'modality':<8} {'n':>3} {'top-1 agree':>11} {'max |dp|':>9} {'fp32, ms':>9} {'opt, ms':>8}")
+    for modality in args.modality:
+        handle = registry.get(modality)
+        fast = optimize.optimize_model(handle.model, modality, handle.input_size,
+                                       handle.preprocess, options, registry.device)
+        to_fast = (lambda x: x.contiguous(memory_format=torch.channels_last)) \
+            if "channels_last" in options else (lambda x: x)
+
+        def fast_infer(x):
+            return fast(to_fast(x))
+
+        batches = list(optimize.calibration_batches(modality, handle.preprocess, args.batch))
+        if not batches:
+            print(f"{modality:<8} нет примеров в images/")
+            continue
+        stats = optimize.compare(handle.model, fast_infer, batches, binary=len(handle.classes) == 1)
+        x = batches[0]
+        print(f"{modality:<8} {stats['n']:>3} {stats['top1_agreement']:>11.3f} "
+              f"{stats['max_prob_diff']:>9.4f} {latency(handle.model, x, args.n):>9.1f} "
+              f"{latency(fast_infer, x, args.n):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
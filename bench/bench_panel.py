@@ -0,0 +1,70 @@
+# bench/bench_panel.py
+"""
+Время одной перерисовки панели врача (Streamlit выполняет скрипт целиком
+на каждое действие) на заполненной базе: с кэшами st.cache_data/cache_resource
+и без них (PANEL_CACHE=0).
+
+    python bench/bench_panel.py --patients 100000 --reruns 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+
+# база бенчмарка — до первого импорта app.db
+os.environ["PATIENTS_DB"] = os.path.join(tempfile.mkdtemp(prefix="bench_panel_"), "patients.db")
+
+import streamlit as st  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from app import db  # noqa: E402
+from bench_queue import seed  # noqa: E402
+
+PANEL = os.path.join(ROOT, "frontend", "doctor_panel.py")
+
+# AppTest опрашивает завершение скрипта с шагом в десятки мс — время самого
+# скрипта меряет обёртка и кладёт в session_state
+WRAPPER = """
+import runpy, time
+import streamlit as st
+t0 = time.perf_counter()
+try:
+    runpy.run_path({panel!r}, run_name="__main__")
+finally:
+    st.session_state["_bench_ms"] = (time.perf_counter() - t0) * 1000
+"""
+
+
+def run(cached: bool, reruns: int):
+    os.environ["PANEL_CACHE"] = "1" if cached else "0"
+    st.cache_data.clear()
+    at = AppTest.from_string(WRAPPER.format(panel=PANEL), default_timeout=120)
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    first = at.session_state["_bench_ms"]
+    xs = []
+    for _ in range(reruns):
+        at.run()
+        xs.append(at.session_state["_bench_ms"])
+    print(f"{'cache' if cached else 'no cache':<9} {first:10.1f} {statistics.median(xs):10.1f} {max(xs):10.1f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--patients", type=int, default=100_000)
+    ap.add_argument("--reruns", type=int, default=20)
+    args = ap.parse_args()
+
+    print(f"patients={args.patients}  заполнение: {seed(args.patients):.1f} s  ({db.DB_PATH})")
+    print(f"{'mode':<9} {'first ms':>10} {'rerun p50':>10} {'rerun max':>10}")
+    for cached in (False, True):
+        run(cached, args.reruns)
+
+
+if __name__ == "__main__":
+    main()
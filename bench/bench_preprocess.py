@@ -0,0 +1,114 @@
+# bench/bench_preprocess.py
+"""
+Препроцессинг одного снимка для трёх моделей + наложение карты:
+три torchvision Compose и PIL-ресайз против общего Prepared (один декод,
+ресайзы 320/256/224, нормировка одной операцией) в режимах
+PREPROCESS_RESIZE exact и fast.
+
+Кроме времени и отклонения входа — совпадение предсказаний с Compose
+(эталон обучения): каждая модель на каждом снимке images/ (голосование
+гоняет все три модели на любом снимке), top-1 и max |Δp|.
+Код выхода 1, если в режиме exact хоть одно top-1 разошлось.
+
+    python bench/bench_preprocess.py -n 20
+    python bench/bench_preprocess.py --no-models   # только время и вход
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+
+from app.model_registry import MODALITIES, build_transform, registry  # noqa: E402
+from app.preprocess import RESIZE_MODES, Prepared  # noqa: E402
+
+
+@torch.inference_mode()
+def probs(handle, x: torch.Tensor) -> torch.Tensor:
+    out = handle.model(x.unsqueeze(0))[0]
+    return torch.sigmoid(out) if len(handle.classes) == 1 else torch.softmax(out, 0)
+
+
+def top1(p: torch.Tensor) -> int:
+    return int(p[0] >= 0.5) if p.numel() == 1 else int(p.argmax())
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=20, help="повторов на снимок")
+    ap.add_argument("--no-models", action="store_true", help="без сравнения предсказаний")
+    args = ap.parse_args()
+
+    manifests = {m: registry.manifest(m, registry.current_version(m)) for m in MODALITIES}
+    composes = {m: build_transform(man) for m, man in manifests.items()}
+
+    paths = sorted(glob.glob(os.path.join(ROOT, "images", "*", "*", "*")))
+    images = [Image.open(p) for p in paths]
+    for img in images:
+        img.load()
+
+    def old(img):
+        rgb = img.convert("RGB")
+        xs = {m: tf(rgb) for m, tf in composes.items()}
+        overlay = np.array(rgb.resize(tuple(manifests["mri"]["input_size"])))  # повторный ресайз под карту
+        return xs, overlay
+
+    def new(img, resize):
+        p = Prepared(img, resize).pyramid([man["input_size"] for man in manifests.values()])
+        xs = {m: p.tensor(man["input_size"], man["normalization"]["mean"], man["normalization"]["std"])
+              for m, man in manifests.items()}
+        return xs, p.resized(manifests["mri"]["input_size"])
+
+    runs = {"compose": old}
+    runs.update({resize: (lambda img, r=resize: new(img, r)) for resize in RESIZE_MODES})
+    timings = {name: [] for name in runs}
+    max_diff = {resize: {m: 0.0 for m in manifests} for resize in RESIZE_MODES}
+    inputs = []
+    for img in images:
+        ref, _ = old(img)
+        got = {resize: new(img, resize)[0] for resize in RESIZE_MODES}
+        inputs.append((ref, got))
+        for resize in RESIZE_MODES:
+            for m in manifests:
+                max_diff[resize][m] = max(max_diff[resize][m], float((ref[m] - got[resize][m]).abs().max()))
+        for name, fn in runs.items():
+            for _ in range(args.n):
+                t0 = time.perf_counter()
+                fn(img)
+                timings[name].append((time.perf_counter() - t0) * 1000)
+
+    print(f"images: {len(images)}, torch threads: {torch.get_num_threads()}")
+    print(f"{'':<9} {'median, ms':>11} {'p99, ms':>9}")
+    for name, lat in timings.items():
+        print(f"{name:<9} {np.median(lat):11.2f} {np.percentile(lat, 99):9.2f}")
+    for resize in RESIZE_MODES:
+        print(f"max |Δ| нормированного входа, {resize}:",
+              {m: round(v, 3) for m, v in max_diff[resize].items()})
+
+    if args.no_models:
+        return 0
+
+    handles = {m: registry.get(m) for m in MODALITIES}
+    print(f"\n{'resize':<6} {'model':<6} {'n':>3} {'top-1 agree':>11} {'max |Δp|':>9}")
+    failed = False
+    for resize in RESIZE_MODES:
+        for m, handle in handles.items():
+            agree, dp = 0, 0.0
+            for ref, got in inputs:
+                p_ref, p_new = probs(handle, ref[m]), probs(handle, got[resize][m])
+                agree += int(top1(p_ref) == top1(p_new))
+                dp = max(dp, float((p_ref - p_new).abs().max()))
+            print(f"{resize:<6} {m:<6} {len(inputs):>3} {agree / len(inputs):>11.3f} {dp:>9.4f}")
+            failed |= resize == "exact" and agree < len(inputs)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+# bench/bench_queue.py
+"""
+Очередь пациентов на большой базе: страница (offset и keyset), фильтры,
+поиск по ФИО и карточки-счётчики в SQL против старого пути (list_patients
+целиком + сортировка, фильтр и подсчёт в Python).
+
+    python bench/bench_queue.py --patients 100000 --repeat 20
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+
+from app import db  # noqa: E402
+
+SURNAMES = ["Иванов", "Петров", "Сидоров", "Ёлкин", "Смирнов", "Кузнецов", "Попов", "Васильев",
+            "Соколов", "Михайлов", "Новиков", "Фёдоров", "Морозов", "Волков", "Алексеев"]
+NAMES = ["Иван", "Пётр", "Анна", "Мария", "Сергей", "Ольга", "Дмитрий", "Елена"]
+MODALITIES = ["ECG", "MRI", "X-ray"]
+RISKS = ["high", "medium", "low"]
+
+
+def seed(n: int):
+    rnd = random.Random(0)
+    rows = []
+    for i in range(n):
+        risk = rnd.choice(RISKS)
+        rows.append((f"{rnd.choice(SURNAMES)} {rnd.choice(NAMES)} {i}", rnd.choice(MODALITIES), "label", "—",
+                     round(rnd.uniform(0, 100), 2), risk, f"2026-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}T12:00:00"))
+    # база «до миграций»: только исходные таблицы, затем init_db() доводит схему
+    with db.transaction() as conn:
+        db._m1_base(conn.cursor())
+        conn.executemany("""INSERT INTO patients (name, modality, label, diagnosis, probability, risk, created_at)
+                            VALUES (?,?,?,?,?,?,?)""", rows)
+        conn.execute("""INSERT INTO history (patient_id, timestamp, risk)
+                        SELECT id, created_at, risk FROM patients""")
+    t0 = time.perf_counter()
+    db.init_db()   # заполняет risk_rank / name_norm, строит индексы и счётчики
+    return time.perf_counter() - t0
+
+
+def legacy_stats():
+    """Карточки панели как было: все пациенты + разбор created_at в цикле."""
+    rows = legacy(limit=None)
+    week_ago = datetime.now() - timedelta(days=7)
+    recent = sum(1 for p in rows if p.get("created_at") and
+                 datetime.fromisoformat(str(p["created_at"]).split(".")[0]) >= week_ago)
+    return len(rows), sum(1 for p in rows if p.get("risk") == "high"), recent
+
+
+def legacy(risk=None, modality=None, name=None, limit=50, offset=0, after=None):
+    """Как было в панели: все строки, сортировка и фильтры в Python."""
+    with db.connection() as conn:
+        rows = [dict(r) for r in conn.execute("SELECT * FROM patients")]
+    rows.sort(key=lambda r: (db.risk_score(r.get("risk", "low")), float(r.get("probability", 0.0))), reverse=True)
+    out = []
+    for p in rows:
+        if risk and p.get("risk") not in risk: continue
+        if modality and p.get("modality") not in modality: continue
+        if name and name.lower() not in (p.get("name") or "").lower(): continue
+        out.append(p)
+    return out[offset:offset + limit] if limit is not None else out
+
+
+def timed(fn, repeat):
+    xs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        xs.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(xs), max(xs)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--patients", type=int, default=100_000)
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--skip-legacy", action="store_true")
+    args = ap.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_queue_"), "patients.db")
+    db.pool = db.ConnectionPool(path)
+    print(f"patients={args.patients} fts5={db.FTS5}  миграция старой базы: {seed(args.patients):.2f} s")
+
+    mid = args.patients // 2
+    row = db.query_patients(limit=1, offset=mid)[0]
+    cases = [
+        ("первая страница", {}),
+        (f"страница offset={mid}", {"offset": mid}),
+        (f"страница keyset №{mid}", {"after": db.queue_cursor(row)}),
+        ("risk=high", {"risk": ["high"]}),
+        ("risk=high+medium, MRI", {"risk": ["high", "medium"], "modality": ["MRI"]}),
+        ("ФИО «ёлкин ан»", {"name": "ёлкин ан"}),
+        ("ФИО «смир»", {"name": "смир"}),
+    ]
+    print(f"{'запрос':<26} {'SQL p50':>9} {'SQL max':>9} {'legacy p50':>11}   мс")
+    for title, kw in cases:
+        p50, mx = timed(lambda: db.query_patients(**kw), args.repeat)
+        old = "—" if args.skip_legacy else f"{timed(lambda: legacy(**kw), max(1, args.repeat // 5))[0]:11.1f}"
+        print(f"{title:<26} {p50:9.2f} {mx:9.2f} {old:>11}")
+    for title, kw in [("count risk=high", {"risk": ["high"]}), ("count ФИО «ив»", {"name": "ив"})]:
+        p50, mx = timed(lambda: db.count_patients(**kw), args.repeat)
+        print(f"{title:<26} {p50:9.2f} {mx:9.2f}")
+    p50, mx = timed(db.dashboard_stats, args.repeat)
+    old = "—" if args.skip_legacy else f"{timed(legacy_stats, max(1, args.repeat // 5))[0]:11.1f}"
+    print(f"{'карточки панели':<26} {p50:9.2f} {mx:9.2f} {old:>11}")
+    db.pool.close()
+
+
+if __name__ == "__main__":
+    main()
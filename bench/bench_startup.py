@@ -0,0 +1,107 @@
+# bench/bench_startup.py
+"""
+Старт процесса панели: время импорта и память (RSS) по сценариям.
+
+Каждый сценарий — свежий python-процесс:
+    panel    — импорты верхнего уровня frontend/doctor_panel.py (очередь и чат)
+    card     — + app.heatmap_render (открыта карточка с тепловой картой)
+    analysis — + app.predictor (анализ в процессе панели, без сервиса)
+
+Список импортов панели берётся из её исходника (ast), так что бенчмарк
+заметит, если кто-то снова потянет torch или cv2 на верхний уровень.
+
+    python bench/bench_startup.py --repeat 3
+"""
+import argparse
+import ast
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PANEL = os.path.join(ROOT, "frontend", "doctor_panel.py")
+HEAVY = ["torch", "torchvision", "cv2", "numpy", "pandas", "streamlit"]
+SCENARIOS = {
+    "panel": [],
+    "card": ["app.heatmap_render"],
+    "analysis": ["app.heatmap_render", "app.predictor"],
+}
+
+
+def panel_imports():
+    """(модуль, имена) верхнего уровня панели — как при загрузке скрипта."""
+    with open(PANEL, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    out = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            out += [(a.name, []) for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            out.append((node.module, [a.name for a in node.names]))
+    return out
+
+
+def import_all(imports):
+    for module, names in imports:
+        mod = importlib.import_module(module)
+        for name in names:
+            if not hasattr(mod, name):   # from app import db — подмодуль пакета
+                importlib.import_module(f"{module}.{name}")
+
+
+def rss_mb() -> float:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        import resource  # Linux/macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(scenario: str):
+    sys.path.insert(0, ROOT)
+    base = rss_mb()
+    t0 = time.perf_counter()
+    import_all(panel_imports() + [(m, []) for m in SCENARIOS[scenario]])
+    elapsed = (time.perf_counter() - t0) * 1000
+    print(json.dumps({
+        "import_ms": elapsed,
+        "rss_mb": rss_mb(),
+        "delta_mb": rss_mb() - base,
+        "loaded": [m for m in HEAVY if m in sys.modules],
+    }))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--scenario", choices=list(SCENARIOS), nargs="+", default=list(SCENARIOS))
+    ap.add_argument("--child", choices=list(SCENARIOS))
+    args = ap.parse_args()
+
+    if args.child:
+        return child(args.child)
+
+    print(f"{'scenario':<9} {'import ms':>10} {'RSS MB':>8} {'+MB':>7}  загружено")
+    for scenario in args.scenario:
+        runs = []
+        for _ in range(args.repeat):
+            proc = subprocess.run([sys.executable, __file__, "--child", scenario],
+                                  capture_output=True, text=True)
+            if proc.returncode != 0:
+                runs = None
+                print(f"{scenario:<9} ошибка: {proc.stderr.strip().splitlines()[-1]}")
+                break
+            runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        if not runs:
+            continue
+        best = min(runs, key=lambda r: r["import_ms"])
+        print(f"{scenario:<9} {best['import_ms']:10.0f} {best['rss_mb']:8.0f} {best['delta_mb']:7.0f}  "
+              f"{', '.join(best['loaded'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# bench/bench_threads.py
+"""
+Матрица «потоки torch × одновременные прогнозы» на images/: p50/p99 и
+пропускная способность. Каждая клетка — отдельный процесс (число
+inter-op потоков torch меняется только до первого прогноза).
+
+    python bench/bench_threads.py --threads 1 2 4 8 --concurrency 1 2 4 --requests 8
+    python bench/bench_threads.py --threads 2 --concurrency 4 --cpus 0-3
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+
+# кэш результатов (app/result_cache.py) меряет bench_cache.py; здесь повторные
+# снимки должны проходить через модель, а в storage/cache ничего не пишется
+os.environ["RESULT_CACHE"] = "0"
+
+
+def run_cell(concurrency: int, per_worker: int, heatmap: str):
+    from app import predictor as P
+    from app import resources
+
+    paths = sorted(glob.glob(os.path.join(ROOT, "images", "*", "*", "*")))
+    images = [Image.open(p).convert("RGB") for p in paths]
+    workdir = tempfile.mkdtemp(prefix="bench_threads_")
+    P.warm_up()
+    P.predict_image(images[0], workdir, heatmap=heatmap)
+
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(w):
+        wdir = os.path.join(workdir, str(w))
+        os.makedirs(wdir, exist_ok=True)
+        for k in range(per_worker):
+            t0 = time.perf_counter()
+            P.predict_image(images[(w * per_worker + k) % len(images)], wdir, heatmap=heatmap)
+            with lock:
+                latencies.append((time.perf_counter() - t0) * 1000)
+
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    print(json.dumps({
+        "p50": float(np.percentile(latencies, 50)),
+        "p99": float(np.percentile(latencies, 99)),
+        "rps": len(latencies) / wall,
+        "budget": resources.budget(),
+    }))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--requests", type=int, default=8, help="прогнозов на поток")
+    ap.add_argument("--heatmap", choices=["none", "fast", "smooth"], default="fast")
+    ap.add_argument("--cpus", default="", help="INFERENCE_CPUS для всех клеток")
+    ap.add_argument("--cell", type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.cell is not None:
+        return run_cell(args.cell, args.requests, args.heatmap)
+
+    print(f"{'threads':>7} {'conc':>4} {'p50, ms':>9} {'p99, ms':>9} {'req/s':>7}")
+    for threads in args.threads:
+        for conc in args.concurrency:
+            env = dict(os.environ, TORCH_NUM_THREADS=str(threads), TORCH_INTEROP_THREADS="1",
+                       INFERENCE_MAX_CONCURRENT="0", INFERENCE_CPUS=args.cpus)
+            out = subprocess.run(
+                [sys.executable, __file__, "--cell", str(conc), "--requests", str(args.requests),
+                 "--heatmap", args.heatmap],
+                env=env, capture_output=True, text=True,
+            )
+            if out.returncode != 0:
+                print(f"{threads:>7} {conc:>4}  ошибка: {out.stderr.strip().splitlines()[-1:]}")
+                continue
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{threads:>7} {conc:>4} {r['p50']:9.1f} {r['p99']:9.1f} {r['rps']:7.2f}")
+
+
+if __name__ == "__main__":
+    main()
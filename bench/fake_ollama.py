@@ -0,0 +1,102 @@
+# bench/fake_ollama.py
+"""
+Подставной Ollama для проверки чата без модели: GET / и потоковый
+POST /api/generate (NDJSON, chunked), как у настоящего сервера.
+Считает TCP-соединения и оборванные клиентом ответы.
+
+    python bench/fake_ollama.py --port 11434 --tokens 50 --delay-ms 20
+    OLLAMA_URL=http://127.0.0.1:11434 streamlit run frontend/doctor_panel.py
+"""
+import argparse
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOllama(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, tokens: int = 50, delay_ms: float = 20, first_token_ms: float = 0):
+        self.tokens = tokens
+        self.delay = delay_ms / 1000
+        self.first_token = first_token_ms / 1000
+        self.connections = 0
+        self.requests = 0
+        self.aborted = 0
+        self._lock = threading.Lock()
+        super().__init__(("127.0.0.1", port), _Handler)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def start(self) -> "FakeOllama":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive
+
+    def setup(self):
+        super().setup()
+        # как в Go (настоящий Ollama): без Нейгла, иначе мелкие куски ждут ACK
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.count("connections")
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = b"Ollama is running"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _chunk(self, obj):
+        line = json.dumps(obj, ensure_ascii=False).encode() + b"\n"
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+    def do_POST(self):
+        self.server.count("requests")
+        req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        srv = self.server
+        try:
+            time.sleep(srv.first_token)
+            for i in range(srv.tokens):
+                time.sleep(srv.delay)
+                self._chunk({"model": req.get("model"), "response": f"слово{i} ", "done": False})
+            self._chunk({"model": req.get("model"), "response": "", "done": True, "eval_count": srv.tokens})
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            srv.count("aborted")
+            self.close_connection = True
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=11434)
+    ap.add_argument("--tokens", type=int, default=50)
+    ap.add_argument("--delay-ms", type=float, default=20)
+    ap.add_argument("--first-token-ms", type=float, default=300, help="имитация prefill")
+    args = ap.parse_args()
+    srv = FakeOllama(args.port, args.tokens, args.delay_ms, args.first_token_ms)
+    print(f"fake ollama: {srv.url}")
+    srv.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# bench/load_test.py
+"""
+Нагрузочный тест сервиса инференса: p50/p99 задержки при N одновременных врачах.
+Запросы идут мимо кэша результатов сервиса (use_cache=False): снимков в images/
+меньше, чем запросов, и иначе мерились бы попадания в кэш.
+
+    python -m app.inference_server &
+    python bench/load_test.py --users 1 2 4 8 --requests 10
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+
+os.environ.setdefault("INFERENCE_FALLBACK_LOCAL", "0")
+from app import inference_client  # noqa: E402
+
+
+def run_level(images, users, per_user, workdir):
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def doctor(uid):
+        for k in range(per_user):
+            img = images[(uid * per_user + k) % len(images)]
+            t0 = time.perf_counter()
+            try:
+                inference_client.predict_image(img, os.path.join(workdir, str(uid)), use_cache=False)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                latencies.append((time.perf_counter() - t0) * 1000)
+
+    for uid in range(users):
+        os.makedirs(os.path.join(workdir, str(uid)), exist_ok=True)
+    threads = [threading.Thread(target=doctor, args=(u,)) for u in range(users)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    return latencies, errors, wall
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--requests", type=int, default=10, help="запросов на пользователя")
+    args = ap.parse_args()
+
+    if not inference_client.is_available():
+        sys.exit(f"Сервис не отвечает на {inference_client.SERVER_URL}. Запустите: python -m app.inference_server")
+
+    paths = sorted(glob.glob(os.path.join(ROOT, "images", "*", "*", "*")))
+    images = [Image.open(p).convert("RGB") for p in paths]
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+
+    print(f"{'users':>5} {'n':>5} {'p50, ms':>9} {'p99, ms':>9} {'req/s':>7} {'errors':>6}")
+    for users in args.users:
+        lat, errors, wall = run_level(images, users, args.requests, workdir)
+        if lat:
+            p50, p99 = np.percentile(lat, 50), np.percentile(lat, 99)
+        else:
+            p50 = p99 = float("nan")
+        print(f"{users:>5} {len(lat):>5} {p50:9.1f} {p99:9.1f} {len(lat) / wall:7.2f} {len(errors):>6}")
+
+
+if __name__ == "__main__":
+    main()
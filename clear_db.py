@@ -1,14 +1,8 @@
-import os
-import sqlite3
-from app.db import DB_PATH
+from app.db import DB_PATH, clear_patients
 
 print("Используемая база:", DB_PATH)
 
-conn = sqlite3.connect(DB_PATH)
-cur = conn.cursor()
-cur.execute("DELETE FROM history;")
-cur.execute("DELETE FROM patients;")
-conn.commit()
-conn.close()
+# через app.db: одна транзакция, счётчики карточек и версия данных обновляются
+removed = clear_patients()
 
-print("Готово! База очищена.")
+print(f"Готово! База очищена (пациентов удалено: {removed}).")
@@ -1,30 +1,83 @@
 # frontend/doctor_panel.py
 import os
 import sys
-import uuid
-from datetime import datetime, timedelta
+import threading
+from datetime import date
 
 import pandas as pd
-import requests
 import streamlit as st
 from PIL import Image
 
 # ---------- локальные модули ----------
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from app.db import (
+    dashboard_stats,
     get_history,
     get_patient,
     init_db,
     insert_or_update_patient,
-    list_patients,
+    count_patients,
+    query_patients,
+    queue_cursor,
 )
-from app.chat_local import local_ai_chat
+from app import chat_context
+from app.chat_local import client as chat_client, stream_chat
 
 STORAGE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "storage")
 os.makedirs(STORAGE_DIR, exist_ok=True)
 
-import app.predictor as P
-print("LOADED PREDICTOR FROM:", P.__file__)
+QUEUE_PAGE = 50     # строк очереди на странице
+PICKER_LIMIT = 20   # совпадений в поиске карточки
+
+# анализ идёт через локальный сервис инференса (python -m app.inference_server);
+# torch/torchvision/cv2 в процесс панели не импортируются: app.predictor
+# подгружается только запасным путём анализа, app.heatmap_render — в карточке
+from app import artifact_store, artifacts, inference_client
+from app import db
+
+# ---------- кэши между перерисовками ----------
+# Streamlit выполняет скрипт целиком на каждое действие. Один раз на сервер
+# (st.cache_resource): схема и пул соединений БД, статические CSS/HTML. Модели
+# живут в сервисе инференса (или в реестре процесса при локальном запасном пути).
+# Запросы к базе — st.cache_data с TTL; в ключе db.data_revision() — счётчик,
+# который insert_or_update_patient и clear_patients увеличивают в своей
+# транзакции, так что запись из любой сессии или процесса (и clear_db.py)
+# сразу делает кэш устаревшим; карточки «за 7 дней» ещё и по сегодняшней дате.
+PANEL_CACHE = os.environ.get("PANEL_CACHE", "1") == "1"      # 0 — без кэша (для сравнения)
+CACHE_TTL = int(os.environ.get("PANEL_CACHE_TTL", "300"))    # секунды
+
+def _cache_data(fn):
+    return st.cache_data(ttl=CACHE_TTL, max_entries=512, show_spinner=False)(fn) if PANEL_CACHE else fn
+
+@st.cache_resource
+def database():
+    init_db()   # миграции схемы — один раз на сервер
+    return db.pool
+
+@st.cache_resource
+def static_asset(name: str) -> str:
+    with open(os.path.join(os.path.dirname(__file__), "static", name), encoding="utf-8") as f:
+        return f.read()
+
+@_cache_data
+def cached_stats(rev: int, today: str):
+    return dashboard_stats(days=7)
+
+@_cache_data
+def cached_queue(rev: int, risk, modality, name, sort, limit, after):
+    return query_patients(risk, modality, name, sort=sort, limit=limit, after=after)
+
+@_cache_data
+def cached_count(rev: int, risk, modality, name):
+    return count_patients(risk, modality, name)
+
+@_cache_data
+def cached_patient(rev: int, pid: int):
+    return get_patient(pid)
+
+@_cache_data
+def cached_history(rev: int, pid: int):
+    return get_history(pid)
 
 # ---------- базовая настройка страницы ----------
 st.set_page_config(
@@ -34,117 +87,20 @@ st.set_page_config(
 )
 
 # ---------- CSS: сдержанный «официальный» стиль ----------
-st.markdown(
-    """
-<style>
-/* скрываем стандартные части стримлита */
-#MainMenu {visibility: hidden;}
-footer {visibility: hidden;}
-header {visibility: hidden;}
-
-body { background-color: #F9FAFB; }
-
-/* верхняя панель */
-.top-nav {
-  position: sticky; top: 0; z-index: 50;
-  background: white; padding: 12px 20px;
-  border-bottom: 1px solid #E5E7EB;
-  display: flex; align-items: center; justify-content: space-between;
-}
-
-.top-nav-left { display: flex; align-items: center; gap: 10px; }
-.top-nav-logo {
-  width: 30px; height: 30px; border-radius: 999px;
-  background: linear-gradient(135deg, #2563EB, #0EA5E9);
-  color: white; font-weight: 700; font-size: 16px;
-  display: flex; align-items: center; justify-content: center;
-}
-.top-nav-title { font-size: 18px; font-weight: 700; color: #111827; }
-.top-nav-subtitle { font-size: 12px; color: #6B7280; margin-top: 2px; }
-
-/* метрики */
-.metric-card {
-  padding: 14px 16px; border-radius: 12px; background: white;
-  border: 1px solid #E5E7EB;
-}
-.metric-label { font-size: 11px; text-transform: uppercase; color: #6B7280; letter-spacing: .05em; }
-.metric-value { font-size: 22px; font-weight: 700; color: #111827; margin-top: 4px; }
-.metric-extra { font-size: 12px; color: #6B7280; }
-
-/* карточки */
-.card {
-  padding: 16px 18px; border-radius: 12px; background: white;
-  border: 1px solid #E5E7EB; box-shadow: 0 4px 10px rgba(15,23,42,0.03);
-}
-
-/* бейджи риска */
-.badge { display:inline-block; padding:2px 8px; border-radius:999px; font-size:12px; font-weight:600; }
-.badge-high { background:#FEF2F2; color:#B91C1C; border:1px solid #FECACA; }
-.badge-medium { background:#FFFBEB; color:#92400E; border:1px solid #FDE68A; }
-.badge-low { background:#ECFDF5; color:#065F46; border:1px solid #A7F3D0; }
-
-/* разделитель-блок (визуальная пауза) */
-.section { margin-top: 10px; }
-
-/* кнопка-акцент */
-button[kind="primary"] { font-weight: 600; }
-
-/* контейнер ассистента справа */
-.assistant {
-  position: relative;
-  height: calc(100% - 0px);
-}
-.chat-box {
-  max-height: 60vh; overflow: auto; padding-right: 4px;
-  border: 1px solid #E5E7EB; border-radius: 10px; padding: 8px 10px; background: #FBFBFD;
-}
-.chat-msg { margin: 6px 0; padding: 10px 12px; border-radius: 10px; }
-.chat-user { background: #F3F4F6; }
-.chat-ai { background: #EEF6FF; }
-.chat-label { font-size:12px; font-weight:600; margin-bottom:4px; color:#6B7280; }
-</style>
-""",
-    unsafe_allow_html=True,
-)
+st.markdown(f"<style>\n{static_asset('panel.css')}</style>", unsafe_allow_html=True)
 
 # ---------- верхняя панель ----------
-st.markdown(
-    """
-<div class="top-nav">
-  <div class="top-nav-left">
-    <div class="top-nav-logo">AI</div>
-    <div>
-      <div class="top-nav-title">HealHub</div>
-      <div class="top-nav-subtitle">Панель врача • ЭКГ / МРТ / ФЛГ</div>
-    </div>
-  </div>
-  <div style="font-size:13px;color:#4B5563;"></div>
-</div>
-""",
-    unsafe_allow_html=True,
-)
+st.markdown(static_asset("top_nav.html"), unsafe_allow_html=True)
 
 # ---------- данные ----------
-init_db()
-
-from app.db import migrate_db
-migrate_db()
-
-all_patients = list_patients() or []
-
-# метрики
-total_patients = len(all_patients)
-high_risk = sum(1 for p in all_patients if p.get("risk") == "high")
-week_ago = datetime.now() - timedelta(days=7)
-recent = 0
-for p in all_patients:
-    ts = p.get("created_at")
-    if not ts: continue
-    try:
-        dt = datetime.fromisoformat(str(ts).split(".")[0])
-        if dt >= week_ago: recent += 1
-    except:  # noqa
-        pass
+database()
+rev = db.data_revision()   # один запрос по ключу; от него зависят все кэши ниже
+
+# метрики — готовые счётчики из базы, без чтения всех пациентов
+stats = cached_stats(rev, date.today().isoformat())
+total_patients = stats["patients"]
+high_risk = stats["high_risk"]
+recent = stats["recent"]
 
 # ---------- блок метрик ----------
 m1, m2, m3 = st.columns([1, 1, 1])
@@ -205,6 +161,22 @@ with left:
             key="new_mod"
         )
 
+        hm_col, deferred_col = st.columns([1.4, 1])
+        with hm_col:
+            heatmap_ui = st.selectbox(
+                "Тепловая карта",
+                ["Точная (SmoothGrad-CAM++)", "Быстрая (Grad-CAM)", "Без карты"],
+                index=0,
+                key="new_heatmap"
+            )
+        with deferred_col:
+            heatmap_deferred = st.checkbox(
+                "Строить карту в фоне",
+                value=False,
+                key="new_heatmap_deferred",
+                help="Диагноз сохраняется сразу, карта появится в карточке, когда будет готова."
+            )
+
         # ---- состояние превью ----
         if "show_preview" not in st.session_state:
             st.session_state["show_preview"] = True
@@ -237,8 +209,6 @@ with left:
 
         if analyze_clicked:
             with st.spinner("Выполняется анализ снимка..."):
-                from app import predictor
-
                 # маппинг модальности
                 forced_map = {
                     "Автоопределение": None,
@@ -248,26 +218,27 @@ with left:
                 }
 
                 forced = forced_map.get(modality_ui)
-
-                summary, heatmap_path, payload = predictor.predict_image(
+                heatmap_mode = {
+                    "Точная (SmoothGrad-CAM++)": "smooth",
+                    "Быстрая (Grad-CAM)": "fast",
+                    "Без карты": "none",
+                }.get(heatmap_ui, "smooth")
+
+                # отложенная карта пишется в фоне сразу в итоговый файл в STORAGE_DIR;
+                # имя выбирает сервис (или predictor при анализе в процессе)
+                summary, heatmap_path, payload = inference_client.predict_image(
                     pil_img,
                     STORAGE_DIR,
-                    forced_modality=forced
+                    forced_modality=forced,
+                    heatmap=heatmap_mode,
+                    deferred=heatmap_deferred and heatmap_mode != "none",
                 )
 
+            # save original: байты загрузки как есть, повторная загрузка — тот же файл
+            orig_path = artifact_store.save_upload(uploaded.getvalue(), uploaded.name, STORAGE_DIR)
 
-            # save original
-            uid = uuid.uuid4().hex[:8]
-            orig_path = os.path.join(STORAGE_DIR, f"{uid}_orig.png")
-            pil_img.save(orig_path)
-
-            # save heatmap
-            hmap = None
-            if heatmap_path and os.path.exists(heatmap_path):
-                import shutil
-                new_hm = os.path.join(STORAGE_DIR, f"{uid}_heatmap.png")
-                shutil.copyfile(heatmap_path, new_hm)
-                hmap = new_hm
+            # heatmap: уже записана (или пишется в фоне) под уникальным именем в STORAGE_DIR
+            hmap = heatmap_path
 
             # save to database
             pid = insert_or_update_patient(
@@ -292,14 +263,16 @@ with left:
     with tabs[1]:
         st.subheader("Очередь пациентов")
 
-        if not all_patients:
+        if not total_patients:
             st.info("Пока нет записей. Добавьте пациента во вкладке «Новый анализ».")
         else:
             risk_map = {"high":"🚨 Высокий","medium":"⚠️ Средний","low":"✅ Низкий"}
             mod_ru = {"ECG":"ЭКГ","MRI":"МРТ","X-ray":"Флюорография"}
 
+            sort_ru = {"risk":"По риску","recent":"Сначала новые","name":"По ФИО"}
+
             with st.expander("Фильтры", expanded=False):
-                cfa, cfb, cfc = st.columns([1,1,1.2])
+                cfa, cfb, cfc, cfd = st.columns([1,1,1.2,0.9])
                 with cfa:
                     risk_filter = st.multiselect(
                         "Риск", ["high","medium","low"], format_func=lambda r: risk_map.get(r,r)
@@ -310,18 +283,31 @@ with left:
                     )
                 with cfc:
                     name_filter = st.text_input("Поиск по ФИО", placeholder="Начните вводить фамилию")
-
-            filtered = []
-            for p in all_patients:
-                if risk_filter and p.get("risk") not in risk_filter: continue
-                if mod_filter and p.get("modality") not in mod_filter: continue
-                if name_filter and name_filter.lower() not in (p.get("name") or "").lower(): continue
-                filtered.append(p)
-
-            if not filtered:
+                with cfd:
+                    queue_sort = st.selectbox("Порядок", list(sort_ru), format_func=sort_ru.get)
+
+            # фильтры и сортировка — в SQL (индексы по риску, типу, ФИО); страницы —
+            # по ключу последней строки (keyset), в сессии хранятся только курсоры
+            queue_key = (tuple(risk_filter), tuple(mod_filter), name_filter, queue_sort)
+            if st.session_state.get("queue_key") != queue_key:
+                st.session_state["queue_key"] = queue_key
+                st.session_state["queue_cursors"] = [None]   # начало каждой открытой страницы
+            cursors = st.session_state["queue_cursors"]
+
+            # строка сверх страницы — признак того, что есть следующая
+            rows = cached_queue(rev, risk_filter, mod_filter, name_filter, queue_sort,
+                                QUEUE_PAGE + 1, cursors[-1])
+            page, has_next = rows[:QUEUE_PAGE], len(rows) > QUEUE_PAGE
+
+            if not page and len(cursors) > 1:
+                # страница опустела (записи изменились) — к началу очереди
+                cursors[:] = [None]
+                st.rerun()
+
+            if not page:
                 st.warning("По выбранным фильтрам пациенты не найдены.")
             else:
-                df = pd.DataFrame(filtered)[
+                df = pd.DataFrame(page)[
                     ["id","name","modality","label","risk","probability","created_at"]
                 ].rename(columns={
                     "id":"№","name":"ФИО","modality":"Тип","label":"Заключение",
@@ -339,187 +325,241 @@ with left:
                     }
                 )
 
-                # выбор пациента
-                id_to_patient = {p["id"]: p for p in filtered}
+                cprev, cinfo, cnext = st.columns([1,2,1])
+                with cprev:
+                    if st.button("← Назад", disabled=len(cursors) == 1, key="queue_prev"):
+                        cursors.pop()
+                        st.rerun()
+                with cinfo:
+                    found = cached_count(rev, risk_filter, mod_filter, name_filter)
+                    st.caption(f"Страница {len(cursors)} · найдено пациентов: {found}")
+                with cnext:
+                    if st.button("Далее →", disabled=not has_next, key="queue_next"):
+                        cursors.append(queue_cursor(page[-1], queue_sort))
+                        st.rerun()
+
+            # выбор пациента: поиск по ФИО или номеру — из базы берутся только совпадения
+            pick_query = st.text_input(
+                "Карточка пациента:", key="pick_query",
+                placeholder="ФИО или № (пусто — пациенты текущей страницы)",
+            ).strip().lstrip("#")
+            if pick_query.isdigit():
+                options = [x for x in [cached_patient(rev, int(pick_query))] if x]
+            elif pick_query:
+                options = cached_queue(rev, None, None, pick_query, "name", PICKER_LIMIT, None)
+            else:
+                options = page
+
+            selected_pid = None
+            if options:
+                id_to_patient = {p["id"]: p for p in options}
                 selected_pid = st.selectbox(
-                    "Карточка пациента:",
+                    "Найдено:" if pick_query else "На странице:",
                     options=list(id_to_patient.keys()),
                     format_func=lambda pid: f"#{pid} — {id_to_patient[pid]['name']} — {id_to_patient[pid]['label']}",
                 )
-
-                if st.button("Открыть карточку", type="primary"):
-                    p = get_patient(int(selected_pid))
-                    if not p:
-                        st.warning("Пациент не найден.")
-                    else:
-                        st.markdown("")  # небольшая пауза
-                        c1, c2 = st.columns([1.4, 1.4])
-
-                        with c1:
-                            st.markdown(
-                                f"""<div class="card">
-                                <h4 style="margin:0;">🧾 Пациент #{p['id']}: {p['name']}</h4>
-                                <p style="font-size:13px;color:#6B7280;margin:.4rem 0 0;">
-                                  Дата записи: {p.get('created_at') or '—'}
-                                </p></div>""",
-                                unsafe_allow_html=True,
-                            )
-                            if p.get("image_path") and os.path.exists(p["image_path"]):
-                                st.image(p["image_path"], caption="Исходное изображение", use_container_width=True)
-                            else:
-                                st.info("Исходное изображение не найдено.")
-                            if p.get("heatmap_path") and os.path.exists(p["heatmap_path"]):
-                                st.image(p["heatmap_path"], caption="Тепловая карта (Grad‑CAM)", use_container_width=True)
+            elif pick_query:
+                st.info("Совпадений нет.")
+
+            # карточка остаётся открытой между перерисовками (ползунки карты)
+            if st.button("Открыть карточку", type="primary", disabled=selected_pid is None):
+                st.session_state["card_pid"] = int(selected_pid)
+            if selected_pid is not None and st.session_state.get("card_pid") == int(selected_pid):
+                p = cached_patient(rev, int(selected_pid))
+                if not p:
+                    st.warning("Пациент не найден.")
+                else:
+                    st.markdown("")  # небольшая пауза
+                    c1, c2 = st.columns([1.4, 1.4])
+
+                    with c1:
+                        st.markdown(
+                            f"""<div class="card">
+                            <h4 style="margin:0;">🧾 Пациент #{p['id']}: {p['name']}</h4>
+                            <p style="font-size:13px;color:#6B7280;margin:.4rem 0 0;">
+                              Дата записи: {p.get('created_at') or '—'}
+                            </p></div>""",
+                            unsafe_allow_html=True,
+                        )
+                        if p.get("image_path") and os.path.exists(p["image_path"]):
+                            st.image(p["image_path"], caption="Исходное изображение", use_container_width=True)
+                        else:
+                            st.info("Исходное изображение не найдено.")
+                        if p.get("heatmap_path") and os.path.exists(p["heatmap_path"]):
+                            hm_img = p["heatmap_path"]
+                            if artifacts.is_cam_file(hm_img):
+                                # cv2/numpy грузятся только при открытии карточки с картой
+                                from app import heatmap_render
+                                a_col, cm_col = st.columns(2)
+                                with a_col:
+                                    hm_alpha = st.slider("Прозрачность карты", 0.0, 1.0, 0.5, 0.05,
+                                                         key="card_hm_alpha")
+                                with cm_col:
+                                    hm_cmap = st.selectbox("Палитра", list(heatmap_render.COLORMAPS),
+                                                           key="card_hm_cmap")
+                                hm_img = heatmap_render.render(p.get("image_path"), hm_img,
+                                                               hm_alpha, hm_cmap)
+                            if hm_img is not None:
+                                st.image(hm_img, caption="Тепловая карта (Grad‑CAM)", use_container_width=True)
                             else:
-                                st.caption("Тепловая карта не сохранена или недоступна.")
-
-                        with c2:
-                            st.markdown("#### Клиническая сводка")
-                            risk = (p.get("risk") or "low")
-                            risk_badge = {
-                                "high": '<span class="badge badge-high">Высокий риск</span>',
-                                "medium": '<span class="badge badge-medium">Средний риск</span>',
-                                "low": '<span class="badge badge-low">Низкий риск</span>',
-                            }.get(risk, '<span class="badge">—</span>')
-
-                            st.markdown(f"**Тип исследования:** {p.get('modality') or '—'}")
-                            st.markdown(f"**Заключение (модель):** {p.get('label') or '—'}")
-                            st.markdown(f"**Вероятность:** {p.get('probability') or '—'}%")
-                            st.markdown(f"**Риск:** {risk_badge}", unsafe_allow_html=True)
-                            st.markdown(f"**Комментарий ИИ:** {p.get('diagnosis') or '—'}")
-                            st.caption("Система носит рекомендательный характер и не заменяет врача.")
-
-                        import altair as alt
-
-                        st.markdown("#### 📈 Динамика пациента")
-
-                        hist = get_history(int(selected_pid))
-                        if not hist:
-                            st.info("История для этого пациента пока пуста.")
+                                st.caption("Нет исходного снимка для наложения карты.")
+                        elif p.get("heatmap_path"):
+                            # отложенный режим: файл появится, когда фоновый поток закончит
+                            st.info("⏳ Тепловая карта готовится — откройте карточку чуть позже.")
                         else:
-                            hdf = pd.DataFrame(hist).copy()
+                            st.caption("Тепловая карта не сохранена или недоступна.")
+
+                    with c2:
+                        st.markdown("#### Клиническая сводка")
+                        risk = (p.get("risk") or "low")
+                        risk_badge = {
+                            "high": '<span class="badge badge-high">Высокий риск</span>',
+                            "medium": '<span class="badge badge-medium">Средний риск</span>',
+                            "low": '<span class="badge badge-low">Низкий риск</span>',
+                        }.get(risk, '<span class="badge">—</span>')
+
+                        st.markdown(f"**Тип исследования:** {p.get('modality') or '—'}")
+                        st.markdown(f"**Заключение (модель):** {p.get('label') or '—'}")
+                        st.markdown(f"**Вероятность:** {p.get('probability') or '—'}%")
+                        st.markdown(f"**Риск:** {risk_badge}", unsafe_allow_html=True)
+                        st.markdown(f"**Комментарий ИИ:** {p.get('diagnosis') or '—'}")
+                        st.caption("Система носит рекомендательный характер и не заменяет врача.")
+
+                    import altair as alt
+
+                    st.markdown("#### 📈 Динамика пациента")
+
+                    hist = cached_history(rev, int(selected_pid))
+                    if not hist:
+                        st.info("История для этого пациента пока пуста.")
+                    else:
+                        hdf = pd.DataFrame(hist).copy()
 
-                            # аккуратно парсим время
-                            if "timestamp" in hdf.columns:
-                                hdf["timestamp"] = pd.to_datetime(hdf["timestamp"], errors="coerce")
-                                hdf = hdf.dropna(subset=["timestamp"]).sort_values("timestamp")
-                            else:
-                                st.info("В истории нет поля времени, графики построить нельзя.")
-                                st.stop()
-
-                            # если modality ещё не было (старые записи) — ставим Unknown
-                            if "modality" not in hdf.columns:
-                                hdf["modality"] = "Unknown"
-
-                            # словари для подписи
-                            mod_ru = {"ECG": "ЭКГ", "MRI": "МРТ", "X-ray": "Флюорография", "Unknown": "Без типа"}
-                            risk_ru = {"low": "Низкий", "medium": "Средний", "high": "Высокий"}
-
-                            # ---------- общая таблица всех исследований ----------
-                            st.markdown("#### 📋 Все исследования пациента")
-
-                            label_ru_map = {
-                                "Normal": "Норма",
-                                "Arrhythmia": "Аритмия",
-                                "Critical": "Критическое состояние",
-                                "glioma": "Глиома",
-                                "meningioma": "Менингиома",
-                                "pituitary": "Опухоль гипофиза",
-                                "notumor": "Без признаков опухоли",
-                                "🟢 Вероятно норма": "🟢 Вероятно норма",
-                                "🟡 Подозрительно": "🟡 Подозрительно",
-                                "🔴 Критично": "🔴Критично",
+                        # аккуратно парсим время
+                        if "timestamp" in hdf.columns:
+                            hdf["timestamp"] = pd.to_datetime(hdf["timestamp"], errors="coerce")
+                            hdf = hdf.dropna(subset=["timestamp"]).sort_values("timestamp")
+                        else:
+                            st.info("В истории нет поля времени, графики построить нельзя.")
+                            st.stop()
+
+                        # если modality ещё не было (старые записи) — ставим Unknown
+                        if "modality" not in hdf.columns:
+                            hdf["modality"] = "Unknown"
+
+                        # словари для подписи
+                        mod_ru = {"ECG": "ЭКГ", "MRI": "МРТ", "X-ray": "Флюорография", "Unknown": "Без типа"}
+                        risk_ru = {"low": "Низкий", "medium": "Средний", "high": "Высокий"}
+
+                        # ---------- общая таблица всех исследований ----------
+                        st.markdown("#### 📋 Все исследования пациента")
+
+                        label_ru_map = {
+                            "Normal": "Норма",
+                            "Arrhythmia": "Аритмия",
+                            "Critical": "Критическое состояние",
+                            "glioma": "Глиома",
+                            "meningioma": "Менингиома",
+                            "pituitary": "Опухоль гипофиза",
+                            "notumor": "Без признаков опухоли",
+                            "🟢 Вероятно норма": "🟢 Вероятно норма",
+                            "🟡 Подозрительно": "🟡 Подозрительно",
+                            "🔴 Критично": "🔴Критично",
+                        }
+                       
+                        table_cols = ["timestamp", "modality", "label", "probability", "risk"]
+                        if "model_version" in hdf.columns:
+                            table_cols.append("model_version")
+                        table_df = hdf[table_cols].copy()
+                        table_df["label"] = table_df["label"].map(label_ru_map).fillna(table_df["label"])
+                        table_df["modality"] = table_df["modality"].map(mod_ru).fillna(table_df["modality"])
+                        table_df["risk"] = table_df["risk"].map(risk_ru).fillna(table_df["risk"])
+                        table_df = table_df.rename(
+                            columns={
+                                "timestamp": "Время",
+                                "modality": "Тип исследования",
+                                "label": "Заключение",
+                                "probability": "Вероятность, %",
+                                "risk": "Риск",
+                                "model_version": "Версия модели",
                             }
-                           
-                            table_df = hdf[["timestamp", "modality", "label", "probability", "risk"]].copy()
-                            table_df["label"] = table_df["label"].map(label_ru_map).fillna(table_df["label"])
-                            table_df["modality"] = table_df["modality"].map(mod_ru).fillna(table_df["modality"])
-                            table_df["risk"] = table_df["risk"].map(risk_ru).fillna(table_df["risk"])
-                            table_df = table_df.rename(
-                                columns={
-                                    "timestamp": "Время",
-                                    "modality": "Тип исследования",
-                                    "label": "Заключение",
-                                    "probability": "Вероятность, %",
-                                    "risk": "Риск",
-                                }
-                            )
-                            st.dataframe(table_df, use_container_width=True, hide_index=True)
-
-                            # ---------- вкладки по типам исследований ----------
-                            st.markdown("#### 🔍 Динамика по типам исследований")
-
-                            # порядок типов
-                            mods_order = ["ECG", "MRI", "X-ray", "Unknown"]
-                            mods_in_data = [m for m in mods_order if m in set(hdf["modality"])]
-                            if not mods_in_data:
-                                mods_in_data = sorted(hdf["modality"].dropna().unique().tolist())
-
-                            tabs = st.tabs(
-                                [f"{mod_ru.get(m, m)} ({(hdf['modality'] == m).sum()})" for m in mods_in_data]
-                            )
-
-                            risk_domain = ["low", "medium", "high"]
-                            risk_range = ["#10B981", "#F59E0B", "#EF4444"]  # зелёный / янтарный / красный
-
-                            for tab, mod in zip(tabs, mods_in_data):
-                                with tab:
-                                    df_mod = hdf[hdf["modality"] == mod].copy()
-                                    if df_mod.empty:
-                                        st.info("Для этого типа нет исследований.")
-                                        continue
-
-                                    st.markdown(f"##### {mod_ru.get(mod, mod)}")
-
-                                    # 1) Мини-метрика Health Index
-                                    from app.db import health_index
-                                    df_mod["health"] = df_mod.apply(lambda r: health_index(r["label"], r["risk"]), axis=1)
-
-                                    if len(df_mod) >= 2:
-                                        delta_h = df_mod["health"].iloc[-1] - df_mod["health"].iloc[0]
-                                        current_h = df_mod["health"].iloc[-1]
-                                        st.metric(
-                                            "Индекс состояния здоровья",
-                                            f"{current_h:.0f}/100",
-                                            f"{delta_h:+.0f} пунктов"
-                                        )
-                                    else:
-                                        st.metric(
-                                            "Индекс состояния здоровья",
-                                            f"{df_mod['health'].iloc[-1]:.0f}/100",
-                                            "только одно измерение"
-                                        )
-
-                                    # 2) ГРАФИК Health Index
-                                    chart_health = (
-                                        alt.Chart(df_mod)
-                                        .mark_line(point=True)
-                                        .encode(
-                                            x=alt.X("timestamp:T", title="Дата/время"),
-                                            y=alt.Y("health:Q", title="Индекс здоровья (0–100)", scale=alt.Scale(domain=[0, 100])),
-                                            tooltip=[
-                                                alt.Tooltip("timestamp:T", title="Время"),
-                                                alt.Tooltip("label:N", title="Заключение"),
-                                                alt.Tooltip("risk:N", title="Риск"),
-                                                alt.Tooltip("health:Q", title="Health Index"),
-                                            ],
-                                            color=alt.value("#2563EB")
-                                        )
-                                        .properties(height=240)
+                        )
+                        st.dataframe(table_df, use_container_width=True, hide_index=True)
+
+                        # ---------- вкладки по типам исследований ----------
+                        st.markdown("#### 🔍 Динамика по типам исследований")
+
+                        # порядок типов
+                        mods_order = ["ECG", "MRI", "X-ray", "Unknown"]
+                        mods_in_data = [m for m in mods_order if m in set(hdf["modality"])]
+                        if not mods_in_data:
+                            mods_in_data = sorted(hdf["modality"].dropna().unique().tolist())
+
+                        tabs = st.tabs(
+                            [f"{mod_ru.get(m, m)} ({(hdf['modality'] == m).sum()})" for m in mods_in_data]
+                        )
+
+                        risk_domain = ["low", "medium", "high"]
+                        risk_range = ["#10B981", "#F59E0B", "#EF4444"]  # зелёный / янтарный / красный
+
+                        for tab, mod in zip(tabs, mods_in_data):
+                            with tab:
+                                df_mod = hdf[hdf["modality"] == mod].copy()
+                                if df_mod.empty:
+                                    st.info("Для этого типа нет исследований.")
+                                    continue
+
+                                st.markdown(f"##### {mod_ru.get(mod, mod)}")
+
+                                # 1) Мини-метрика Health Index
+                                from app.db import health_index
+                                df_mod["health"] = df_mod.apply(lambda r: health_index(r["label"], r["risk"]), axis=1)
+
+                                if len(df_mod) >= 2:
+                                    delta_h = df_mod["health"].iloc[-1] - df_mod["health"].iloc[0]
+                                    current_h = df_mod["health"].iloc[-1]
+                                    st.metric(
+                                        "Индекс состояния здоровья",
+                                        f"{current_h:.0f}/100",
+                                        f"{delta_h:+.0f} пунктов"
+                                    )
+                                else:
+                                    st.metric(
+                                        "Индекс состояния здоровья",
+                                        f"{df_mod['health'].iloc[-1]:.0f}/100",
+                                        "только одно измерение"
                                     )
 
-                                    st.altair_chart(chart_health, use_container_width=True)
+                                # 2) ГРАФИК Health Index
+                                chart_health = (
+                                    alt.Chart(df_mod)
+                                    .mark_line(point=True)
+                                    .encode(
+                                        x=alt.X("timestamp:T", title="Дата/время"),
+                                        y=alt.Y("health:Q", title="Индекс здоровья (0–100)", scale=alt.Scale(domain=[0, 100])),
+                                        tooltip=[
+                                            alt.Tooltip("timestamp:T", title="Время"),
+                                            alt.Tooltip("label:N", title="Заключение"),
+                                            alt.Tooltip("risk:N", title="Риск"),
+                                            alt.Tooltip("health:Q", title="Health Index"),
+                                        ],
+                                        color=alt.value("#2563EB")
+                                    )
+                                    .properties(height=240)
+                                )
+
+                                st.altair_chart(chart_health, use_container_width=True)
 
 # ===================== ПРАВАЯ КОЛОНКА (Ассистент) =====================
 with right:
     st.markdown("### 🧠 Ассистент")
-    # статус Ollama
-    try:
-        requests.get("http://localhost:11434", timeout=2)
-        ollama_online = True
+    # статус Ollama — из фоновой проверки chat_local.client, без запроса на перерисовку
+    ollama_online = chat_client.health()["online"]
+    if ollama_online:
         st.caption("🟢 Ollama запущен локально")
-    except Exception:
-        ollama_online = False
+    elif ollama_online is None:
+        st.caption("⏳ Проверяем Ollama…")
+    else:
         st.caption("🔴 Ollama недоступен. Запустите `ollama serve`.")
 
     model_name = st.selectbox("Модель ИИ", ["llama3", "phi3"], index=0, key="assistant_model")
@@ -530,6 +570,15 @@ with right:
             {"role":"assistant","text":"Здравствуйте. Готов помочь по пациентам и исследованиям."}
         ]
 
+    # ответ, который печатался в прошлой перерисовке и был прерван (новое сообщение
+    # или любое действие в панели): останавливаем генерацию, сохраняем написанное
+    pending = st.session_state.pop("chat_pending", None)
+    if pending is not None:
+        st.session_state["chat_cancel"].set()
+        pending["text"] = (pending["text"].strip() + " …") if pending["text"].strip() else ""
+        pending["text"] += "(ответ прерван)"
+        st.session_state["chat_global"].append(pending)
+
     st.markdown('<div class="assistant">', unsafe_allow_html=True)
     st.markdown('<div class="chat-box">', unsafe_allow_html=True)
 
@@ -538,6 +587,11 @@ with right:
         css = "chat-ai" if msg["role"] == "assistant" else "chat-user"
         who = "Ассистент" if msg["role"] == "assistant" else "Врач"
         st.markdown(f'<div class="chat-msg {css}"><div class="chat-label">{who}</div>{msg["text"]}</div>', unsafe_allow_html=True)
+        if msg.get("ttft_ms") is not None:
+            st.caption(f"первый токен {msg['ttft_ms'] / 1000:.1f} с · весь ответ {msg['total_ms'] / 1000:.1f} с")
+
+    # сюда печатается ответ по мере генерации
+    stream_slot = st.container()
 
     st.markdown('</div>', unsafe_allow_html=True)
 
@@ -549,29 +603,39 @@ with right:
     if send and q:
         st.session_state["chat_global"].append({"role":"user","text":q})
 
-        # контекст пациентов
-        pts = list_patients()
-        if pts:
-            ctx = "Текущие пациенты:\n" + "\n".join(
-                f"- {p['name']}: {p['modality']} → {p['label']} (риск {p['risk']}, {p['probability']}%)"
-                for p in pts
-            )
-        else:
-            ctx = "Пациентов в базе нет."
-
-        if not ollama_online:
+        if ollama_online is False:
+            chat_client.recheck()
             st.session_state["chat_global"].append(
                 {"role":"assistant","text":"⚠️ Локальная модель Ollama не запущена."}
             )
         else:
+            # контекст пациентов: сводка + важные для вопроса, в пределах бюджета токенов
+            ctx = chat_context.build_context(q, open_pid=st.session_state.get("card_pid"))
             prompt = f"""Вы — медицинский ассистент.
 Используйте данные ниже, отвечайте кратко, по-русски, без домыслов.
 
 {ctx}
 
 Вопрос: {q}"""
-            ans = local_ai_chat(prompt, model=model_name)
-            st.session_state["chat_global"].append({"role":"assistant","text": ans or "Ответ не получен."})
+            cancel = threading.Event()
+            pending = {"role":"assistant","text":""}
+            st.session_state["chat_cancel"] = cancel
+            st.session_state["chat_pending"] = pending
+            stats = {}
+
+            def tokens():
+                for chunk in stream_chat(prompt, model=model_name, cancel=cancel, stats=stats):
+                    pending["text"] += chunk
+                    yield chunk
+
+            with stream_slot:
+                st.markdown('<div class="chat-label">Ассистент</div>', unsafe_allow_html=True)
+                st.write_stream(tokens())
+            st.session_state.pop("chat_pending", None)
+            st.session_state["chat_global"].append({
+                "role":"assistant", "text": pending["text"].strip() or "Ответ не получен.",
+                "ttft_ms": stats.get("ttft_ms"), "total_ms": stats.get("total_ms"),
+            })
 
         st.rerun()
 
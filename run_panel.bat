@@ -1,4 +1,5 @@
 @echo off
 cd /d "%~dp0"
+start "inference" python -m app.inference_server
 streamlit run frontend/doctor_panel.py
 pause
\ No newline at end of file
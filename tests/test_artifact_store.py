@@ -0,0 +1,38 @@
+import os
+
+from app import artifact_store, db
+
+
+def _use_db(monkeypatch, path):
+    monkeypatch.setattr(db, "pool", db.ConnectionPool(str(path)))
+    db.init_db()
+
+
+def _touch(path, age_s=7200):
+    with open(path, "wb") as f:
+        f.write(b"x")
+    old = os.path.getmtime(path) - age_s
+    os.utime(path, (old, old))
+
+
+def test_stored_name_accepts_both_separators():
+    assert artifact_store.stored_name("storage\\1a88a16b_orig.png") == "1a88a16b_orig.png"
+    assert artifact_store.stored_name("/srv/storage/1a88a16b_orig.png") == "1a88a16b_orig.png"
+    assert artifact_store.stored_name("1a88a16b_orig.png") == "1a88a16b_orig.png"
+
+
+def test_sweep_keeps_files_referenced_by_windows_paths(tmp_path, monkeypatch):
+    _use_db(monkeypatch, tmp_path / "patients.db")
+    storage = tmp_path / "storage"
+    storage.mkdir()
+    for name in ("1a88a16b_orig.png", "1a88a16b_heatmap.png", "deadbeef_orig.png"):
+        _touch(storage / name)
+    # так пути пишет панель под Windows (как в поставляемой patients.db)
+    db.insert_or_update_patient("Иванов Иван", {"modality": "ECG", "label": "Normal", "probability": 90.0},
+                                "storage\\1a88a16b_orig.png", "storage\\1a88a16b_heatmap.png")
+
+    assert artifact_store.stats(str(storage))["orphans"] == 1
+    removed, _ = artifact_store.sweep(str(storage), grace=0)
+
+    assert removed == 1
+    assert sorted(os.listdir(storage)) == ["1a88a16b_heatmap.png", "1a88a16b_orig.png"]
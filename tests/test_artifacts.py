@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from app import artifacts
+
+
+def test_cam_round_trip_keeps_shape_and_values():
+    cam = np.random.default_rng(0).random((7, 10), dtype=np.float32)
+    data = artifacts.pack_cam(cam)
+
+    assert artifacts.image_suffix(data) == ".cam"
+    assert len(data) == 8 + 7 * 10 * 2
+    restored = artifacts.unpack_cam(data)
+    assert restored.shape == (7, 10)
+    assert restored.dtype == np.float32
+    # float16: ~3 значащих цифры, для карты 0..1 хватает с запасом
+    assert np.abs(restored - cam).max() < 1e-3
+
+
+def test_unpack_rejects_rendered_overlay():
+    with pytest.raises(ValueError):
+        artifacts.unpack_cam(b"\x89PNG\r\n\x1a\n" + b"\x00" * 16)
@@ -0,0 +1,49 @@
+import re
+
+from app import chat_context, db
+
+
+def _use_db(monkeypatch, path):
+    monkeypatch.setattr(db, "pool", db.ConnectionPool(str(path)))
+    db.init_db()
+    # кэш по (revision, дата): у новой базы revision снова с 1
+    chat_context._general.cache_clear()
+    chat_context._compile.cache_clear()
+
+
+def _fill(n):
+    db.insert_or_update_patient("Ёлкина Анна", {"modality": "MRI", "label": "notumor", "probability": 95.0},
+                                "storage/elkina_orig.png", None)
+    for i in range(n):
+        label = ("Critical", "Arrhythmia", "Normal")[i % 3]
+        db.insert_or_update_patient(f"Пациентов {i:02d}", {"modality": "ECG", "label": label, "probability": 50.0 + i / 2},
+                                    f"storage/{i:02d}_orig.png", None)
+
+
+def _listed(context):
+    return re.findall(r"^- #(\d+) ", context, re.M)
+
+
+def test_context_trimmed_to_budget(tmp_path, monkeypatch):
+    _use_db(monkeypatch, tmp_path / "patients.db")
+    _fill(60)
+
+    small = chat_context.build_context("Сколько пациентов?", budget=300)
+    large = chat_context.build_context("Сколько пациентов?", budget=3000)
+
+    assert "Всего пациентов: 61" in small
+    assert 0 < len(_listed(small)) < len(_listed(large))
+    assert f"Остальные {61 - len(_listed(small))} пациентов не перечислены" in small
+    # сверх бюджета — только заголовки разделов и строка «Остальные»
+    assert chat_context.estimate_tokens(small) < 300 + 50
+
+
+def test_mentioned_patient_listed_first(tmp_path, monkeypatch):
+    _use_db(monkeypatch, tmp_path / "patients.db")
+    _fill(60)
+
+    assert "Ёлкина" not in chat_context.build_context("Сколько пациентов?", budget=300)
+    context = chat_context.build_context("Что с Ёлкиной Анной?", budget=300)
+
+    # низкий риск и старая запись, но упомянута по ФИО
+    assert "Упомянутые в вопросе:\n- #1 Ёлкина Анна" in context
@@ -0,0 +1,128 @@
+import sqlite3
+
+import pytest
+
+from app import db
+
+
+def _use_db(monkeypatch, path):
+    monkeypatch.setattr(db, "pool", db.ConnectionPool(str(path)))
+    db.init_db()
+
+
+def _add(name, risk="low", probability=50.0):
+    label = {"high": "Critical", "medium": "Arrhythmia", "low": "Normal"}[risk]
+    return db.insert_or_update_patient(name, {"modality": "ECG", "label": label, "probability": probability},
+                                       f"storage/{name}_orig.png", None)
+
+
+def test_pool_reuses_wal_connection(tmp_path, monkeypatch):
+    _use_db(monkeypatch, tmp_path / "patients.db")
+
+    with db.connection() as first:
+        assert first.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    with db.connection() as second:
+        assert second is first
+
+
+def test_failed_transaction_rolls_back(tmp_path, monkeypatch):
+    _use_db(monkeypatch, tmp_path / "patients.db")
+
+    with pytest.raises(RuntimeError):
+        with db.transaction() as conn:
+            conn.execute("INSERT INTO patients (name) VALUES ('Иванов Иван')")
+            raise RuntimeError
+    # соединение вернулось в пул без открытой транзакции
+    with db.connection() as conn:
+        assert not conn.in_transaction
+        assert conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0] == 0
+
+
+def test_queue_sorted_by_risk_then_probability(tmp_path, monkeypatch):
+    _use_db(monkeypatch, tmp_path / "patients.db")
+    _add("Петров Пётр", "low", 99.0)
+    _add("Сидоров Сидор", "high", 70.0)
+    _add("Иванов Иван", "high", 90.0)
+    _add("Козлов Кирилл", "medium", 80.0)
+
+    assert [p["name"] for p in db.query_patients()] == \
+        ["Иванов Иван", "Сидоров Сидор", "Козлов Кирилл", "Петров Пётр"]
+    assert [p["name"] for p in db.query_patients(risk=["high"], sort="name")] == ["Иванов Иван", "Сидоров Сидор"]
+    assert db.count_patients(risk=["medium", "low"]) == 2
+
+
+@pytest.mark.skipif(not db.FTS5, reason="без FTS5 поиск только по началу ФИО")
+def test_name_search_matches_word_prefixes_and_yo(tmp_path, monkeypatch):
+    _use_db(monkeypatch, tmp_path / "patients.db")
+    _add("Ёлкин Пётр")
+    _add("Петров Иван")
+    _add("Иванов Пётр")
+
+    assert [p["name"] for p in db.query_patients(name="елк", sort="name")] == ["Ёлкин Пётр"]
+    # префикс любого слова ФИО, ё и е не различаются
+    assert [p["name"] for p in db.query_patients(name="петр", sort="name")] == \
+        ["Ёлкин Пётр", "Иванов Пётр", "Петров Иван"]
+    assert db.count_patients(name="  ИВАН  петр ") == 2
+
+
+def test_keyset_pages_match_offset_pages(tmp_path, monkeypatch):
+    _use_db(monkeypatch, tmp_path / "patients.db")
+    for i in range(7):
+        _add(f"Пациент {i}", ("high", "medium", "low")[i % 3], 50.0)   # равные вероятности — порядок решает id
+
+    for sort in db.QUEUE_ORDER:
+        pages, after = [], None
+        while True:
+            page = db.query_patients(sort=sort, limit=3, after=after)
+            if not page:
+                break
+            pages.append([p["id"] for p in page])
+            after = db.queue_cursor(page[-1], sort)
+        by_offset = [[p["id"] for p in db.query_patients(sort=sort, limit=3, offset=o)] for o in (0, 3, 6)]
+        assert pages == by_offset
+
+
+def test_counters_follow_upserts_and_reset_on_clear(tmp_path, monkeypatch):
+    _use_db(monkeypatch, tmp_path / "patients.db")
+    _add("Иванов Иван", "high")
+    _add("Петров Пётр", "low")
+    _add("Иванов Иван", "medium")   # повторный снимок: пациент тот же, риск снят
+
+    assert db.dashboard_stats() == {"patients": 2, "high_risk": 0, "recent": 3}
+    revision = db.data_revision()
+
+    assert db.clear_patients() == 2
+    assert db.dashboard_stats() == {"patients": 0, "high_risk": 0, "recent": 0}
+    # кэши, взятые до очистки, устаревают
+    assert db.data_revision() > revision
+
+
+def test_legacy_database_migrated_once(tmp_path, monkeypatch):
+    path = tmp_path / "patients.db"
+    # база до schema_version: старые колонки, history без части полей
+    legacy = sqlite3.connect(str(path))
+    legacy.executescript("""
+        CREATE TABLE patients (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, modality TEXT,
+            label TEXT, diagnosis TEXT, probability REAL, risk TEXT, created_at TEXT,
+            image_path TEXT, heatmap_path TEXT);
+        CREATE TABLE history (id INTEGER PRIMARY KEY AUTOINCREMENT, patient_id INTEGER, timestamp TEXT,
+            label TEXT, probability REAL, risk TEXT);
+        INSERT INTO patients (name, modality, probability, risk) VALUES ('Ёлкин Пётр', 'MRI', 80.0, 'high');
+        INSERT INTO history (patient_id, timestamp, risk) VALUES (1, '2024-01-02T10:00:00', 'high');
+    """)
+    legacy.close()
+    _use_db(monkeypatch, path)
+
+    with db.connection() as conn:
+        assert db.schema_version(conn) == db.SCHEMA_VERSION
+        assert [r[0] for r in conn.execute("SELECT version FROM schema_version")] == \
+            [v for v, _, _ in db.MIGRATIONS]
+        assert conn.execute("SELECT modality FROM history").fetchone()[0] == "Unknown"
+    patient = db.query_patients(name="елкин")[0]
+    assert (patient["risk_rank"], patient["name_norm"]) == (2, "елкин петр")
+    assert db.dashboard_stats()["high_risk"] == 1
+    assert db.data_revision() == 1
+
+    # повторный вызов в том же процессе схему не трогает
+    monkeypatch.setattr(db, "MIGRATIONS", None)
+    db.init_db()
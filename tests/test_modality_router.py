@@ -0,0 +1,27 @@
+import os
+
+from PIL import Image
+
+from app.modality_router import MIN_CONFIDENCE, route_modality
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _route(*parts):
+    with Image.open(os.path.join(ROOT, *parts)) as img:
+        return route_modality(img.convert("RGB"))
+
+
+def test_held_out_xray_routed_without_vote():
+    # снимка нет в images/, по которым считались прототипы
+    modality, confidence, _ = _route("tests", "data", "flg_holdout.png")
+
+    assert modality == "xray"
+    assert confidence >= MIN_CONFIDENCE
+
+
+def test_out_of_distribution_falls_back_to_vote():
+    # МРТ крупным планом: по средним тонам ближе к ФЛГ, чем к МРТ
+    _, confidence, _ = _route("images", "mri", "meningioma", "Te-me_0012.jpg")
+
+    assert confidence < MIN_CONFIDENCE
@@ -0,0 +1,48 @@
+import itertools
+import os
+import types
+
+import pytest
+
+pytest.importorskip("torch")   # result_cache -> preprocess
+
+from app import artifacts, result_cache  # noqa: E402
+
+
+def _cache(tmp_path, monkeypatch, **limits):
+    # часы по шагам: last_access различается и при записи в ту же миллисекунду
+    ticks = itertools.count(1)
+    monkeypatch.setattr(result_cache, "time", types.SimpleNamespace(time=lambda: float(next(ticks))))
+    return result_cache.ResultCache(str(tmp_path / "cache"), **limits)
+
+
+def _put(cache, key, version="v1", heatmap=None):
+    cache.put(key, "ecg", f"summary {key}", {"modality": "ECG", "model_version": version}, heatmap)
+
+
+def test_lru_evicts_least_recently_read(tmp_path, monkeypatch):
+    cache = _cache(tmp_path, monkeypatch, max_entries=2)
+    _put(cache, "a")
+    _put(cache, "b", heatmap=artifacts.pack_cam([[0.0, 1.0]]))
+    assert cache.get("a", lambda m: "v1") is not None   # a читали позже b
+
+    _put(cache, "c")
+
+    assert cache.get("b", lambda m: "v1") is None
+    assert cache.get("a", lambda m: "v1") is not None
+    assert cache.get("c", lambda m: "v1") is not None
+    assert not os.path.exists(tmp_path / "cache" / "b.cam")
+    assert cache.stats()["entries"] == 2
+
+
+def test_entry_of_replaced_model_is_dropped(tmp_path, monkeypatch):
+    cache = _cache(tmp_path, monkeypatch)
+    _put(cache, "a", version="v1")
+
+    summary, payload, heatmap = cache.get("a", lambda m: "v1")
+    assert (summary, payload["model_version"], heatmap) == ("summary a", "v1", None)
+
+    assert cache.get("a", lambda m: "v2") is None
+    # устаревшая запись удалена, а не пропущена
+    assert cache.get("a", lambda m: "v1") is None
+    assert cache.stats()["entries"] == 0